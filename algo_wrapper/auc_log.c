@@ -0,0 +1,76 @@
+#include <stdio.h>
+#include <stdarg.h>
+#include <pthread.h>
+#include "auc_log.h"
+
+Logger auc_logger = {.level = LOG_INFO, .cadence = LOG_RING_SIZE, .callback = NULL, .ctx = NULL};
+
+static _Thread_local LogRing log_ring = {.num_events = 0, .num_delivered = 0};
+
+// guards auc_logger.callback, auc_logger.ctx and the number of callbacks running.
+static pthread_mutex_t log_lock = PTHREAD_MUTEX_INITIALIZER;
+static pthread_cond_t log_idle = PTHREAD_COND_INITIALIZER;
+static int log_num_running = 0;
+
+void log_set_level(int level) {
+    auc_logger.level = level;
+}
+
+void *log_set_callback(ProgressCallback callback, void *ctx, int cadence) {
+    log_flush(); // the events so far go to the previous callback.
+    pthread_mutex_lock(&log_lock);
+    void *prev_ctx = auc_logger.ctx;
+    auc_logger.callback = callback;
+    auc_logger.ctx = ctx;
+    auc_logger.cadence = (cadence <= 0 || cadence > LOG_RING_SIZE) ? LOG_RING_SIZE : cadence;
+    while (log_num_running > 0) { pthread_cond_wait(&log_idle, &log_lock); } // prev_ctx may be in use.
+    pthread_mutex_unlock(&log_lock);
+    log_ring.num_delivered = log_ring.num_events;
+    return prev_ctx;
+}
+
+void log_flush(void) {
+    pthread_mutex_lock(&log_lock);
+    ProgressCallback callback = auc_logger.callback;
+    void *ctx = auc_logger.ctx;
+    if (callback != NULL) { log_num_running++; }
+    pthread_mutex_unlock(&log_lock);
+    if (callback == NULL) {
+        log_ring.num_delivered = log_ring.num_events;
+        return;
+    }
+    long start = log_ring.num_delivered;
+    if (log_ring.num_events - start > LOG_RING_SIZE) { // the older ones are overwritten.
+        start = log_ring.num_events - LOG_RING_SIZE;
+    }
+    log_ring.num_delivered = log_ring.num_events;
+    while (start < log_ring.num_events) { // at most two contiguous pieces of the ring.
+        int pos = (int) (start % LOG_RING_SIZE);
+        long len = log_ring.num_events - start;
+        if (pos + len > LOG_RING_SIZE) { len = LOG_RING_SIZE - pos; }
+        callback(ctx, log_ring.ring + pos, (int) len);
+        start += len;
+    }
+    pthread_mutex_lock(&log_lock);
+    if (--log_num_running == 0) { pthread_cond_broadcast(&log_idle); }
+    pthread_mutex_unlock(&log_lock);
+}
+
+void _log_message(int level, const char *fmt, ...) {
+    va_list args;
+    va_start(args, fmt);
+    vfprintf(level == LOG_ERROR ? stderr : stdout, fmt, args);
+    va_end(args);
+}
+
+void _log_event(int kind, int iter, double value) {
+    LogEvent *ev = log_ring.ring + (log_ring.num_events % LOG_RING_SIZE);
+    ev->kind = kind;
+    ev->iter = iter;
+    ev->value = value;
+    log_ring.num_events++;
+    // without a callback, the flush only marks the events as delivered.
+    if (log_ring.num_events - log_ring.num_delivered >= auc_logger.cadence) {
+        log_flush();
+    }
+}
@@ -0,0 +1,100 @@
+#ifndef SPARSE_AUC_AUC_LOG_H
+#define SPARSE_AUC_AUC_LOG_H
+
+#include <stdbool.h>
+#include <stdatomic.h>
+
+/**
+ * Logging and progress events of the C engine. Messages have levels and are
+ * only formatted if their level is enabled. Numeric events, e.g., the loss of
+ * a block or the AUC of an evaluation, are written to a ring buffer, which is
+ * handed to the progress callback every `cadence` events and at the end of a
+ * run. Compiling with -DAUC_NO_LOG removes all of them.
+ */
+typedef enum {
+    LOG_ERROR = 0,
+    LOG_WARN = 1,
+    LOG_INFO = 2,       // the default level.
+    LOG_DEBUG = 3
+} LogLevel;
+
+typedef enum {
+    EVENT_LOSS = 0,     // loss of a block, iter is the block.
+    EVENT_DIFF = 1,     // relative change at the end of an epoch, iter is the epoch.
+    EVENT_AUC = 2,      // recorded AUC score, iter is the iteration.
+    EVENT_STOP = 3      // the run stops at epoch iter, value is the StopReason.
+} EventKind;
+
+typedef enum {
+    STOP_EPS = 0,
+    STOP_AUC_PLATEAU = 1,
+    STOP_TIME_BUDGET = 2
+} StopReason;
+
+typedef struct {
+    int kind;
+    int iter;
+    double value;
+} LogEvent;
+
+#define LOG_RING_SIZE 4096
+
+/** It receives events in the order they were recorded. */
+typedef void (*ProgressCallback)(void *ctx, const LogEvent *events, int num_events);
+
+/**
+ * the configuration is shared. level is set before the runs start, callback and
+ * ctx are read and swapped under a lock, only through log_flush and log_set_callback.
+ */
+typedef struct {
+    int level;
+    atomic_int cadence;     // at most LOG_RING_SIZE.
+    ProgressCallback callback;
+    void *ctx;
+} Logger;
+
+/** every thread records its events into its own ring, so concurrent runs do not interleave. */
+typedef struct {
+    LogEvent ring[LOG_RING_SIZE];
+    long num_events;        // events recorded so far.
+    long num_delivered;     // events handed to the callback so far.
+} LogRing;
+
+extern Logger auc_logger;
+
+void log_set_level(int level);
+
+/**
+ * The events of this thread so far go to the previous callback. It returns once
+ * the previous callback is not running on any thread, so it must not be called
+ * from a callback.
+ * @param callback NULL to remove the callback.
+ * @param ctx passed to the callback as it is.
+ * @param cadence the callback is invoked every cadence events.
+ * @return the ctx of the previous callback, which is not used anymore.
+ */
+void *log_set_callback(ProgressCallback callback, void *ctx, int cadence);
+
+/** hand the events of this thread not delivered yet to the callback, if there is one. */
+void log_flush(void);
+
+void _log_message(int level, const char *fmt, ...);
+
+void _log_event(int kind, int iter, double value);
+
+#ifdef AUC_NO_LOG
+#define log_enabled(lv) false
+#define log_msg(lv, ...) ((void) 0)
+#define log_event(kind, iter, value) ((void) 0)
+#else
+#define log_enabled(lv) ((lv) <= auc_logger.level)
+#define log_msg(lv, ...) do { if (log_enabled(lv)) { _log_message(lv, __VA_ARGS__); } } while (0)
+#define log_event(kind, iter, value) _log_event(kind, iter, value)
+#endif
+
+#define log_error(...) log_msg(LOG_ERROR, __VA_ARGS__)
+#define log_warn(...) log_msg(LOG_WARN, __VA_ARGS__)
+#define log_info(...) log_msg(LOG_INFO, __VA_ARGS__)
+#define log_debug(...) log_msg(LOG_DEBUG, __VA_ARGS__)
+
+#endif //SPARSE_AUC_AUC_LOG_H
@@ -1,3 +1,7 @@
+// erand48, nrand48 and lrand48 are POSIX, they are not declared under -std=c11 without it.
+#define _XOPEN_SOURCE 700
+
+#include <pthread.h>
 #include "auc_opt_methods.h"
 
 /**
@@ -6,18 +10,31 @@
  * Then the two random variables X and Y.
  * @param n
  * @param samples
+ * @param xsubi the state of the random generator of the run.
  */
-void std_normal(int n, double *samples) {
+void std_normal(int n, double *samples, unsigned short *xsubi) {
     double epsilon = 2.22507e-308, x, y;
     for (int i = 0; i < n; i++) {
         do {
-            x = rand() / (RAND_MAX * 1.);
-            y = rand() / (RAND_MAX * 1.);
+            x = erand48(xsubi);
+            y = erand48(xsubi);
         } while (x <= epsilon);
         samples[i] = sqrt(-2.0 * log(x)) * cos(2.0 * PI * y);
     }
 }
 
+/**
+ * Every run has its own generator state, so that concurrent runs neither race
+ * on nor perturb each other's random numbers. A seed s gives the state of
+ * srand48(s), so the first draw is the first lrand48() after srand48(s).
+ */
+static void _rng_init(unsigned short *xsubi, const GlobalParas *paras) {
+    long seed = paras->seed > 0 ? paras->seed : lrand48();
+    xsubi[0] = 0x330E;
+    xsubi[1] = (unsigned short) (seed & 0xFFFF);
+    xsubi[2] = (unsigned short) ((seed >> 16) & 0xFFFF);
+}
+
 static inline int __comp_descend(const void *a, const void *b) {
     if (((data_pair *) a)->val < ((data_pair *) b)->val) {
         return 1;
@@ -46,14 +63,25 @@ AlgoResults *make_algo_results(int data_p, int total_num_eval) {
     re->aucs = calloc((size_t) total_num_eval, sizeof(double));
     re->rts = calloc((size_t) total_num_eval, sizeof(double));
     re->auc_len = 0;
+    re->auc_cap = total_num_eval;
     re->total_epochs = 0;
     re->total_iterations = 0;
     return re;
 }
 
+int num_auc_evals(const GlobalParas *paras, int num_iters, int step) {
+    if (paras->eval_growth <= 1.0) { return num_iters / step + 1; }
+    int num_evals = 1;
+    for (double next_eval = 1.0; next_eval <= num_iters; num_evals++) { // the schedule of _eval_due.
+        next_eval = fmax(next_eval * paras->eval_growth, next_eval + step);
+    }
+    return num_evals;
+}
+
 bool free_algo_results(AlgoResults *re) {
     free(re->rts);
     free(re->aucs);
+    free(re->wt_prev);
     free(re->wt);
     free(re);
     return true;
@@ -85,6 +113,396 @@ bool free_graph_stat(GraphStat *graph_stat) {
     return true;
 }
 
+LazyProx *make_lazy_prox(int p, const double *posi_x, const double *nega_x) {
+    LazyProx *lazy = malloc(sizeof(LazyProx));
+    lazy->tau = calloc((size_t) p, sizeof(double));
+    lazy->sgn = calloc((size_t) p, sizeof(double));
+    lazy->heap = malloc(sizeof(int) * p);
+    lazy->heap_pos = malloc(sizeof(int) * p);
+    lazy->posi_x = posi_x;
+    lazy->nega_x = nega_x;
+    lazy->p = p;
+    return lazy;
+}
+
+bool free_lazy_prox(LazyProx *lazy) {
+    free(lazy->heap_pos);
+    free(lazy->heap);
+    free(lazy->sgn);
+    free(lazy->tau);
+    free(lazy);
+    return true;
+}
+
+ScaledVector *make_scaled_vector(int p, double *buffer) {
+    ScaledVector *sv = malloc(sizeof(ScaledVector));
+    sv->own_u = (buffer == NULL);
+    sv->u = sv->own_u ? calloc((size_t) p, sizeof(double)) : buffer;
+    sv->scale = 1.0;
+    sv->sq_norm = cblas_ddot(p, sv->u, 1, sv->u, 1);
+    sv->p = p;
+    return sv;
+}
+
+bool free_scaled_vector(ScaledVector *sv) {
+    if (sv->own_u) { free(sv->u); }
+    free(sv);
+    return true;
+}
+
+LazyAverage *make_lazy_average(int p) {
+    LazyAverage *avg = malloc(sizeof(LazyAverage));
+    avg->acc = calloc((size_t) p, sizeof(double));
+    avg->last = calloc((size_t) p, sizeof(double));
+    avg->cum_wei = 0.0;
+    avg->cum_gamma = 0.0;
+    avg->p = p;
+    return avg;
+}
+
+bool free_lazy_average(LazyAverage *avg) {
+    free(avg->last);
+    free(avg->acc);
+    free(avg);
+    return true;
+}
+
+ScaledMatrix *make_scaled_matrix(int p, int num_models) {
+    ScaledMatrix *sm = malloc(sizeof(ScaledMatrix));
+    sm->u = calloc((size_t) p * num_models, sizeof(double));
+    sm->scale = malloc(sizeof(double) * num_models);
+    sm->sq_norm = calloc((size_t) num_models, sizeof(double));
+    sm->wei = malloc(sizeof(double) * num_models);
+    for (int k = 0; k < num_models; k++) {
+        sm->scale[k] = 1.0;
+    }
+    sm->p = p;
+    sm->num_models = num_models;
+    return sm;
+}
+
+bool free_scaled_matrix(ScaledMatrix *sm) {
+    free(sm->wei);
+    free(sm->sq_norm);
+    free(sm->scale);
+    free(sm->u);
+    free(sm);
+    return true;
+}
+
+LazyAverages *make_lazy_averages(int p, int num_models) {
+    LazyAverages *avg = malloc(sizeof(LazyAverages));
+    avg->acc = calloc((size_t) p * num_models, sizeof(double));
+    avg->last = calloc((size_t) p * num_models, sizeof(double));
+    avg->cum_wei = calloc((size_t) num_models, sizeof(double));
+    avg->cum_gamma = calloc((size_t) num_models, sizeof(double));
+    avg->p = p;
+    avg->num_models = num_models;
+    return avg;
+}
+
+bool free_lazy_averages(LazyAverages *avg) {
+    free(avg->cum_gamma);
+    free(avg->cum_wei);
+    free(avg->last);
+    free(avg->acc);
+    free(avg);
+    return true;
+}
+
+SparseAccum *make_sparse_accum(int p) {
+    SparseAccum *sa = malloc(sizeof(SparseAccum));
+    sa->vals = calloc((size_t) p, sizeof(double));
+    sa->touched = malloc(sizeof(int) * p);
+    sa->is_touched = calloc((size_t) p, sizeof(bool));
+    sa->num_touched = 0;
+    sa->p = p;
+    return sa;
+}
+
+bool free_sparse_accum(SparseAccum *sa) {
+    free(sa->is_touched);
+    free(sa->touched);
+    free(sa->vals);
+    free(sa);
+    return true;
+}
+
+/** vals_j = vals_j + val */
+static inline void _sa_add(SparseAccum *sa, int j, double val) {
+    if (!sa->is_touched[j]) {
+        sa->is_touched[j] = true;
+        sa->touched[sa->num_touched++] = j;
+    }
+    sa->vals[j] += val;
+}
+
+/** reset the touched coordinates to zero, O(num_touched). */
+static void _sa_clear(SparseAccum *sa) {
+    for (int kk = 0; kk < sa->num_touched; kk++) {
+        sa->vals[sa->touched[kk]] = 0.0;
+        sa->is_touched[sa->touched[kk]] = false;
+    }
+    sa->num_touched = 0;
+}
+
+/** fold the scale factor back into u when u is only nonzero on supp, O(|supp|). */
+static void _sv_renorm_support(ScaledVector *sv, const int *supp, int supp_size) {
+    double sq_norm = 0.0;
+    for (int kk = 0; kk < supp_size; kk++) {
+        sv->u[supp[kk]] *= sv->scale;
+        sq_norm += sv->u[supp[kk]] * sv->u[supp[kk]];
+    }
+    sv->scale = 1.0;
+    sv->sq_norm = sq_norm;
+}
+
+/** fold the scale factor back into u, O(p). */
+static void _sv_renorm(ScaledVector *sv) {
+    if (sv->scale != 1.0) {
+        cblas_dscal(sv->p, sv->scale, sv->u, 1);
+        sv->scale = 1.0;
+    }
+    sv->sq_norm = cblas_ddot(sv->p, sv->u, 1, sv->u, 1);
+}
+
+static inline double _sv_get(const ScaledVector *sv, int j) {
+    return sv->scale * sv->u[j];
+}
+
+/** w_j = w_j + delta */
+static inline void _sv_add(ScaledVector *sv, int j, double delta) {
+    double old_u = sv->u[j];
+    sv->u[j] += delta / sv->scale;
+    sv->sq_norm += sv->u[j] * sv->u[j] - old_u * old_u;
+}
+
+/** w = w + alpha * x for a dense x, the norm is recomputed in the same pass. */
+static void _sv_axpy(ScaledVector *sv, double alpha, const double *x) {
+    double wei = alpha / sv->scale, sq_norm = 0.0;
+    for (int j = 0; j < sv->p; j++) {
+        sv->u[j] += wei * x[j];
+        sq_norm += sv->u[j] * sv->u[j];
+    }
+    sv->sq_norm = sq_norm;
+}
+
+static inline double _sv_dot_sparse(const ScaledVector *sv, const int *x_inds, const double *x_vals, int x_len) {
+    double dot = 0.0;
+    for (int tt = 0; tt < x_len; tt++) {
+        dot += sv->u[x_inds[tt]] * x_vals[tt];
+    }
+    return sv->scale * dot;
+}
+
+static inline double _sv_dot(const ScaledVector *sv, const double *x) {
+    return sv->scale * cblas_ddot(sv->p, sv->u, 1, x, 1);
+}
+
+/** true if w = c * w would fold the scale back into u. */
+static inline bool _sv_scale_renorms(const ScaledVector *sv, double c) {
+    return fabs(sv->scale * c) < 1e-100 || fabs(sv->scale * c) > 1e100;
+}
+
+/** w = c * w, O(1) */
+static inline void _sv_scale(ScaledVector *sv, double c) {
+    bool renorm = _sv_scale_renorms(sv, c);
+    sv->scale *= c;
+    if (renorm) { _sv_renorm(sv); }
+}
+
+/** the factor which projects w onto the ell_2 ball with radius r, 1 if w is inside. */
+static inline double _sv_l2_ball_factor(const ScaledVector *sv, double r) {
+    double norm_w = fabs(sv->scale) * sqrt(fmax(sv->sq_norm, 0.0));
+    return (norm_w > r) ? r / norm_w : 1.0;
+}
+
+/** project w onto the ell_2 ball with radius r, O(1) */
+static inline void _sv_proj_l2_ball(ScaledVector *sv, double r) {
+    double factor = _sv_l2_ball_factor(sv, r);
+    if (factor < 1.0) { _sv_scale(sv, factor); }
+}
+
+/** start step t: the current iterate sv gets the weight gamma_t, O(1). */
+static inline void _lazy_avg_step(LazyAverage *avg, const ScaledVector *sv, double gamma) {
+    avg->cum_wei += gamma * sv->scale;
+    avg->cum_gamma += gamma;
+}
+
+/** bring coordinate j up to date, call it before u_j changes. */
+static inline void _lazy_avg_touch(LazyAverage *avg, const ScaledVector *sv, int j) {
+    avg->acc[j] += sv->u[j] * (avg->cum_wei - avg->last[j]);
+    avg->last[j] = avg->cum_wei;
+}
+
+/** bring all coordinates up to date and restart cum_wei from 0, call it before u is renormalized, O(p). */
+static void _lazy_avg_sync(LazyAverage *avg, const ScaledVector *sv) {
+    for (int j = 0; j < avg->p; j++) {
+        avg->acc[j] += sv->u[j] * (avg->cum_wei - avg->last[j]);
+        avg->last[j] = 0.0;
+    }
+    avg->cum_wei = 0.0;
+}
+
+/**
+ * w = c * w for the iterate of avg. The rounding error of the average grows as
+ * cum_wei / (gamma * scale), so the scale is folded back into u, after a sync,
+ * once it falls below 1e-4. O(1) amortized.
+ */
+static inline void _lazy_avg_scale(LazyAverage *avg, ScaledVector *sv, double c) {
+    if (fabs(sv->scale * c) < 1e-4 || _sv_scale_renorms(sv, c)) {
+        _lazy_avg_sync(avg, sv);
+        sv->scale *= c;
+        _sv_renorm(sv);
+    } else {
+        sv->scale *= c;
+    }
+}
+
+/** write the exact average into w_bar, O(p). */
+static void _lazy_avg_to_dense(const LazyAverage *avg, const ScaledVector *sv, double *w_bar) {
+    for (int j = 0; j < avg->p; j++) {
+        w_bar[j] = (avg->acc[j] + sv->u[j] * (avg->cum_wei - avg->last[j])) / avg->cum_gamma;
+    }
+}
+
+/** fold scale[k] back into column k, O(p). */
+static void _sm_renorm(ScaledMatrix *sm, int k) {
+    double sq_norm = 0.0;
+    for (int j = 0; j < sm->p; j++) {
+        double *u_jk = sm->u + (size_t) j * sm->num_models + k;
+        *u_jk *= sm->scale[k];
+        sq_norm += *u_jk * *u_jk;
+    }
+    sm->scale[k] = 1.0;
+    sm->sq_norm[k] = sq_norm;
+}
+
+/** true if w_k = c * w_k would fold the scale back into u. */
+static inline bool _sm_scale_renorms(const ScaledMatrix *sm, int k, double c) {
+    return fabs(sm->scale[k] * c) < 1e-100 || fabs(sm->scale[k] * c) > 1e100;
+}
+
+/** w_k = c * w_k, O(1) */
+static inline void _sm_scale(ScaledMatrix *sm, int k, double c) {
+    bool renorm = _sm_scale_renorms(sm, k, c);
+    sm->scale[k] *= c;
+    if (renorm) { _sm_renorm(sm, k); }
+}
+
+/** the factor which projects w_k onto the ell_2 ball with radius r, 1 if w_k is inside. */
+static inline double _sm_l2_ball_factor(const ScaledMatrix *sm, int k, double r) {
+    double norm_w = fabs(sm->scale[k]) * sqrt(fmax(sm->sq_norm[k], 0.0));
+    return (norm_w > r) ? r / norm_w : 1.0;
+}
+
+/** write w_k into w, O(p). */
+static void _sm_get(const ScaledMatrix *sm, int k, double *w) {
+    for (int j = 0; j < sm->p; j++) {
+        w[j] = sm->scale[k] * sm->u[(size_t) j * sm->num_models + k];
+    }
+}
+
+/** dots[k] = <w_k, x> for the training sample in row row of the data. */
+static void _sm_dots(const ScaledMatrix *sm, const Data *data, int row, double *dots) {
+    int num_models = sm->num_models;
+    if (data->is_sparse) {
+        const int *xt_inds = data->x_tr_inds + data->x_tr_poss[row];
+        const double *xt_vals = data->x_tr_vals + data->x_tr_poss[row];
+        memset(dots, 0, sizeof(double) * num_models);
+        for (int tt = 0; tt < data->x_tr_lens[row]; tt++) {
+            cblas_daxpy(num_models, xt_vals[tt], sm->u + (size_t) xt_inds[tt] * num_models, 1, dots, 1);
+        }
+    } else {
+        cblas_dgemv(CblasRowMajor, CblasTrans, sm->p, num_models, 1., sm->u, num_models,
+                    data->x_tr_vals + (size_t) row * sm->p, 1, 0.0, dots, 1);
+    }
+    for (int k = 0; k < num_models; k++) {
+        dots[k] *= sm->scale[k];
+    }
+}
+
+/**
+ * w_k = w_k + coef[k] * x for the training sample x in row row of the data.
+ * dots are <w_k, x> before the update, which give the new norms in O(K).
+ */
+static void _sm_add_outer(ScaledMatrix *sm, const Data *data, int row, const double *dots, const double *coef) {
+    int num_models = sm->num_models;
+    double sq_x = 0.0;
+    for (int k = 0; k < num_models; k++) {
+        sm->wei[k] = coef[k] / sm->scale[k];
+    }
+    if (data->is_sparse) {
+        const int *xt_inds = data->x_tr_inds + data->x_tr_poss[row];
+        const double *xt_vals = data->x_tr_vals + data->x_tr_poss[row];
+        for (int tt = 0; tt < data->x_tr_lens[row]; tt++) {
+            cblas_daxpy(num_models, xt_vals[tt], sm->wei, 1, sm->u + (size_t) xt_inds[tt] * num_models, 1);
+            sq_x += xt_vals[tt] * xt_vals[tt];
+        }
+    } else {
+        const double *xt = data->x_tr_vals + (size_t) row * sm->p;
+        cblas_dger(CblasRowMajor, sm->p, num_models, 1., xt, 1, sm->wei, 1, sm->u, num_models);
+        sq_x = cblas_ddot(sm->p, xt, 1, xt, 1);
+    }
+    // ||u + d * x||^2 = ||u||^2 + 2 * d * <u, x> + d^2 * ||x||^2
+    for (int k = 0; k < num_models; k++) {
+        double wei = sm->wei[k];
+        sm->sq_norm[k] += 2. * wei * dots[k] / sm->scale[k] + wei * wei * sq_x;
+    }
+}
+
+/** bring coordinate j of all the averages up to date, call it before row j of u changes. */
+static inline void _lazy_avgs_touch(LazyAverages *avg, const ScaledMatrix *sm, int j) {
+    size_t pos = (size_t) j * avg->num_models;
+    for (int k = 0; k < avg->num_models; k++) {
+        avg->acc[pos + k] += sm->u[pos + k] * (avg->cum_wei[k] - avg->last[pos + k]);
+        avg->last[pos + k] = avg->cum_wei[k];
+    }
+}
+
+/** bring the coordinates of the training sample in row row up to date. */
+static void _lazy_avgs_touch_row(LazyAverages *avg, const ScaledMatrix *sm, const Data *data, int row) {
+    if (data->is_sparse) {
+        const int *xt_inds = data->x_tr_inds + data->x_tr_poss[row];
+        for (int tt = 0; tt < data->x_tr_lens[row]; tt++) {
+            _lazy_avgs_touch(avg, sm, xt_inds[tt]);
+        }
+    } else {
+        for (int j = 0; j < avg->p; j++) {
+            _lazy_avgs_touch(avg, sm, j);
+        }
+    }
+}
+
+/** bring all coordinates of average k up to date and restart cum_wei[k] from 0, O(p). */
+static void _lazy_avgs_sync(LazyAverages *avg, const ScaledMatrix *sm, int k) {
+    for (int j = 0; j < avg->p; j++) {
+        size_t pos = (size_t) j * avg->num_models + k;
+        avg->acc[pos] += sm->u[pos] * (avg->cum_wei[k] - avg->last[pos]);
+        avg->last[pos] = 0.0;
+    }
+    avg->cum_wei[k] = 0.0;
+}
+
+/** w_k = c * w_k for the iterate of average k, see _lazy_avg_scale. */
+static inline void _lazy_avgs_scale(LazyAverages *avg, ScaledMatrix *sm, int k, double c) {
+    if (fabs(sm->scale[k] * c) < 1e-4 || _sm_scale_renorms(sm, k, c)) {
+        _lazy_avgs_sync(avg, sm, k);
+        sm->scale[k] *= c;
+        _sm_renorm(sm, k);
+    } else {
+        sm->scale[k] *= c;
+    }
+}
+
+/** write the exact average k into w_bar, O(p). */
+static void _lazy_avgs_to_dense(const LazyAverages *avg, const ScaledMatrix *sm, int k, double *w_bar) {
+    for (int j = 0; j < avg->p; j++) {
+        size_t pos = (size_t) j * avg->num_models + k;
+        w_bar[j] = (avg->acc[pos] + sm->u[pos] * (avg->cum_wei[k] - avg->last[pos])) / avg->cum_gamma[k];
+    }
+}
+
 
 bool head_tail_binsearch(
         const EdgePair *edges, const double *costs, const double *prizes,
@@ -125,7 +543,7 @@ bool head_tail_binsearch(
     do {
         stat->num_iter += 1;
         lambda_high *= 2.0;
-        if (lambda_high <= 0.0) { printf("lambda_high: %.6e\n", lambda_high); }
+        if (lambda_high <= 0.0) { log_warn("lambda_high: %.6e\n", lambda_high); }
         for (int ii = 0; ii < m; ii++) {
             cur_costs[ii] = lambda_high * costs[ii];
         }
@@ -134,11 +552,11 @@ bool head_tail_binsearch(
         run_pcst(pcst, stat->re_nodes, stat->re_edges);
         free_pcst(pcst);
         cur_k = stat->re_nodes->size;
-        if (verbose >= 1) printf("increase:   l_high: %e  k: %d\n", lambda_high, cur_k);
+        if (verbose >= 1) log_info("increase:   l_high: %e  k: %d\n", lambda_high, cur_k);
     } while (cur_k > sparsity_high && stat->num_iter < max_num_iter);
 
     if (stat->num_iter < max_num_iter && cur_k >= sparsity_low) {
-        if (verbose >= 1) printf("Found good lambda in exponential increase phase, returning.\n");
+        if (verbose >= 1) log_info("Found good lambda in exponential increase phase, returning.\n");
         free(cur_costs);
         free(sorted_prizes);
         free(sorted_indices);
@@ -148,7 +566,7 @@ bool head_tail_binsearch(
     while (stat->num_iter < max_num_iter) {
         stat->num_iter += 1;
         lambda_mid = (lambda_low + lambda_high) / 2.0;
-        if (lambda_mid <= 0.0) { printf("lambda_mid: %.6e\n", lambda_mid); }
+        if (lambda_mid <= 0.0) { log_warn("lambda_mid: %.6e\n", lambda_mid); }
         for (int ii = 0; ii < m; ii++) { cur_costs[ii] = lambda_mid * costs[ii]; }
 
         PCST *pcst = make_pcst(edges, prizes, cur_costs, root, target_num_clusters, 1e-10,
@@ -168,7 +586,7 @@ bool head_tail_binsearch(
             lambda_high = lambda_mid;
         }
     }
-    if (lambda_high <= 0.0) { printf("lambda_high: %.6e\n", lambda_high); }
+    if (lambda_high <= 0.0) { log_warn("lambda_high: %.6e\n", lambda_high); }
     for (int ii = 0; ii < m; ++ii) { cur_costs[ii] = lambda_high * costs[ii]; }
     PCST *pcst = make_pcst(edges, prizes, cur_costs, root, target_num_clusters,
                            1e-10, pruning, n, m, verbose);
@@ -223,18 +641,8 @@ void _tpr_fpr_auc(const double *true_labels, const double *scores, int n, double
     free(sorted_indices);
 }
 
-/**
- * Calculate the AUC score.
- * We assume true labels contain only +1,-1
- * We also assume scores are real numbers.
- * @param true_labels
- * @param scores
- * @param len
- * @return AUC score.
- */
-double _auc_score(const double *true_labels, const double *scores, int len) {
-    double *fpr = malloc(sizeof(double) * (len + 1));
-    double *tpr = malloc(sizeof(double) * (len + 1));
+/** _auc_score with a caller-owned buffer pairs of len elements. */
+static double _auc_score_pairs(const double *true_labels, const double *scores, int len, data_pair *pairs) {
     double num_posi = 0.0;
     double num_nega = 0.0;
     for (int i = 0; i < len; i++) {
@@ -243,34 +651,59 @@ double _auc_score(const double *true_labels, const double *scores, int len) {
         } else {
             num_nega++;
         }
+        pairs[i].val = scores[i];
+        pairs[i].index = i;
     }
-    int *sorted_indices = malloc(sizeof(int) * len);
-    _arg_sort_descend(scores, sorted_indices, len);
-    tpr[0] = 0.0; // initial point.
-    fpr[0] = 0.0; // initial point.
-    // accumulate sum
+    qsort(pairs, (size_t) len, sizeof(data_pair), &__comp_descend);
+    // accumulate sum, tp and fp are the counts before the i-th sample.
+    double tp = 0.0, fp = 0.0, auc = 0.0, prev = 0.0;
     for (int i = 0; i < len; i++) {
-        double cur_label = true_labels[sorted_indices[i]];
-        if (cur_label > 0) {
-            fpr[i + 1] = fpr[i];
-            tpr[i + 1] = tpr[i] + 1.0;
-        } else {
-            fpr[i + 1] = fpr[i] + 1.0;
-            tpr[i + 1] = tpr[i];
-        }
+        double tpr = tp * (1. / num_posi), fpr = fp * (1. / num_nega);
+        auc += (tpr * (fpr - prev));
+        prev = fpr;
+        if (true_labels[pairs[i].index] > 0) { tp += 1.0; } else { fp += 1.0; }
     }
-    cblas_dscal(len, 1. / num_posi, tpr, 1);
-    cblas_dscal(len, 1. / num_nega, fpr, 1);
-    // AUC score
-    double auc = 0.0;
-    double prev = 0.0;
+    return auc;
+}
+
+/**
+ * The exact AUC score, i.e., the fraction of (positive, negative) pairs ranked
+ * correctly, a tie counts as half of one. It is the same as roc_auc_score of
+ * scikit-learn. pairs is a buffer of len elements.
+ */
+static double _auc_score_ranks(const double *true_labels, const double *scores, int len, data_pair *pairs) {
+    double num_posi = 0.0, num_nega, sum_ranks = 0.0;
     for (int i = 0; i < len; i++) {
-        auc += (tpr[i] * (fpr[i] - prev));
-        prev = fpr[i];
+        pairs[i].val = scores[i];
+        pairs[i].index = i;
     }
-    free(sorted_indices);
-    free(fpr);
-    free(tpr);
+    qsort(pairs, (size_t) len, sizeof(data_pair), &__comp_descend);
+    for (int i = 0, j; i < len; i = j) {
+        double num_tie_posi = 0.0;
+        for (j = i; j < len && pairs[j].val == pairs[i].val; j++) {
+            num_tie_posi += (true_labels[pairs[j].index] > 0);
+        }
+        // the tied scores at positions i, ..., j - 1 share the mean of their ascending ranks.
+        sum_ranks += num_tie_posi * (len - (i + j - 1) / 2.0);
+        num_posi += num_tie_posi;
+    }
+    num_nega = len - num_posi;
+    return (sum_ranks - num_posi * (num_posi + 1.) / 2.) / (num_posi * num_nega);
+}
+
+/**
+ * Calculate the AUC score.
+ * We assume true labels contain only +1,-1
+ * We also assume scores are real numbers.
+ * @param true_labels
+ * @param scores
+ * @param len
+ * @return AUC score.
+ */
+double _auc_score(const double *true_labels, const double *scores, int len) {
+    data_pair *pairs = malloc(sizeof(data_pair) * len);
+    double auc = _auc_score_pairs(true_labels, scores, len, pairs);
+    free(pairs);
     return auc;
 }
 
@@ -347,6 +780,50 @@ void _floyd_rivest_select(double *array, int l, int r, int k) {
 }
 
 
+HTWorkspace *make_ht_workspace(int p, int k) {
+    HTWorkspace *ws = malloc(sizeof(HTWorkspace));
+    ws->mags = malloc(sizeof(double) * p);
+    ws->supp = malloc(sizeof(int) * k);
+    ws->supp_size = 0;
+    ws->pivot = 0.0;
+    ws->p = p;
+    ws->k = k;
+    return ws;
+}
+
+bool free_ht_workspace(HTWorkspace *ws) {
+    free(ws->supp);
+    free(ws->mags);
+    free(ws);
+    return true;
+}
+
+int _hard_thresholding_ws(HTWorkspace *ws, double *arr) {
+    int num_cand = 0;
+    double kth_largest;
+    for (int i = 0; i < ws->p; i++) {
+        if (fabs(arr[i]) >= ws->pivot) { ws->mags[num_cand++] = fabs(arr[i]); }
+    }
+    if (num_cand < ws->k) { // the pivot is too large, select from all entries.
+        num_cand = ws->p;
+        for (int i = 0; i < ws->p; i++) {
+            ws->mags[i] = fabs(arr[i]);
+        }
+    }
+    _floyd_rivest_select(ws->mags, 0, num_cand - 1, ws->k - 1);
+    kth_largest = ws->mags[ws->k - 1];
+    ws->supp_size = 0;
+    for (int i = 0; i < ws->p; i++) {
+        if (fabs(arr[i]) <= kth_largest) {
+            arr[i] = 0.0;
+        } else {
+            ws->supp[ws->supp_size++] = i;
+        }
+    }
+    ws->pivot = kth_largest;
+    return ws->supp_size;
+}
+
 /**
  * Given the unsorted array, we threshold this array by using Floyd-Rivest algorithm.
  * @param arr the unsorted array.
@@ -355,16 +832,9 @@ void _floyd_rivest_select(double *array, int l, int r, int k) {
  * @return 0, successfully project arr to a k-sparse vector.
  */
 int _hard_thresholding(double *arr, int n, int k) {
-    double *temp_arr = malloc(sizeof(double) * n), kth_largest;
-    for (int i = 0; i < n; i++) {
-        temp_arr[i] = fabs(arr[i]);
-    }
-    _floyd_rivest_select(temp_arr, 0, n - 1, k - 1);
-    kth_largest = temp_arr[k - 1];
-    for (int i = 0; i < n; i++) {
-        if (fabs(arr[i]) <= kth_largest) { arr[i] = 0.0; }
-    }
-    free(temp_arr);
+    HTWorkspace *ws = make_ht_workspace(n, k); // a fresh one selects from all entries.
+    _hard_thresholding_ws(ws, arr);
+    free_ht_workspace(ws);
     return 0;
 }
 
@@ -426,25 +896,54 @@ static void _l1ballproj_condat(double *y, double *x, int length, const double a)
     }
 }
 
-void _get_posi_nega_x(double *posi_x, double *nega_x, double *posi_t, double *nega_t, double *prob_p, Data *data) {
+/** the row of training sample i in the data arrays. */
+static inline int _row(const Data *data, int i) {
+    return data->rows == NULL ? i : data->rows[i];
+}
+
+/**
+ * the logistic loss and gradient of training samples start, ..., start + len - 1,
+ * only over the support of w if supp is not NULL and the data is dense.
+ */
+static void _block_loss_grad(LossWorkspace *ws, const double *w, const Data *data, int start, int len,
+                             const int *supp, int supp_size, double *loss_grad, double eta) {
+    // with a row subset the arrays are read through rows, nothing is copied.
+    const int *rows = data->rows == NULL ? NULL : data->rows + start;
+    int offset = data->rows == NULL ? start : 0;
+    if (data->is_sparse) {
+        logistic_loss_grad_csr_ws(ws, w, data->x_tr_vals, data->x_tr_inds, data->x_tr_poss + offset,
+                                  data->x_tr_lens + offset, data->y_tr + offset, rows, loss_grad, eta, len, data->p);
+    } else if (supp != NULL) {
+        logistic_loss_grad_support_ws(ws, w, supp, supp_size, data->x_tr_vals + (size_t) offset * data->p,
+                                      data->y_tr + offset, rows, loss_grad, eta, len, data->p);
+    } else {
+        logistic_loss_grad_ws(ws, w, data->x_tr_vals + (size_t) offset * data->p, data->y_tr + offset, rows,
+                              loss_grad, eta, len, data->p);
+    }
+}
+
+static void _class_means(double *posi_x, double *nega_x, double *posi_t, double *nega_t, double *prob_p,
+                         const Data *data) {
     if (data->is_sparse) {
         for (int i = 0; i < data->n; i++) {
-            const int *xt_inds = data->x_tr_inds + data->x_tr_poss[i];
-            const double *xt_vals = data->x_tr_vals + data->x_tr_poss[i];
-            if (data->y_tr[i] > 0) {
+            int row = _row(data, i);
+            const int *xt_inds = data->x_tr_inds + data->x_tr_poss[row];
+            const double *xt_vals = data->x_tr_vals + data->x_tr_poss[row];
+            if (data->y_tr[row] > 0) {
                 (*posi_t)++;
-                for (int kk = 0; kk < data->x_tr_lens[i]; kk++)
+                for (int kk = 0; kk < data->x_tr_lens[row]; kk++)
                     posi_x[xt_inds[kk]] += xt_vals[kk];
             } else {
                 (*nega_t)++;
-                for (int kk = 0; kk < data->x_tr_lens[i]; kk++)
+                for (int kk = 0; kk < data->x_tr_lens[row]; kk++)
                     nega_x[xt_inds[kk]] += xt_vals[kk];
             }
         }
     } else {
         for (int i = 0; i < data->n; i++) {
-            const double *xt = (data->x_tr_vals + i * data->p);
-            if (data->y_tr[i] > 0) {
+            int row = _row(data, i);
+            const double *xt = (data->x_tr_vals + (size_t) row * data->p);
+            if (data->y_tr[row] > 0) {
                 (*posi_t)++;
                 cblas_daxpy(data->p, 1., xt, 1, posi_x, 1);
             } else {
@@ -458,135 +957,571 @@ void _get_posi_nega_x(double *posi_x, double *nega_x, double *posi_t, double *ne
     cblas_dscal(data->p, 1. / (*nega_t), nega_x, 1);
 }
 
-void _evaluate_aucs(Data *data, double *y_pred, AlgoResults *re, double start_time) {
-    double t_eval = clock();
-    if (data->is_sparse) {
-        memset(y_pred, 0, sizeof(double) * data->n);
-        for (int q = 0; q < data->n; q++) {
-            const int *xt_inds = data->x_tr_inds + data->x_tr_poss[q];
-            const double *xt_vals = data->x_tr_vals + data->x_tr_poss[q];
-            for (int tt = 0; tt < data->x_tr_lens[q]; tt++)
-                y_pred[q] += re->wt[xt_inds[tt]] * xt_vals[tt];
+void _get_posi_nega_x(double *posi_x, double *nega_x, double *posi_t, double *nega_t, double *prob_p, Data *data) {
+    if (data->stat == NULL || data->rows != NULL) { // the cached ones are over all training rows.
+        _class_means(posi_x, nega_x, posi_t, nega_t, prob_p, data);
+        return;
+    }
+    memcpy(posi_x, data->stat->posi_x, sizeof(double) * data->p);
+    memcpy(nega_x, data->stat->nega_x, sizeof(double) * data->p);
+    *posi_t = data->stat->posi_t;
+    *nega_t = data->stat->nega_t;
+    *prob_p = data->stat->prob_p;
+}
+
+static inline int __comp_int_ascend(const void *a, const void *b) {
+    return *(const int *) a - *(const int *) b;
+}
+
+/**
+ * build the CSC index of the given rows of sparse data, the nonzeros of column j
+ * are at positions csc_poss[j], ..., csc_poss[j + 1] - 1 of rows, or of all
+ * rows if rows is NULL.
+ */
+static int _build_csc(int p, const int *rows, int num_rows, const int *x_inds, const int *x_poss,
+                      const int *x_lens, int **csc_poss, int **csc_rows) {
+    *csc_poss = calloc((size_t) p + 1, sizeof(int));
+    for (int i = 0; i < num_rows; i++) { // count the nonzeros of each column.
+        int q = rows == NULL ? i : rows[i];
+        for (int tt = 0; tt < x_lens[q]; tt++) {
+            (*csc_poss)[x_inds[x_poss[q] + tt] + 1]++;
         }
-    } else {
-        cblas_dgemv(CblasRowMajor, CblasNoTrans, data->n, data->p, 1.,
-                    data->x_tr_vals, data->p, re->wt, 1, 0.0, y_pred, 1);
     }
-    re->aucs[re->auc_len] = _auc_score(data->y_tr, y_pred, data->n);
-    re->rts[re->auc_len++] = clock() - start_time - (clock() - t_eval);
+    for (int j = 0; j < p; j++) {
+        (*csc_poss)[j + 1] += (*csc_poss)[j];
+    }
+    int nnz = (*csc_poss)[p];
+    *csc_rows = malloc(sizeof(int) * max(nnz, 1));
+    int *next = malloc(sizeof(int) * p);
+    memcpy(next, *csc_poss, sizeof(int) * p);
+    for (int i = 0; i < num_rows; i++) {
+        int q = rows == NULL ? i : rows[i];
+        for (int tt = 0; tt < x_lens[q]; tt++) {
+            (*csc_rows)[next[x_inds[x_poss[q] + tt]]++] = i;
+        }
+    }
+    free(next);
+    return nnz;
 }
 
-bool _algo_solam(Data *data, GlobalParas *paras, AlgoResults *re, double para_xi, double para_r) {
+DataStat *make_data_stat(const Data *data, bool build_csc) {
+    DataStat *stat = malloc(sizeof(DataStat));
+    stat->posi_x = calloc((size_t) data->p, sizeof(double));
+    stat->nega_x = calloc((size_t) data->p, sizeof(double));
+    stat->posi_t = 0.0, stat->nega_t = 0.0;
+    _class_means(stat->posi_x, stat->nega_x, &stat->posi_t, &stat->nega_t, &stat->prob_p, data);
+    stat->csc_poss = NULL, stat->csc_rows = NULL, stat->csc_nnz = 0;
+    if (build_csc && data->is_sparse) {
+        stat->csc_nnz = _build_csc(data->p, NULL, data->n, data->x_tr_inds, data->x_tr_poss, data->x_tr_lens,
+                                   &stat->csc_poss, &stat->csc_rows);
+    }
+    return stat;
+}
 
-    double start_time = clock();
-    openblas_set_num_threads(1);
-    double gamma_bar;
-    double gamma_bar_prev = 0.0;
-    double alpha_bar;
-    double alpha_bar_prev = 0.0;
-    double gamma;
-    double p_hat = 0.;
-    double *v, *v_prev;
-    double *v_bar, *v_bar_prev;
-    double alpha, alpha_prev;
-    double *y_pred, *grad_v;
-    double is_p_yt, is_n_yt;
-    double vt_dot, wei_posi, wei_nega;
-    double weight, grad_alpha, norm_v;
-    v = malloc(sizeof(double) * (data->p + 2));
-    v_prev = malloc(sizeof(double) * (data->p + 2));
-    for (int i = 0; i < data->p; i++) {
-        v_prev[i] = sqrt((para_r * para_r) / data->p);
+bool free_data_stat(DataStat *stat) {
+    free(stat->csc_rows);
+    free(stat->csc_poss);
+    free(stat->nega_x);
+    free(stat->posi_x);
+    free(stat);
+    return true;
+}
+
+/** the CSC index of the evaluated rows, it is shared with data->stat if they are all training rows. */
+static void _build_eval_csc(Evaluator *ev, const Data *data, bool has_te) {
+    bool is_shared = !has_te && ev->num_rows == data->n && data->rows == NULL &&
+                     data->stat != NULL && data->stat->csc_poss != NULL;
+    if (is_shared) {
+        ev->csc_poss = data->stat->csc_poss;
+        ev->csc_rows = data->stat->csc_rows;
+        ev->csc_nnz = data->stat->csc_nnz;
+    } else {
+        ev->csc_nnz = _build_csc(ev->p, ev->rows, ev->num_rows, ev->x_inds, ev->x_poss, ev->x_lens,
+                                 &ev->csc_poss, &ev->csc_rows);
     }
-    v_prev[data->p] = para_r, v_prev[data->p + 1] = para_r;
-    alpha_prev = 2. * para_r;
-    grad_v = malloc(sizeof(double) * (data->p + 2));
-    v_bar = malloc(sizeof(double) * (data->p + 2));
-    v_bar_prev = calloc((data->p + 2), sizeof(double));
-    y_pred = calloc((size_t) data->n, sizeof(double));
+    ev->owns_csc = !is_shared;
+    ev->w_last = calloc((size_t) ev->p, sizeof(double));
+    ev->is_stale = calloc((size_t) ev->num_rows, sizeof(bool));
+    ev->stale_rows = malloc(sizeof(int) * ev->num_rows);
+}
 
-    for (int t = 1; t <= (paras->num_passes * data->n); t++) {
-        int cur_ind = (t - 1) % data->n;
-        const double *xt_vals = data->x_tr_vals + data->x_tr_poss[cur_ind];
-        const int *xt_inds = data->x_tr_inds + data->x_tr_poss[cur_ind]; // current sample
-        is_p_yt = is_posi(data->y_tr[cur_ind]);
-        is_n_yt = is_nega(data->y_tr[cur_ind]);
-        p_hat = ((t - 1.) * p_hat + is_p_yt) / t; // update p_hat
-        gamma = para_xi / sqrt(t * 1.); // current learning rate
-        if (data->is_sparse) {
-            vt_dot = 0.0;
-            memset(grad_v, 0, sizeof(double) * (data->p + 2)); // calculate the gradient w
-            for (int kk = 0; kk < data->x_tr_lens[cur_ind]; kk++) {
-                grad_v[xt_inds[kk]] = xt_vals[kk];
-                vt_dot += (v_prev[xt_inds[kk]] * xt_vals[kk]);
-            }
-        } else {
-            const double *xt = data->x_tr_vals + cur_ind * data->p; // current sample
-            memcpy(grad_v, xt, sizeof(double) * data->p); // calculate the gradient w
-            vt_dot = cblas_ddot(data->p, v_prev, 1, xt, 1);
+Evaluator *make_evaluator(const Data *data, const GlobalParas *paras) {
+    Evaluator *ev = malloc(sizeof(Evaluator));
+    bool has_te = (data->y_te != NULL);
+    const double *y = has_te ? data->y_te : data->y_tr;
+    int n = has_te ? data->n_te : data->n;
+    ev->x_vals = has_te ? data->x_te_vals : data->x_tr_vals;
+    ev->x_inds = has_te ? data->x_te_inds : data->x_tr_inds;
+    ev->x_poss = has_te ? data->x_te_poss : data->x_tr_poss;
+    ev->x_lens = has_te ? data->x_te_lens : data->x_tr_lens;
+    ev->is_sparse = data->is_sparse;
+    ev->p = data->p;
+    ev->num_rows = (paras->eval_size > 0 && paras->eval_size < n) ? paras->eval_size : n;
+    ev->rows = malloc(sizeof(int) * n);
+    for (int i = 0; i < n; i++) {
+        ev->rows[i] = has_te ? i : _row(data, i);
+    }
+    if (ev->num_rows < n) {
+        // a partial Fisher-Yates shuffle with its own seed, the global rng is not touched.
+        unsigned short seed[3] = {0x330E, 0xABCD, 0x1234};
+        for (int i = 0; i < ev->num_rows; i++) {
+            int j = i + (int) (erand48(seed) * (n - i));
+            int tmp = ev->rows[i];
+            ev->rows[i] = ev->rows[j], ev->rows[j] = tmp;
         }
-        wei_posi = 2. * (1. - p_hat) * (vt_dot - v_prev[data->p] - (1. + alpha_prev));
-        wei_nega = 2. * p_hat * ((vt_dot - v_prev[data->p + 1]) + (1. + alpha_prev));
-        weight = wei_posi * is_p_yt + wei_nega * is_n_yt;
-        cblas_dscal(data->p, weight, grad_v, 1);
-        grad_v[data->p] = -2. * (1. - p_hat) * (vt_dot - v_prev[data->p]) * is_p_yt; //grad of a
-        grad_v[data->p + 1] = -2. * p_hat * (vt_dot - v_prev[data->p + 1]) * is_n_yt; //grad of b
-        cblas_dscal(data->p + 2, -gamma, grad_v, 1); // gradient descent step of vt
-        cblas_daxpy(data->p + 2, 1.0, v_prev, 1, grad_v, 1);
-        memcpy(v, grad_v, sizeof(double) * (data->p + 2));
+        qsort(ev->rows, (size_t) ev->num_rows, sizeof(int), &__comp_int_ascend);
+    }
+    ev->y_true = malloc(sizeof(double) * ev->num_rows);
+    for (int i = 0; i < ev->num_rows; i++) {
+        ev->y_true[i] = y[ev->rows[i]];
+    }
+    ev->y_pred = malloc(sizeof(double) * ev->num_rows);
+    ev->pairs = malloc(sizeof(data_pair) * ev->num_rows);
+    ev->growth = paras->eval_growth;
+    ev->next_eval = 1.0;
+    ev->csc_poss = NULL, ev->csc_rows = NULL, ev->w_last = NULL;
+    ev->is_stale = NULL, ev->stale_rows = NULL;
+    ev->csc_nnz = 0;
+    ev->owns_csc = false;
+    ev->has_pred = false;
+    if (paras->eval_csc == 1 && ev->is_sparse) { _build_eval_csc(ev, data, has_te); }
+    return ev;
+}
+
+bool free_evaluator(Evaluator *ev) {
+    if (ev->csc_poss != NULL) {
+        free(ev->stale_rows);
+        free(ev->is_stale);
+        free(ev->w_last);
+        if (ev->owns_csc) {
+            free(ev->csc_rows);
+            free(ev->csc_poss);
+        }
+    }
+    free(ev->pairs);
+    free(ev->y_pred);
+    free(ev->y_true);
+    free(ev->rows);
+    free(ev);
+    return true;
+}
+
+/**
+ * Whether AUC should be evaluated at the t-th iteration.
+ * @param step the fixed cadence of the caller, the geometric one is at least step iterations apart.
+ * @param default_due whether the fixed cadence is due, used if there is no geometric one.
+ */
+static bool _eval_due(Evaluator *ev, int t, int step, bool default_due) {
+    if (ev->growth <= 1.0) { return default_due; }
+    if (t < ev->next_eval) { return false; }
+    ev->next_eval = fmax(ev->next_eval * ev->growth, ev->next_eval + step);
+    return true;
+}
+
+/** the score of the i-th evaluated row. */
+static inline double _eval_row_score(const Evaluator *ev, const double *wt, int i, const int *supp, int supp_size) {
+    int q = ev->rows[i];
+    double pred = 0.0;
+    if (ev->is_sparse) { // already O(nnz).
+        const int *xt_inds = ev->x_inds + ev->x_poss[q];
+        const double *xt_vals = ev->x_vals + ev->x_poss[q];
+        for (int tt = 0; tt < ev->x_lens[q]; tt++)
+            pred += wt[xt_inds[tt]] * xt_vals[tt];
+    } else if (supp != NULL) {
+        const double *xq = ev->x_vals + (size_t) q * ev->p;
+        for (int kk = 0; kk < supp_size; kk++) {
+            pred += xq[supp[kk]] * wt[supp[kk]];
+        }
+    } else {
+        pred = cblas_ddot(ev->p, ev->x_vals + (size_t) q * ev->p, 1, wt, 1);
+    }
+    return pred;
+}
+
+/**
+ * Rescore the rows which have a nonzero on a coordinate j with wt_j != w_last_j.
+ * Nothing is rescored if this costs as much as scoring all rows.
+ * @return true if y_pred is the score of wt.
+ */
+static bool _eval_rescore_stale(Evaluator *ev, const double *wt) {
+    int cost = 0, num_stale = 0;
+    for (int j = 0; j < ev->p && cost < ev->csc_nnz; j++) {
+        if (wt[j] == ev->w_last[j]) { continue; }
+        cost += ev->csc_poss[j + 1] - ev->csc_poss[j];
+        for (int kk = ev->csc_poss[j]; kk < ev->csc_poss[j + 1]; kk++) {
+            int i = ev->csc_rows[kk];
+            if (!ev->is_stale[i]) {
+                ev->is_stale[i] = true;
+                ev->stale_rows[num_stale++] = i;
+                cost += ev->x_lens[ev->rows[i]];
+            }
+        }
+        ev->w_last[j] = wt[j];
+    }
+    bool is_cheaper = cost < ev->csc_nnz;
+    for (int kk = 0; kk < num_stale; kk++) {
+        int i = ev->stale_rows[kk];
+        if (is_cheaper) { ev->y_pred[i] = _eval_row_score(ev, wt, i, NULL, 0); }
+        ev->is_stale[i] = false;
+    }
+    return is_cheaper;
+}
+
+/**
+ * Score the evaluated rows by wt, the scores are in y_pred.
+ * @param supp the support of wt, NULL if wt is not known to be sparse.
+ */
+static void _eval_scores(Evaluator *ev, const double *wt, const int *supp, int supp_size) {
+    if (ev->csc_poss == NULL || !ev->has_pred || !_eval_rescore_stale(ev, wt)) {
+        for (int i = 0; i < ev->num_rows; i++) {
+            ev->y_pred[i] = _eval_row_score(ev, wt, i, supp, supp_size);
+        }
+        if (ev->csc_poss != NULL) {
+            memcpy(ev->w_last, wt, sizeof(double) * ev->p);
+            ev->has_pred = true;
+        }
+    }
+}
+
+/** Evaluate the AUC score of wt and record it in re, supp as in _eval_scores. */
+static void _eval_aucs(Evaluator *ev, const double *wt, const int *supp, int supp_size,
+                       AlgoResults *re, double start_time) {
+    if (re->auc_len >= re->auc_cap) { return; }
+    double t_eval = clock();
+    _eval_scores(ev, wt, supp, supp_size);
+    re->aucs[re->auc_len] = _auc_score_pairs(ev->y_true, ev->y_pred, ev->num_rows, ev->pairs);
+    log_event(EVENT_AUC, re->total_iterations, re->aucs[re->auc_len]);
+    re->rts[re->auc_len++] = clock() - start_time - (clock() - t_eval);
+}
+
+static double _wall_time(void) {
+    struct timespec ts;
+    timespec_get(&ts, TIME_UTC);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+StopCriteria *make_stop_criteria(const GlobalParas *paras, int epoch_len) {
+    StopCriteria *sc = malloc(sizeof(StopCriteria));
+    sc->epoch_len = epoch_len;
+    sc->num_passes = paras->num_passes;
+    sc->verbose = paras->verbose;
+    sc->stop_eps = paras->stop_eps;
+    sc->time_budget = paras->time_budget;
+    sc->start_wall = _wall_time();
+    sc->auc_patience = paras->auc_patience;
+    sc->auc_tol = paras->auc_tol;
+    sc->best_auc = -1.0;
+    sc->num_stale = 0;
+    sc->last_auc_len = 0;
+    return sc;
+}
+
+bool free_stop_criteria(StopCriteria *sc) {
+    free(sc);
+    return true;
+}
+
+/** whether the t-th iteration ends an epoch, t starts from 1. */
+static inline bool _stop_check_due(const StopCriteria *sc, int t) {
+    return t % sc->epoch_len == 0;
+}
+
+/** whether the iterate after the t-th iteration has to be written to re->wt_prev. */
+static inline bool _stop_snap_due(const StopCriteria *sc, int t) {
+    return (t + 1) % sc->epoch_len == 0;
+}
+
+/**
+ * Check the stopping criteria at the end of an epoch, where wt is the current
+ * iterate. re->wt_prev is overwritten by wt_prev - wt.
+ * @return true if the algorithm should stop.
+ */
+static bool _stop_check(StopCriteria *sc, const double *wt, AlgoResults *re, int p) {
+    double norm_wt = sqrt(cblas_ddot(p, re->wt_prev, 1, re->wt_prev, 1));
+    cblas_daxpy(p, -1., wt, 1, re->wt_prev, 1);
+    double norm_diff = sqrt(cblas_ddot(p, re->wt_prev, 1, re->wt_prev, 1));
+    if (norm_wt > 0.0) {
+        log_event(EVENT_DIFF, re->total_epochs, norm_diff / norm_wt);
+        log_debug("diff: %.6f\n", norm_diff / norm_wt);
+    }
+    if (norm_wt > 0.0 && (norm_diff / norm_wt <= sc->stop_eps)) {
+        if (sc->verbose > 0) {
+            log_info("early stop at: %d-th epoch where maximal epoch is: %d\n",
+                     re->total_epochs, sc->num_passes);
+        }
+        log_event(EVENT_STOP, re->total_epochs, STOP_EPS);
+        return true;
+    }
+    if (sc->auc_patience > 0 && re->auc_len > sc->last_auc_len) {
+        sc->last_auc_len = re->auc_len;
+        if (re->aucs[re->auc_len - 1] > sc->best_auc + sc->auc_tol) {
+            sc->best_auc = re->aucs[re->auc_len - 1];
+            sc->num_stale = 0;
+        } else if (++sc->num_stale >= sc->auc_patience) {
+            if (sc->verbose > 0) {
+                log_info("stop at: %d-th epoch, auc did not improve in %d epochs\n",
+                         re->total_epochs, sc->num_stale);
+            }
+            log_event(EVENT_STOP, re->total_epochs, STOP_AUC_PLATEAU);
+            return true;
+        }
+    }
+    if (sc->time_budget > 0.0 && _wall_time() - sc->start_wall >= sc->time_budget) {
+        if (sc->verbose > 0) {
+            log_info("stop at: %d-th epoch, time budget %.2f seconds is used up\n",
+                     re->total_epochs, sc->time_budget);
+        }
+        log_event(EVENT_STOP, re->total_epochs, STOP_TIME_BUDGET);
+        return true;
+    }
+    return false;
+}
+
+bool _algo_solam(Data *data, GlobalParas *paras, AlgoResults *re, double para_xi, double para_r) {
+
+    double start_time = clock();
+    openblas_set_num_threads(1);
+    double gamma_bar;
+    double gamma_bar_prev = 0.0;
+    double alpha_bar;
+    double alpha_bar_prev = 0.0;
+    double gamma;
+    double p_hat = 0.;
+    double *v_bar;
+    double alpha, alpha_prev;
+    double is_p_yt, is_n_yt;
+    double vt_dot, wei_posi, wei_nega;
+    double weight, grad_alpha, grad_a, grad_b;
+    // v = [w, a, b], where w = scale * u is a scaled vector.
+    ScaledVector *v_w = make_scaled_vector(data->p, NULL);
+    for (int i = 0; i < data->p; i++) {
+        v_w->u[i] = sqrt((para_r * para_r) / data->p);
+    }
+    _sv_renorm(v_w);
+    double v_a = para_r, v_b = para_r;
+    alpha_prev = 2. * para_r;
+    v_bar = calloc((data->p + 2), sizeof(double));
+    // the w-part of v_bar is averaged lazily and only materialized when needed.
+    bool is_lazy = data->is_sparse && paras->lazy_update == 1;
+    LazyAverage *w_bar = is_lazy ? make_lazy_average(data->p) : NULL;
+    Evaluator *ev = make_evaluator(data, paras);
+    StopCriteria *sc = make_stop_criteria(paras, data->n);
+
+    for (int t = 1; t <= (paras->num_passes * data->n); t++) {
+        int cur_ind = _row(data, (t - 1) % data->n);
+        // current sample, the CSR arrays are only read for sparse data.
+        const double *xt_vals = data->is_sparse ? data->x_tr_vals + data->x_tr_poss[cur_ind] : NULL;
+        const int *xt_inds = data->is_sparse ? data->x_tr_inds + data->x_tr_poss[cur_ind] : NULL;
+        const double *xt = data->is_sparse ? NULL : data->x_tr_vals + (size_t) cur_ind * data->p;
+        is_p_yt = is_posi(data->y_tr[cur_ind]);
+        is_n_yt = is_nega(data->y_tr[cur_ind]);
+        p_hat = ((t - 1.) * p_hat + is_p_yt) / t; // update p_hat
+        gamma = para_xi / sqrt(t * 1.); // current learning rate
+        if (data->is_sparse) {
+            vt_dot = _sv_dot_sparse(v_w, xt_inds, xt_vals, data->x_tr_lens[cur_ind]);
+        } else {
+            vt_dot = _sv_dot(v_w, xt);
+        }
+        // update v_bar by using v_prev, which is the current v.
+        gamma_bar = gamma_bar_prev + gamma; // update gamma_
+        if (is_lazy) {
+            _lazy_avg_step(w_bar, v_w, gamma);
+            v_bar[data->p] = (gamma_bar_prev * v_bar[data->p] + gamma * v_a) / gamma_bar;
+            v_bar[data->p + 1] = (gamma_bar_prev * v_bar[data->p + 1] + gamma * v_b) / gamma_bar;
+        } else {
+            cblas_dscal(data->p + 2, gamma_bar_prev / gamma_bar, v_bar, 1);
+            cblas_daxpy(data->p, v_w->scale * gamma / gamma_bar, v_w->u, 1, v_bar, 1);
+            v_bar[data->p] += (gamma / gamma_bar) * v_a;
+            v_bar[data->p + 1] += (gamma / gamma_bar) * v_b;
+        }
+        // update alpha_bar
+        alpha_bar = (gamma_bar_prev * alpha_bar_prev + gamma * alpha_prev) / gamma_bar;
+        // calculate the gradient of w, a, b
+        wei_posi = 2. * (1. - p_hat) * (vt_dot - v_a - (1. + alpha_prev));
+        wei_nega = 2. * p_hat * ((vt_dot - v_b) + (1. + alpha_prev));
+        weight = wei_posi * is_p_yt + wei_nega * is_n_yt;
+        grad_a = -2. * (1. - p_hat) * (vt_dot - v_a) * is_p_yt; //grad of a
+        grad_b = -2. * p_hat * (vt_dot - v_b) * is_n_yt; //grad of b
+        // gradient descent step of vt
+        if (data->is_sparse) {
+            for (int kk = 0; kk < data->x_tr_lens[cur_ind]; kk++) {
+                if (is_lazy) { _lazy_avg_touch(w_bar, v_w, xt_inds[kk]); }
+                _sv_add(v_w, xt_inds[kk], -gamma * weight * xt_vals[kk]);
+            }
+        } else {
+            _sv_axpy(v_w, -gamma * weight, xt);
+        }
+        v_a = v_a - gamma * grad_a;
+        v_b = v_b - gamma * grad_b;
         wei_posi = -2. * (1. - p_hat) * vt_dot; // calculate the gradient of dual alpha
         wei_nega = 2. * p_hat * vt_dot;
         grad_alpha = wei_posi * is_p_yt + wei_nega * is_n_yt;
         grad_alpha += -2. * p_hat * (1. - p_hat) * alpha_prev;
         alpha = alpha_prev + gamma * grad_alpha; // gradient descent step of alpha
-        norm_v = sqrt(cblas_ddot(data->p, v, 1, v, 1)); // projection w
-        if (norm_v > para_r) { cblas_dscal(data->p, para_r / norm_v, v, 1); }
-        v[data->p] = (v[data->p] > para_r) ? para_r : v[data->p]; // projection a
-        v[data->p + 1] = (v[data->p + 1] > para_r) ? para_r : v[data->p + 1]; // projection b
+        double factor = _sv_l2_ball_factor(v_w, para_r); // projection w
+        if (is_lazy) { _lazy_avg_scale(w_bar, v_w, factor); } else { _sv_scale(v_w, factor); }
+        v_a = (v_a > para_r) ? para_r : v_a; // projection a
+        v_b = (v_b > para_r) ? para_r : v_b; // projection b
         // projection alpha
         alpha = (fabs(alpha) > 2. * para_r) ? (2. * alpha * para_r) / fabs(alpha) : alpha;
-        gamma_bar = gamma_bar_prev + gamma; // update gamma_
-        memcpy(v_bar, v_prev, sizeof(double) * (data->p + 2)); // update v_bar
-        cblas_dscal(data->p + 2, gamma / gamma_bar, v_bar, 1);
-        cblas_daxpy(data->p + 2, gamma_bar_prev / gamma_bar, v_bar_prev, 1, v_bar, 1);
-        // update alpha_bar
-        alpha_bar = (gamma_bar_prev * alpha_bar_prev + gamma * alpha_prev) / gamma_bar;
         alpha_prev = alpha, alpha_bar_prev = alpha_bar, gamma_bar_prev = gamma_bar;
-        memcpy(v_bar_prev, v_bar, sizeof(double) * (data->p + 2));
-        memcpy(v_prev, v, sizeof(double) * (data->p + 2));
         // to calculate AUC score, v_var is the current values.
-        if ((fmod(t, paras->step_len) == 1.) && (paras->record_aucs == 1)) {
+        if ((paras->record_aucs == 1) && _eval_due(ev, t, paras->step_len, fmod(t, paras->step_len) == 1.)) {
+            if (is_lazy) { _lazy_avg_to_dense(w_bar, v_w, v_bar); }
             memcpy(re->wt, v_bar, sizeof(double) * (data->p));
-            _evaluate_aucs(data, y_pred, re, start_time);
+            _eval_aucs(ev, re->wt, NULL, 0, re, start_time);
         }
         // at the end of each epoch, we check the early stop condition.
         re->total_iterations++;
-        if (t % data->n == 0) {
+        if (_stop_check_due(sc, t)) {
             re->total_epochs++;
-            double norm_wt = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-            cblas_daxpy(data->p, -1., v_bar, 1, re->wt_prev, 1);
-            double norm_diff = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-            if (norm_wt > 0.0 && (norm_diff / norm_wt <= paras->stop_eps)) {
-                if (paras->verbose > 0) {
-                    printf("early stop at: %d-th epoch where maximal epoch is: %d\n",
-                           t / data->n, paras->num_passes);
-                }
-                break;
+            if (is_lazy) { _lazy_avg_to_dense(w_bar, v_w, v_bar); }
+            if (_stop_check(sc, v_bar, re, data->p)) { break; }
+        }
+        if (_stop_snap_due(sc, t)) { // wt_prev is only read at the end of an epoch.
+            if (is_lazy) {
+                _lazy_avg_to_dense(w_bar, v_w, re->wt_prev);
+            } else {
+                memcpy(re->wt_prev, v_bar, sizeof(double) * (data->p));
             }
         }
-        memcpy(re->wt_prev, v_bar, sizeof(double) * (data->p));
     }
+    if (is_lazy) { _lazy_avg_to_dense(w_bar, v_w, v_bar); }
     memcpy(re->wt, v_bar, sizeof(double) * data->p);
     cblas_dscal(re->auc_len, 1. / CLOCKS_PER_SEC, re->rts, 1);
-    free(y_pred);
-    free(v_bar_prev);
+    log_flush();
+    free_stop_criteria(sc);
+    free_evaluator(ev);
     free(v_bar);
-    free(grad_v);
-    free(v_prev);
-    free(v);
+    free_scaled_vector(v_w);
+    if (is_lazy) { free_lazy_average(w_bar); }
     return true;
 }
 
+static inline void _lazy_heap_swap(LazyProx *lazy, int i, int j) {
+    int tmp = lazy->heap[i];
+    lazy->heap[i] = lazy->heap[j], lazy->heap[j] = tmp;
+    lazy->heap_pos[lazy->heap[i]] = i, lazy->heap_pos[lazy->heap[j]] = j;
+}
+
+static void _lazy_heap_up(LazyProx *lazy, int i) {
+    while (i > 0 && lazy->tau[lazy->heap[(i - 1) / 2]] > lazy->tau[lazy->heap[i]]) {
+        _lazy_heap_swap(lazy, i, (i - 1) / 2);
+        i = (i - 1) / 2;
+    }
+}
+
+static void _lazy_heap_down(LazyProx *lazy, int i) {
+    while (2 * i + 1 < lazy->heap_size) {
+        int child = 2 * i + 1;
+        if (child + 1 < lazy->heap_size && lazy->tau[lazy->heap[child + 1]] < lazy->tau[lazy->heap[child]]) {
+            child++;
+        }
+        if (lazy->tau[lazy->heap[i]] <= lazy->tau[lazy->heap[child]]) { break; }
+        _lazy_heap_swap(lazy, i, child);
+        i = child;
+    }
+}
+
+static void _lazy_heap_remove(LazyProx *lazy, int j) {
+    int i = lazy->heap_pos[j];
+    lazy->heap_pos[j] = -1;
+    if (--lazy->heap_size == i) { return; }
+    lazy->heap[i] = lazy->heap[lazy->heap_size];
+    lazy->heap_pos[lazy->heap[i]] = i;
+    _lazy_heap_up(lazy, i);
+    _lazy_heap_down(lazy, i);
+}
+
+/** add (wei = 1.) or remove (wei = -1.) the contribution of coordinate j. */
+static inline void _lazy_prox_sums(LazyProx *lazy, int j, double wei) {
+    wei *= lazy->sgn[j];
+    lazy->posi_s1 += wei * lazy->posi_x[j] * lazy->tau[j];
+    lazy->posi_s0 += wei * lazy->posi_x[j];
+    lazy->nega_s1 += wei * lazy->nega_x[j] * lazy->tau[j];
+    lazy->nega_s0 += wei * lazy->nega_x[j];
+}
+
+/** restart the lazy representation from the explicit vector wt. */
+static void _lazy_prox_reset(LazyProx *lazy, const double *wt) {
+    lazy->prox_p = 1.0, lazy->prox_q = 0.0, lazy->heap_size = 0;
+    lazy->posi_s1 = 0.0, lazy->posi_s0 = 0.0, lazy->nega_s1 = 0.0, lazy->nega_s0 = 0.0;
+    for (int j = 0; j < lazy->p; j++) {
+        lazy->tau[j] = fabs(wt[j]);
+        lazy->sgn[j] = (double) sign(wt[j]);
+        lazy->heap_pos[j] = -1;
+        if (lazy->tau[j] > 0.0) {
+            lazy->heap_pos[j] = lazy->heap_size;
+            lazy->heap[lazy->heap_size++] = j;
+            _lazy_prox_sums(lazy, j, 1.0);
+        }
+    }
+    for (int i = lazy->heap_size / 2 - 1; i >= 0; i--) {
+        _lazy_heap_down(lazy, i);
+    }
+}
+
+/** recompute the running sums from the alive coordinates, which drop the rounding of their updates, O(heap_size). */
+static void _lazy_prox_resync(LazyProx *lazy) {
+    lazy->posi_s1 = 0.0, lazy->posi_s0 = 0.0, lazy->nega_s1 = 0.0, lazy->nega_s0 = 0.0;
+    for (int i = 0; i < lazy->heap_size; i++) {
+        _lazy_prox_sums(lazy, lazy->heap[i], 1.0);
+    }
+}
+
+static inline double _lazy_prox_get(const LazyProx *lazy, int j) {
+    return lazy->sgn[j] * fmax(0.0, lazy->tau[j] - lazy->prox_q) / lazy->prox_p;
+}
+
+/** set w_j = val, where val is the value before the current proximal step. */
+static void _lazy_prox_set(LazyProx *lazy, int j, double val) {
+    double old_tau = lazy->tau[j];
+    if (lazy->heap_pos[j] >= 0) { _lazy_prox_sums(lazy, j, -1.0); }
+    lazy->tau[j] = fabs(val) * lazy->prox_p + lazy->prox_q;
+    lazy->sgn[j] = (double) sign(val);
+    if (val == 0.0) {
+        if (lazy->heap_pos[j] >= 0) { _lazy_heap_remove(lazy, j); }
+        return;
+    }
+    _lazy_prox_sums(lazy, j, 1.0);
+    if (lazy->heap_pos[j] < 0) {
+        lazy->heap_pos[j] = lazy->heap_size;
+        lazy->heap[lazy->heap_size++] = j;
+        _lazy_heap_up(lazy, lazy->heap_pos[j]);
+    } else if (lazy->tau[j] < old_tau) {
+        _lazy_heap_up(lazy, lazy->heap_pos[j]);
+    } else {
+        _lazy_heap_down(lazy, lazy->heap_pos[j]);
+    }
+}
+
+/** apply one proximal step to all coordinates and drop the ones hitting zero. */
+static void _lazy_prox_advance(LazyProx *lazy, double eta_l1, double eta_l2) {
+    lazy->prox_q += eta_l1 * lazy->prox_p;
+    lazy->prox_p *= (1. + eta_l2);
+    while (lazy->heap_size > 0 && lazy->tau[lazy->heap[0]] <= lazy->prox_q) {
+        _lazy_prox_sums(lazy, lazy->heap[0], -1.0);
+        _lazy_heap_remove(lazy, lazy->heap[0]);
+    }
+}
+
+/** write all pending proximal steps into wt, O(p). */
+static void _lazy_prox_flush(LazyProx *lazy, double *wt) {
+    for (int j = 0; j < lazy->p; j++) {
+        wt[j] = _lazy_prox_get(lazy, j);
+    }
+    _lazy_prox_reset(lazy, wt);
+}
+
+/** write the pending steps of SPAM into wt, O(p). */
+static void _spam_flush(LazyProx *lazy, ScaledVector *sv, double *wt) {
+    if (lazy != NULL) {
+        _lazy_prox_flush(lazy, wt);
+    } else {
+        _sv_renorm(sv); // sv->u is wt itself.
+    }
+}
+
 void _algo_spam(Data *data, GlobalParas *paras, AlgoResults *re,
                 double para_xi, double para_l1_reg, double para_l2_reg) {
 
@@ -596,84 +1531,149 @@ void _algo_spam(Data *data, GlobalParas *paras, AlgoResults *re,
     double *grad_wt = malloc(sizeof(double) * data->p); // gradient
     double *posi_x = calloc((size_t) data->p, sizeof(double)); // E[x|y=1]
     double *nega_x = calloc((size_t) data->p, sizeof(double)); // E[x|y=-1]
-    double *y_pred = calloc((size_t) data->n, sizeof(double));
-    double a_wt;
-    double b_wt;
+    Evaluator *ev = make_evaluator(data, paras);
+    StopCriteria *sc = make_stop_criteria(paras, data->n);
+    double a_wt = 0.0;
+    double b_wt = 0.0;
     double alpha_wt;
     double posi_t = 0.0;
     double nega_t = 0.0;
     double prob_p;
     double eta_t;
     _get_posi_nega_x(posi_x, nega_x, &posi_t, &nega_t, &prob_p, data);
+    bool is_l2 = (para_l1_reg <= 0.0 && para_l2_reg > 0.0);
+    // lazy mode only makes sense for the elastic-net step on sparse data.
+    bool is_lazy = data->is_sparse && paras->lazy_update == 1 && !is_l2;
+    // a(wt) and b(wt) are tracked through the updates, lazy mode has them in O(1) from its running sums.
+    bool is_incr = paras->proj_resync > 0 && !is_lazy;
+    bool is_resync = paras->proj_resync > 0;
+    double *xt_posi = NULL, *xt_nega = NULL; // <xi, posi_x> and <xi, nega_x> for dense data.
+    if (is_incr && !data->is_sparse) {
+        xt_posi = malloc(sizeof(double) * data->n);
+        xt_nega = malloc(sizeof(double) * data->n);
+        if (data->rows == NULL) {
+            cblas_dgemv(CblasRowMajor, CblasNoTrans, data->n, data->p, 1.,
+                        data->x_tr_vals, data->p, posi_x, 1, 0.0, xt_posi, 1);
+            cblas_dgemv(CblasRowMajor, CblasNoTrans, data->n, data->p, 1.,
+                        data->x_tr_vals, data->p, nega_x, 1, 0.0, xt_nega, 1);
+        } else {
+            for (int i = 0; i < data->n; i++) {
+                const double *xi = data->x_tr_vals + (size_t) data->rows[i] * data->p;
+                xt_posi[i] = cblas_ddot(data->p, xi, 1, posi_x, 1);
+                xt_nega[i] = cblas_ddot(data->p, xi, 1, nega_x, 1);
+            }
+        }
+    }
+    LazyProx *lazy = NULL;
+    ScaledVector *wt = NULL; // wt = scale * re->wt, the scale is only used by ell_2.
+    if (is_lazy) {
+        lazy = make_lazy_prox(data->p, posi_x, nega_x);
+        _lazy_prox_reset(lazy, re->wt);
+    } else {
+        wt = make_scaled_vector(data->p, re->wt);
+    }
 
     for (int t = 1; t <= paras->num_passes * data->n; t++) {
         eta_t = para_xi / sqrt(t); // current learning rate
-        a_wt = cblas_ddot(data->p, re->wt, 1, posi_x, 1); // update a(wt)
-        b_wt = cblas_ddot(data->p, re->wt, 1, nega_x, 1); // para_b(wt)
+        if (is_lazy) {
+            if (is_resync && (t - 1) % paras->proj_resync == 0) { _lazy_prox_resync(lazy); }
+            a_wt = (lazy->posi_s1 - lazy->prox_q * lazy->posi_s0) / lazy->prox_p;
+            b_wt = (lazy->nega_s1 - lazy->prox_q * lazy->nega_s0) / lazy->prox_p;
+        } else if (!is_incr || (t - 1) % paras->proj_resync == 0) {
+            a_wt = _sv_dot(wt, posi_x); // update a(wt)
+            b_wt = _sv_dot(wt, nega_x); // para_b(wt)
+        }
         alpha_wt = b_wt - a_wt; // alpha(wt)
         const double *xt;
         const int *xt_inds;
         const double *xt_vals;
         double xtw = 0.0, weight;
+        int pos = (t - 1) % data->n, row = _row(data, pos);
         if (data->is_sparse) {
             // receive zt=(xt,yt)
-            xt_inds = data->x_tr_inds + data->x_tr_poss[(t - 1) % data->n];
-            xt_vals = data->x_tr_vals + data->x_tr_poss[(t - 1) % data->n];
-            for (int tt = 0; tt < data->x_tr_lens[(t - 1) % data->n]; tt++) {
-                xtw += (re->wt[xt_inds[tt]] * xt_vals[tt]);
+            xt_inds = data->x_tr_inds + data->x_tr_poss[row];
+            xt_vals = data->x_tr_vals + data->x_tr_poss[row];
+            for (int tt = 0; tt < data->x_tr_lens[row]; tt++) {
+                double wt_j = is_lazy ? _lazy_prox_get(lazy, xt_inds[tt]) : _sv_get(wt, xt_inds[tt]);
+                xtw += (wt_j * xt_vals[tt]);
             }
-            weight = data->y_tr[(t - 1) % data->n] > 0 ?
+            weight = data->y_tr[row] > 0 ?
                      2. * (1.0 - prob_p) * (xtw - a_wt) -
                      2. * (1.0 + alpha_wt) * (1.0 - prob_p) :
                      2.0 * prob_p * (xtw - b_wt) + 2.0 * (1.0 + alpha_wt) * prob_p;
             // gradient descent
-            for (int tt = 0; tt < data->x_tr_lens[(t - 1) % data->n]; tt++) {
-                re->wt[xt_inds[tt]] += -eta_t * weight * xt_vals[tt];
+            for (int tt = 0; tt < data->x_tr_lens[row]; tt++) {
+                if (is_lazy) {
+                    double wt_j = _lazy_prox_get(lazy, xt_inds[tt]);
+                    _lazy_prox_set(lazy, xt_inds[tt], wt_j - eta_t * weight * xt_vals[tt]);
+                } else {
+                    double delta = -eta_t * weight * xt_vals[tt];
+                    _sv_add(wt, xt_inds[tt], delta);
+                    a_wt += delta * posi_x[xt_inds[tt]];
+                    b_wt += delta * nega_x[xt_inds[tt]];
+                }
             }
         } else {
-            xt = data->x_tr_vals + ((t - 1) % data->n) * data->p;
-            xtw = cblas_ddot(data->p, re->wt, 1, xt, 1);
-            weight = data->y_tr[(t - 1) % data->n] > 0 ?
+            xt = data->x_tr_vals + (size_t) row * data->p;
+            xtw = _sv_dot(wt, xt);
+            weight = data->y_tr[row] > 0 ?
                      2. * (1.0 - prob_p) * (xtw - a_wt) -
                      2. * (1.0 + alpha_wt) * (1.0 - prob_p) :
                      2.0 * prob_p * (xtw - b_wt) + 2.0 * (1.0 + alpha_wt) * prob_p;
             // gradient descent
-            cblas_daxpy(data->p, -eta_t * weight, xt, 1, re->wt, 1);
+            _sv_axpy(wt, -eta_t * weight, xt);
+            if (is_incr) {
+                a_wt += -eta_t * weight * xt_posi[pos];
+                b_wt += -eta_t * weight * xt_nega[pos];
+            }
         }
-        if (para_l1_reg <= 0.0 && para_l2_reg > 0.0) {
+        if (is_lazy) {
+            // elastic-net, only the coordinates touched above are written.
+            _lazy_prox_advance(lazy, eta_t * para_l1_reg, eta_t * para_l2_reg);
+            if (lazy->prox_p > 1e100) { _lazy_prox_flush(lazy, re->wt); } // avoid overflow
+        } else if (is_l2) {
             // l2-regularization
-            cblas_dscal(data->p, 1. / (eta_t * para_l2_reg + 1.), re->wt, 1);
+            _sv_scale(wt, 1. / (eta_t * para_l2_reg + 1.));
+            a_wt /= (eta_t * para_l2_reg + 1.);
+            b_wt /= (eta_t * para_l2_reg + 1.);
         } else {
-            // elastic-net
+            // elastic-net, the scale of wt stays 1.0 in this case.
             double tmp_demon = (eta_t * para_l2_reg + 1.);
+            a_wt = 0.0, b_wt = 0.0;
             for (int k = 0; k < data->p; k++) {
                 double tmp_sign = (double) sign(re->wt[k]) / tmp_demon;
                 re->wt[k] = tmp_sign * fmax(0.0, fabs(re->wt[k]) - eta_t * para_l1_reg);
+                a_wt += re->wt[k] * posi_x[k];
+                b_wt += re->wt[k] * nega_x[k];
             }
         }
         // evaluate the AUC score
-        if ((fmod(t, paras->step_len) == 1.) && (paras->record_aucs == 1)) {
-            _evaluate_aucs(data, y_pred, re, start_time);
+        if ((paras->record_aucs == 1) && _eval_due(ev, t, paras->step_len, fmod(t, paras->step_len) == 1.)) {
+            _spam_flush(lazy, wt, re->wt);
+            _eval_aucs(ev, re->wt, NULL, 0, re, start_time);
         }
         // at the end of each epoch, we check the early stop condition.
         re->total_iterations++;
-        if (t % data->n == 0) {
+        if (_stop_check_due(sc, t)) {
             re->total_epochs++;
-            double norm_wt = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-            cblas_daxpy(data->p, -1., re->wt, 1, re->wt_prev, 1);
-            double norm_diff = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-            if (norm_wt > 0.0 && (norm_diff / norm_wt <= paras->stop_eps)) {
-                if (paras->verbose > 0) {
-                    printf("early stop at: %d-th epoch where maximal epoch is: %d\n",
-                           t / data->n, paras->num_passes);
-                }
-                break;
-            }
+            _spam_flush(lazy, wt, re->wt);
+            if (_stop_check(sc, re->wt, re, data->p)) { break; }
+        }
+        if (_stop_snap_due(sc, t)) { // wt_prev is only read at the end of an epoch.
+            if (is_lazy || is_l2) { _spam_flush(lazy, wt, re->wt); }
+            memcpy(re->wt_prev, re->wt, sizeof(double) * (data->p));
         }
-        memcpy(re->wt_prev, re->wt, sizeof(double) * (data->p));
+    }
+    _spam_flush(lazy, wt, re->wt);
+    if (is_lazy) { free_lazy_prox(lazy); } else { free_scaled_vector(wt); }
+    if (xt_posi != NULL) {
+        free(xt_posi);
+        free(xt_nega);
     }
     cblas_dscal(re->auc_len, 1. / CLOCKS_PER_SEC, re->rts, 1);
-    free(y_pred);
+    log_flush();
+    free_stop_criteria(sc);
+    free_evaluator(ev);
     free(nega_x);
     free(posi_x);
     free(grad_wt);
@@ -712,13 +1712,14 @@ void _algo_fsauc(Data *data, GlobalParas *paras, AlgoResults *re,
     double *v = malloc(sizeof(double) * (data->p + 2));
     double *vd = malloc(sizeof(double) * (data->p + 2)), ad;
     double *tmp_proj = malloc(sizeof(double) * data->p), beta_new;
-    double *y_pred = calloc((size_t) data->n, sizeof(double));
+    Evaluator *ev = make_evaluator(data, paras);
+    StopCriteria *sc = make_stop_criteria(paras, data->n);
     for (int k = 0; k < m; k++) {
         memset(v_sum, 0, sizeof(double) * (data->p + 2));
         memcpy(v, v_1, sizeof(double) * (data->p + 2));
         alpha = alpha_1;
         for (int kk = 0; kk < n_0; kk++) {
-            int ind = (k * n_0 + kk) % data->n;
+            int ind = _row(data, (k * n_0 + kk) % data->n);
             double is_posi_y = is_posi(data->y_tr[ind]);
             double is_nega_y = is_nega(data->y_tr[ind]);
             const int *xt_inds;
@@ -748,7 +1749,7 @@ void _algo_fsauc(Data *data, GlobalParas *paras, AlgoResults *re,
                     gd[xt_inds[tt]] = weight * xt_vals[tt];
                 }
             } else {
-                xt = data->x_tr_vals + ind * data->p;
+                xt = data->x_tr_vals + (size_t) ind * data->p;
                 xtw = cblas_ddot(data->p, xt, 1, v, 1);
                 cblas_daxpy(data->p, is_posi_y, xt, 1, sx_pos, 1);
                 cblas_daxpy(data->p, is_nega_y, xt, 1, sx_neg, 1);
@@ -792,26 +1793,19 @@ void _algo_fsauc(Data *data, GlobalParas *paras, AlgoResults *re,
             cblas_dscal(data->p + 2, 1. / (kk + 1.), v_ave, 1);
             t++;
             // to calculate AUC score
-            if ((fmod(t, paras->step_len) == 1.) && (paras->record_aucs == 1)) {
+            if ((paras->record_aucs == 1) && _eval_due(ev, t, paras->step_len, fmod(t, paras->step_len) == 1.)) {
                 memcpy(re->wt, v_ave, sizeof(double) * (data->p));
-                _evaluate_aucs(data, y_pred, re, start_time);
+                _eval_aucs(ev, re->wt, NULL, 0, re, start_time);
             }
             // at the end of each epoch, we check the early stop condition.
             re->total_iterations++;
-            if (t % data->n == 0) {
+            if (_stop_check_due(sc, t)) {
                 re->total_epochs++;
-                double norm_wt = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-                cblas_daxpy(data->p, -1., re->wt, 1, re->wt_prev, 1);
-                double norm_diff = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-                if (norm_wt > 0.0 && (norm_diff / norm_wt <= paras->stop_eps)) {
-                    if (paras->verbose > 0) {
-                        printf("early stop at: %d-th epoch where maximal epoch is: %d\n",
-                               (int) t / data->n, paras->num_passes);
-                    }
-                    break;
-                }
+                if (_stop_check(sc, re->wt, re, data->p)) { break; }
+            }
+            if (_stop_snap_due(sc, t)) { // wt_prev is only read at the end of an epoch.
+                memcpy(re->wt_prev, v_ave, sizeof(double) * (data->p));
             }
-            memcpy(re->wt_prev, v_ave, sizeof(double) * (data->p));
         }
         para_r = para_r / 2.;
         double tmp1 = 12. * sqrt(2.) * (2. + sqrt(2. * log(12. / delta))) * R;
@@ -837,7 +1831,9 @@ void _algo_fsauc(Data *data, GlobalParas *paras, AlgoResults *re,
     }
     memcpy(re->wt, v_ave, sizeof(double) * data->p);
     cblas_dscal(re->auc_len, 1. / CLOCKS_PER_SEC, re->rts, 1);
-    free(y_pred);
+    log_flush();
+    free_stop_criteria(sc);
+    free_evaluator(ev);
     free(tmp_proj);
     free(vd);
     free(v);
@@ -851,19 +1847,287 @@ void _algo_fsauc(Data *data, GlobalParas *paras, AlgoResults *re,
     free(v_1);
 }
 
+/** utw = <wt, posi_x> and vtw = <wt, nega_x> for a wt supported on supp, O(|supp|). */
+static void _proj_dots_support(const double *wt, const int *supp, int supp_size,
+                               const double *posi_x, const double *nega_x, double *utw, double *vtw) {
+    *utw = 0.0, *vtw = 0.0;
+    for (int kk = 0; kk < supp_size; kk++) {
+        *utw += wt[supp[kk]] * posi_x[supp[kk]];
+        *vtw += wt[supp[kk]] * nega_x[supp[kk]];
+    }
+}
+
+/** <x, wt> for a wt supported on supp, O(|supp|). */
+static inline double _dot_support(const double *x, const double *wt, const int *supp, int supp_size) {
+    double dot = 0.0;
+    for (int kk = 0; kk < supp_size; kk++) {
+        dot += x[supp[kk]] * wt[supp[kk]];
+    }
+    return dot;
+}
+
+/** the inputs of the gradient of an SHT-AUC block, which are shared by the threads of the run. */
+typedef struct {
+    const Data *data;
+    const double *wt;
+    const int *supp;    // the dots of dense samples are only taken over supp if it is not NULL.
+    int supp_size;
+    int version;
+    int first;          // position of the first sample of the block.
+    int len;            // number of samples of the block.
+    double prob_p;
+    double utw;
+    double vtw;
+    double *wei;        // the gradient of sample kk is wei[kk] * x_kk, len of them.
+    double *terms;      // its terms of the coefficients of var, posi_x and nega_x, 3 * len of them.
+} ShtBlock;
+
+/** wei and terms of the samples [start, end) of the block. */
+static void _sht_block_weights(const ShtBlock *blk, int start, int end) {
+    const Data *data = blk->data;
+    double prob_p = blk->prob_p, utw = blk->utw, vtw = blk->vtw;
+    for (int kk = start; kk < end; kk++) {
+        int ind = _row(data, blk->first + kk);
+        double xtw = 0.0, wei_x = 0.0, *terms = blk->terms + 3 * kk;
+        terms[0] = 0.0, terms[1] = 0.0, terms[2] = 0.0;
+        if (data->is_sparse) {
+            const int *xt_inds = data->x_tr_inds + data->x_tr_poss[ind];
+            const double *xt_vals = data->x_tr_vals + data->x_tr_poss[ind];
+            for (int tt = 0; tt < data->x_tr_lens[ind]; tt++) {
+                xtw += (blk->wt[xt_inds[tt]] * xt_vals[tt]);
+            }
+        } else {
+            const double *xt = data->x_tr_vals + (size_t) ind * data->p;
+            xtw = blk->supp != NULL ? _dot_support(xt, blk->wt, blk->supp, blk->supp_size) :
+                  cblas_ddot(data->p, blk->wt, 1, xt, 1);
+        }
+        switch (blk->version) {
+            case 0:
+                terms[0] = 1 + vtw - utw;
+                if (data->y_tr[ind] > 0) {
+                    wei_x = 2. * (1 - prob_p) * (xtw - utw);
+                    terms[1] = -wei_x;
+                } else {
+                    wei_x = 2. * prob_p * (xtw - vtw);
+                    terms[2] = -wei_x;
+                }
+                break;
+            case 1:
+                wei_x = data->y_tr[ind] > 0 ? 2. * (1.0 - prob_p) * (xtw - utw) -
+                                              2. * (1.0 + (vtw - utw)) * (1.0 - prob_p) :
+                        2.0 * prob_p * (xtw - vtw) + 2.0 * (1.0 + (vtw - utw)) * prob_p;
+                break;
+            case 2:
+                if (data->y_tr[ind] > 0) {
+                    wei_x = 2. * (1. - prob_p) * (xtw - vtw - 1.0);
+                    terms[1] = 2. * (1. - prob_p) * utw - 2. * prob_p * (1. - prob_p) * (utw - vtw);
+                    terms[2] = -2. * (1. - prob_p) * xtw + 2. * prob_p * (1. - prob_p) * (utw - vtw);
+                } else {
+                    wei_x = 2. * prob_p * (xtw - utw + 1.0);
+                    terms[1] = -2. * prob_p * xtw + 2. * prob_p * (1. - prob_p) * (vtw - utw);
+                    terms[2] = 2. * prob_p * vtw - 2. * prob_p * (1. - prob_p) * (vtw - utw);
+                }
+                break;
+            default:
+                break;
+        }
+        blk->wei[kk] = wei_x;
+    }
+}
+
+/** sums[0], sums[1] and sums[2] += the coefficients of var, posi_x and nega_x over the block. */
+static void _sht_block_sums(const ShtBlock *blk, double *sums) {
+    double wei_var = 0.0, sum_wei_posi = 0.0, sum_wei_nega = 0.0;
+    for (int kk = 0; kk < blk->len; kk++) {
+        wei_var += blk->terms[3 * kk];
+        sum_wei_posi += blk->terms[3 * kk + 1];
+        sum_wei_nega += blk->terms[3 * kk + 2];
+    }
+    sums[0] += wei_var, sums[1] += sum_wei_posi, sums[2] += sum_wei_nega;
+}
+
+/**
+ * Add the gradients wei[kk] * x_kk of the block to the coordinates [j_start, j_end)
+ * of grad for dense data. Sparse samples are added whole, to grad_sa if it is not
+ * NULL. Every coordinate is summed in the order of the samples, so a split of the
+ * coordinates across threads gives the same bits as one thread.
+ */
+static void _sht_block_accum(const ShtBlock *blk, int j_start, int j_end, double *grad, SparseAccum *grad_sa) {
+    const Data *data = blk->data;
+    for (int kk = 0; kk < blk->len; kk++) {
+        int ind = _row(data, blk->first + kk);
+        double wei_x = blk->wei[kk];
+        if (!data->is_sparse) { // a plain loop, which rounds the same on any part of the vector.
+            const double *xt = data->x_tr_vals + (size_t) ind * data->p;
+            for (int j = j_start; j < j_end; j++) { grad[j] += wei_x * xt[j]; }
+            continue;
+        }
+        const int *xt_inds = data->x_tr_inds + data->x_tr_poss[ind];
+        const double *xt_vals = data->x_tr_vals + data->x_tr_poss[ind];
+        if (grad_sa != NULL) {
+            for (int tt = 0; tt < data->x_tr_lens[ind]; tt++) {
+                _sa_add(grad_sa, xt_inds[tt], wei_x * xt_vals[tt]);
+            }
+        } else {
+            for (int tt = 0; tt < data->x_tr_lens[ind]; tt++) {
+                grad[xt_inds[tt]] += (wei_x * xt_vals[tt]);
+            }
+        }
+    }
+}
+
+/**
+ * Add the gradient of the block to grad, or to grad_sa if it is not NULL (sparse
+ * data only), and its coefficients of var, posi_x and nega_x to sums[0], sums[1]
+ * and sums[2].
+ */
+static void _sht_block_grad(const ShtBlock *blk, double *grad, SparseAccum *grad_sa, double *sums) {
+    _sht_block_weights(blk, 0, blk->len);
+    _sht_block_sums(blk, sums);
+    _sht_block_accum(blk, 0, blk->data->p, grad, grad_sa);
+}
+
+/** the index of thread ti of an ShtPool. */
+typedef struct {
+    struct ShtPool *pool;
+    int ti;
+} ShtPart;
+
+/**
+ * The threads of one SHT-AUC run, started once and reused by all the blocks.
+ * A block takes two rounds: in the first, thread ti takes the weights of the
+ * samples [ti * len / T, (ti + 1) * len / T), in the second, the coordinates
+ * [ti * p / T, (ti + 1) * p / T) of the dense gradient. The calling thread is
+ * thread 0. Each sample and each coordinate is handled as in _sht_block_grad,
+ * so a run gives the same bits for any number of threads.
+ */
+typedef struct ShtPool {
+    const ShtBlock *blk;    // the current block, NULL to stop the threads.
+    int round;              // 0: the weights, 1: the dense gradient.
+    double *grad;           // the gradient of round 1.
+    int num_threads;
+    int num_started;        // the threads other than the calling one.
+    int num_done;
+    long generation;        // incremented for every round.
+    ShtPart *parts;
+    pthread_t *threads;
+    pthread_mutex_t lock;
+    pthread_cond_t block_ready;
+    pthread_cond_t block_done;
+} ShtPool;
+
+static inline int _sht_part_start(int len, int ti, int num_threads) {
+    return (int) ((long) len * ti / num_threads);
+}
+
+/** the part of thread ti in the current round of pool. */
+static void _sht_pool_part(const ShtPool *pool, const ShtBlock *blk, int ti) {
+    if (pool->round == 0) {
+        _sht_block_weights(blk, _sht_part_start(blk->len, ti, pool->num_threads),
+                           _sht_part_start(blk->len, ti + 1, pool->num_threads));
+    } else {
+        _sht_block_accum(blk, _sht_part_start(blk->data->p, ti, pool->num_threads),
+                         _sht_part_start(blk->data->p, ti + 1, pool->num_threads), pool->grad, NULL);
+    }
+}
+
+static void *_sht_worker(void *arg) {
+    ShtPart *part = arg;
+    ShtPool *pool = part->pool;
+    long generation = 0;
+    while (true) {
+        pthread_mutex_lock(&pool->lock);
+        while (pool->generation == generation) { pthread_cond_wait(&pool->block_ready, &pool->lock); }
+        generation = pool->generation;
+        const ShtBlock *blk = pool->blk;
+        pthread_mutex_unlock(&pool->lock);
+        if (blk == NULL) { break; }
+        _sht_pool_part(pool, blk, part->ti);
+        pthread_mutex_lock(&pool->lock);
+        if (++pool->num_done == pool->num_started) { pthread_cond_signal(&pool->block_done); }
+        pthread_mutex_unlock(&pool->lock);
+    }
+    log_flush(); // the ring of this thread is gone with it.
+    return NULL;
+}
+
+static ShtPool *_make_sht_pool(int num_threads) {
+    ShtPool *pool = calloc(1, sizeof(ShtPool));
+    pool->parts = calloc((size_t) num_threads, sizeof(ShtPart));
+    pool->threads = malloc(sizeof(pthread_t) * num_threads);
+    pthread_mutex_init(&pool->lock, NULL);
+    pthread_cond_init(&pool->block_ready, NULL);
+    pthread_cond_init(&pool->block_done, NULL);
+    for (int ti = 1; ti < num_threads; ti++) {
+        ShtPart *part = pool->parts + ti;
+        part->pool = pool, part->ti = ti;
+        if (pthread_create(&pool->threads[pool->num_started], NULL, _sht_worker, part) != 0) { break; }
+        pool->num_started++;
+    }
+    // the workers only read it once the first block is posted.
+    pool->num_threads = pool->num_started + 1;
+    if (pool->num_threads < num_threads) {
+        log_warn("only %d of %d threads could be started.\n", pool->num_threads, num_threads);
+    }
+    return pool;
+}
+
+static void _free_sht_pool(ShtPool *pool) {
+    pthread_mutex_lock(&pool->lock);
+    pool->blk = NULL, pool->generation++;
+    pthread_cond_broadcast(&pool->block_ready);
+    pthread_mutex_unlock(&pool->lock);
+    for (int ti = 0; ti < pool->num_started; ti++) {
+        pthread_join(pool->threads[ti], NULL);
+    }
+    pthread_cond_destroy(&pool->block_done);
+    pthread_cond_destroy(&pool->block_ready);
+    pthread_mutex_destroy(&pool->lock);
+    free(pool->threads);
+    free(pool->parts);
+    free(pool);
+}
+
+/** run a round of blk on all the threads of pool. */
+static void _sht_pool_round(ShtPool *pool, const ShtBlock *blk, int round, double *grad) {
+    pthread_mutex_lock(&pool->lock);
+    pool->blk = blk, pool->round = round, pool->grad = grad, pool->num_done = 0, pool->generation++;
+    pthread_cond_broadcast(&pool->block_ready);
+    pthread_mutex_unlock(&pool->lock);
+    _sht_pool_part(pool, blk, 0);
+    pthread_mutex_lock(&pool->lock);
+    while (pool->num_done < pool->num_started) { pthread_cond_wait(&pool->block_done, &pool->lock); }
+    pthread_mutex_unlock(&pool->lock);
+}
+
+/** the same as _sht_block_grad, with the work split across the threads of pool. */
+static void _sht_pool_grad(ShtPool *pool, const ShtBlock *blk, double *grad, SparseAccum *grad_sa, double *sums) {
+    _sht_pool_round(pool, blk, 0, NULL);
+    _sht_block_sums(blk, sums);
+    if (blk->data->is_sparse) { // O(nnz) of the block, as much as its dots.
+        _sht_block_accum(blk, 0, blk->data->p, grad, grad_sa);
+    } else {
+        _sht_pool_round(pool, blk, 1, grad);
+    }
+}
+
 void _algo_sht_auc(Data *data, GlobalParas *paras, AlgoResults *re,
                    int version, int operator_id, int para_s, int para_b, double para_c, double para_l2_reg) {
 
-    srand((int) lrand48());
+    unsigned short rng[3];
+    _rng_init(rng, paras);
     double start_time = clock();
     openblas_set_num_threads(1);
 
     double *posi_x = calloc((size_t) data->p, sizeof(double)); // E[x|y=1]
     double *nega_x = calloc((size_t) data->p, sizeof(double)); // E[x|y=-1]
-    double *y_pred = calloc((size_t) data->n, sizeof(double)); // y_predication
+    Evaluator *ev = make_evaluator(data, paras);
+    StopCriteria *sc = make_stop_criteria(paras, data->n / para_b);
     double *grad_wt = calloc((size_t) data->p, sizeof(double)); // gradient
+    // the gradient of version 1 on sparse data only touches the block's nonzeros.
+    bool use_accum = data->is_sparse && version == 1;
+    SparseAccum *grad_sa = make_sparse_accum(data->p); // also keeps the graph projection.
     double *var = calloc((size_t) data->p, sizeof(double));
-    double *tmp = calloc((size_t) data->p, sizeof(double));
 
     double posi_t = 0.0;
     double nega_t = 0.0;
@@ -875,291 +2139,452 @@ void _algo_sht_auc(Data *data, GlobalParas *paras, AlgoResults *re,
     memcpy(var, nega_x, sizeof(double) * data->p);
     cblas_daxpy(data->p, -1.0, posi_x, 1, var, 1);
     cblas_dscal(data->p, 2.0 * prob_p * (1.0 - prob_p), var, 1);
+    // wt = scale * re->wt, the scale is folded back after each projection.
+    ScaledVector *wt = make_scaled_vector(data->p, re->wt);
+    // the support of wt after the projection, NULL before the first one.
+    bool is_track = paras->track_support == 1;
+    HTWorkspace *ht_ws = make_ht_workspace(data->p, para_s);
+    const int *supp = NULL;
+    int supp_size = 0;
+    // wt lives on the support of its projection, so utw and vtw are recomputed over it in O(s).
+    double utw = 0.0, vtw = 0.0;
+    // the weights of the samples of a block, the last block is the largest.
+    double *blk_wei = malloc(sizeof(double) * (para_b + data->n % para_b));
+    double *blk_terms = malloc(sizeof(double) * 3 * (para_b + data->n % para_b));
+    // the gradient of a block is split across the threads, there is no point in more threads than samples.
+    int num_threads = min(paras->num_threads, para_b);
+    ShtPool *pool = num_threads > 1 ? _make_sht_pool(num_threads) : NULL;
     for (int t = 1; t <= total_blocks; t++) { // for each block
         // block bi is in [min_b_ind,max_b_ind-1]
-        int bi = (int) (lrand48() % (max_b_ind - min_b_ind));
-        double utw = cblas_ddot(data->p, re->wt, 1, posi_x, 1);
-        double vtw = cblas_ddot(data->p, re->wt, 1, nega_x, 1);
+        int bi = (int) (nrand48(rng) % (max_b_ind - min_b_ind));
+        if (supp == NULL) {
+            utw = cblas_ddot(data->p, re->wt, 1, posi_x, 1);
+            vtw = cblas_ddot(data->p, re->wt, 1, nega_x, 1);
+        }
         // the gradient of a block training samples
-        memset(grad_wt, 0, sizeof(double) * data->p);
+        if (!use_accum) { memset(grad_wt, 0, sizeof(double) * data->p); }
         // take care of the last block
         int cur_b_size = (bi == (max_b_ind - 1) ? para_b + (data->n % para_b) : para_b);
-        // for each block of training samples
-        for (int kk = 0; kk < cur_b_size; kk++) {
-            int ind = bi * para_b + kk; // initial position of block bi
-            double weight, wei_x, wei_posi, wei_nega;
-            if (data->is_sparse) {
-                double xtw = 0.0;
-                const int *xt_inds = NULL;
-                const double *xt_vals = NULL;
-                xt_inds = data->x_tr_inds + data->x_tr_poss[ind];
-                xt_vals = data->x_tr_vals + data->x_tr_poss[ind];
-                for (int tt = 0; tt < data->x_tr_lens[ind]; tt++) {
-                    xtw += (re->wt[xt_inds[tt]] * xt_vals[tt]);
-                }
-                switch (version) {
-                    case 0:
-                        memcpy(tmp, var, sizeof(double) * data->p);
-                        cblas_dscal(data->p, 1 + vtw - utw, tmp, 1);
-                        if (data->y_tr[ind] > 0) {
-                            double part_wei = 2. * (1 - prob_p) * (xtw - utw);
-                            for (int tt = 0; tt < data->x_tr_lens[ind]; tt++) {
-                                tmp[xt_inds[tt]] += part_wei * xt_vals[tt];
-                            }
-                            cblas_daxpy(data->p, -part_wei, posi_x, 1, tmp, 1);
-                        } else {
-                            double part_wei = 2. * prob_p * (xtw - vtw);
-                            for (int tt = 0; tt < data->x_tr_lens[ind]; tt++) {
-                                tmp[xt_inds[tt]] += part_wei * xt_vals[tt];
-                            }
-                            cblas_daxpy(data->p, -part_wei, nega_x, 1, tmp, 1);
-                        }
-                        // calculate the gradient
-                        cblas_daxpy(data->p, 1., tmp, 1, grad_wt, 1);
-                        break;
-                    case 1:
-                        weight = data->y_tr[ind] > 0 ? 2. * (1.0 - prob_p) * (xtw - utw) -
-                                                       2. * (1.0 + (vtw - utw)) * (1.0 - prob_p) :
-                                 2.0 * prob_p * (xtw - vtw) + 2.0 * (1.0 + (vtw - utw)) * prob_p;
-                        // calculate the gradient
-                        for (int tt = 0; tt < data->x_tr_lens[ind]; tt++)
-                            grad_wt[xt_inds[tt]] += (weight * xt_vals[tt]); // calculate the gradient for xi
-                        break;
-                    case 2:
-                        if (data->y_tr[ind] > 0) {
-                            wei_x = 2. * (1. - prob_p) * (xtw - vtw - 1.0);
-                            wei_posi = 2. * (1. - prob_p) * utw - 2. * prob_p * (1. - prob_p) * (utw - vtw);
-                            wei_nega = -2. * (1. - prob_p) * xtw + 2. * prob_p * (1. - prob_p) * (utw - vtw);
-                        } else {
-                            wei_x = 2. * prob_p * (xtw - utw + 1.0);
-                            wei_posi = -2. * prob_p * xtw + 2. * prob_p * (1. - prob_p) * (vtw - utw);
-                            wei_nega = 2. * prob_p * vtw - 2. * prob_p * (1. - prob_p) * (vtw - utw);
-                        }
-                        // calculate the gradient
-                        for (int tt = 0; tt < data->x_tr_lens[ind]; tt++) {
-                            grad_wt[xt_inds[tt]] += (wei_x * xt_vals[tt]);
-                        }
-                        cblas_daxpy(data->p, wei_posi, posi_x, 1, grad_wt, 1);
-                        cblas_daxpy(data->p, wei_nega, nega_x, 1, grad_wt, 1);
-                    default:
-                        break;
-                }
-
-            } else {
-                const double *cur_xt = NULL;
-                cur_xt = data->x_tr_vals + ind * data->p;
-                double xtw = cblas_ddot(data->p, re->wt, 1, cur_xt, 1);
-                switch (version) {
-                    case 0:
-                        memcpy(tmp, var, sizeof(double) * data->p);
-                        cblas_dscal(data->p, 1 + vtw - utw, tmp, 1);
-                        if (data->y_tr[ind] > 0) {
-                            double part_wei = 2. * (1 - prob_p) * (xtw - utw);
-                            cblas_daxpy(data->p, part_wei, cur_xt, 1, tmp, 1);
-                            cblas_daxpy(data->p, -part_wei, posi_x, 1, tmp, 1);
-                        } else {
-                            double part_wei = 2. * prob_p * (xtw - vtw);
-                            cblas_daxpy(data->p, part_wei, cur_xt, 1, tmp, 1);
-                            cblas_daxpy(data->p, -part_wei, nega_x, 1, tmp, 1);
-                        }
-                        // calculate the gradient
-                        cblas_daxpy(data->p, 1., tmp, 1, grad_wt, 1);
-                        break;
-                    case 1:
-                        weight = data->y_tr[ind] > 0 ? 2. * (1.0 - prob_p) * (xtw - utw) -
-                                                       2. * (1.0 + (vtw - utw)) * (1.0 - prob_p) :
-                                 2.0 * prob_p * (xtw - vtw) + 2.0 * (1.0 + (vtw - utw)) * prob_p;
-                        cblas_daxpy(data->p, weight, cur_xt, 1, grad_wt, 1); // calculate the gradient
-                        break;
-                    case 2:
-                        if (data->y_tr[ind] > 0) {
-                            wei_x = 2. * (1. - prob_p) * (xtw - vtw - 1.0);
-                            wei_posi = 2. * (1. - prob_p) * utw - 2. * prob_p * (1. - prob_p) * (utw - vtw);
-                            wei_nega = -2. * (1. - prob_p) * xtw + 2. * prob_p * (1. - prob_p) * (utw - vtw);
-                        } else {
-                            wei_x = 2. * prob_p * (xtw - utw + 1.0);
-                            wei_posi = -2. * prob_p * xtw + 2. * prob_p * (1. - prob_p) * (vtw - utw);
-                            wei_nega = 2. * prob_p * vtw - 2. * prob_p * (1. - prob_p) * (vtw - utw);
-                        }
-                        // calculate the gradient
-                        cblas_daxpy(data->p, wei_x, cur_xt, 1, grad_wt, 1);
-                        cblas_daxpy(data->p, wei_posi, posi_x, 1, grad_wt, 1);
-                        cblas_daxpy(data->p, wei_nega, nega_x, 1, grad_wt, 1);
-                        break;
-                    default:
-                        break;
-                }
-            }
+        ShtBlock blk = {.data = data, .wt = re->wt, .supp = is_track ? supp : NULL, .supp_size = supp_size,
+                        .version = version, .first = bi * para_b, .len = cur_b_size,
+                        .prob_p = prob_p, .utw = utw, .vtw = vtw, .wei = blk_wei, .terms = blk_terms};
+        // the coefficients of var, posi_x and nega_x are summed over the block.
+        double sums[3] = {0.0, 0.0, 0.0};
+        if (pool != NULL) {
+            _sht_pool_grad(pool, &blk, grad_wt, use_accum ? grad_sa : NULL, sums);
+        } else {
+            _sht_block_grad(&blk, grad_wt, use_accum ? grad_sa : NULL, sums);
         }
+        // the mean terms of versions 0 and 2, once per block.
+        if (sums[0] != 0.0) { cblas_daxpy(data->p, sums[0], var, 1, grad_wt, 1); }
+        if (sums[1] != 0.0) { cblas_daxpy(data->p, sums[1], posi_x, 1, grad_wt, 1); }
+        if (sums[2] != 0.0) { cblas_daxpy(data->p, sums[2], nega_x, 1, grad_wt, 1); }
         // wt = wt - eta * grad(wt)
-        cblas_daxpy(data->p, -para_c / cur_b_size, grad_wt, 1, re->wt, 1);
+        if (use_accum) {
+            for (int kk = 0; kk < grad_sa->num_touched; kk++) {
+                int j = grad_sa->touched[kk];
+                _sv_add(wt, j, -para_c / cur_b_size * grad_sa->vals[j]);
+            }
+            _sa_clear(grad_sa);
+        } else {
+            _sv_axpy(wt, -para_c / cur_b_size, grad_wt);
+        }
         // ell_2 reg. we do not need it in our case.
         if (para_l2_reg != 0.0) {
-            cblas_dscal(data->p, 1. / (para_c * para_l2_reg + 1.), re->wt, 1);
+            _sv_scale(wt, 1. / (para_c * para_l2_reg + 1.));
         }
         if (operator_id == 0) {
-            // k-sparse projection step.
-            _hard_thresholding(re->wt, data->p, para_s);
+            // k-sparse projection step, |u| has the same order as |wt|.
+            supp_size = _hard_thresholding_ws(ht_ws, wt->u);
+            supp = ht_ws->supp;
+            if (is_track) { _sv_renorm_support(wt, supp, supp_size); } else { _sv_renorm(wt); }
         } else if (operator_id == 1) {
             // to do graph projection.
+            _sv_renorm(wt);
             double total_prizes = 0.0;
             for (int kk = 0; kk < data->p; kk++) {
                 data->proj_prizes[kk] = re->wt[kk] * re->wt[kk];
                 total_prizes += data->proj_prizes[kk];
             }
             if (total_prizes >= 1e6) {
-                printf("not good, large prizes detected.");
+                log_warn("not good, large prizes detected.\n");
             }
             int s_low = para_s, s_high = para_s + 2;
             head_tail_binsearch(data->edges, data->weights, data->proj_prizes,
                                 data->p, data->m, data->g, -1, s_low, s_high,
                                 20, GWPruning, 0, data->graph_stat);
-            memcpy(grad_wt, re->wt, sizeof(double) * data->p);
-            memset(re->wt, 0, sizeof(double) * data->p);
+            // keep the values on the returned nodes, then zero out the rest.
             for (int kk = 0; kk < data->graph_stat->re_nodes->size; kk++) {
                 int cur_node = data->graph_stat->re_nodes->array[kk];
-                re->wt[cur_node] = grad_wt[cur_node];
+                if (!grad_sa->is_touched[cur_node]) { _sa_add(grad_sa, cur_node, re->wt[cur_node]); }
+            }
+            memset(re->wt, 0, sizeof(double) * data->p);
+            for (int kk = 0; kk < grad_sa->num_touched; kk++) {
+                int cur_node = grad_sa->touched[kk];
+                re->wt[cur_node] = grad_sa->vals[cur_node];
             }
+            _sa_clear(grad_sa);
+            supp = data->graph_stat->re_nodes->array;
+            supp_size = data->graph_stat->re_nodes->size;
         }
-        if (paras->record_aucs == 1) { // to evaluate AUC score
-            _evaluate_aucs(data, y_pred, re, start_time);
+        if (supp != NULL) {
+            _proj_dots_support(re->wt, supp, supp_size, posi_x, nega_x, &utw, &vtw);
+        }
+        if ((paras->record_aucs == 1) && _eval_due(ev, t, 1, true)) { // to evaluate AUC score
+            _eval_aucs(ev, re->wt, is_track ? supp : NULL, supp_size, re, start_time);
         }
         // at the end of each epoch, we check the early stop condition.
         re->total_iterations++;
-        if (t % (data->n / para_b) == 0) {
+        if (_stop_check_due(sc, t)) {
             re->total_epochs++;
-            double norm_wt = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-            cblas_daxpy(data->p, -1., re->wt, 1, re->wt_prev, 1);
-            double norm_diff = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-            if (norm_wt > 0.0 && (norm_diff / norm_wt <= paras->stop_eps)) {
-                if (paras->verbose > 0) {
-                    printf("early stop at: %d-th epoch where maximal epoch is: %d\n",
-                           t / data->n, paras->num_passes);
-                }
-                break;
-            }
+            if (_stop_check(sc, re->wt, re, data->p)) { break; }
+        }
+        if (_stop_snap_due(sc, t)) { // wt_prev is only read at the end of an epoch.
+            memcpy(re->wt_prev, re->wt, sizeof(double) * (data->p));
         }
-        memcpy(re->wt_prev, re->wt, sizeof(double) * (data->p));
     }
     cblas_dscal(re->auc_len, 1. / CLOCKS_PER_SEC, re->rts, 1);
+    log_flush();
+    if (pool != NULL) { _free_sht_pool(pool); }
+    free(blk_terms);
+    free(blk_wei);
+    free_stop_criteria(sc);
+    free_scaled_vector(wt);
+    free_sparse_accum(grad_sa);
+    free_ht_workspace(ht_ws);
     free(var);
-    free(tmp);
-    free(y_pred);
+    free_evaluator(ev);
     free(nega_x);
     free(posi_x);
     free(grad_wt);
 }
 
+OpaucSketch *make_opauc_sketch(int p, int tau) {
+    OpaucSketch *sk = malloc(sizeof(OpaucSketch));
+    sk->v = calloc((size_t) p, sizeof(double));
+    sk->scale = 1.0;
+    for (int q = 0; q < 2; q++) {
+        sk->z[q] = calloc((size_t) p * tau, sizeof(double));
+        sk->s[q] = calloc((size_t) p, sizeof(double));
+        sk->coef[q] = 0.0, sk->vs[q] = 0.0;
+        sk->a[q] = calloc((size_t) tau, sizeof(double));
+        sk->zr[q] = calloc((size_t) tau, sizeof(double));
+        sk->zx[q] = calloc((size_t) tau, sizeof(double));
+        for (int o = 0; o < 2; o++) {
+            sk->ss[q][o] = 0.0;
+            sk->zs[q][o] = calloc((size_t) tau, sizeof(double));
+            sk->gram[q][o] = calloc((size_t) tau * tau, sizeof(double));
+        }
+    }
+    sk->u = calloc((size_t) tau, sizeof(double));
+    sk->p = p;
+    sk->tau = tau;
+    return sk;
+}
+
+bool free_opauc_sketch(OpaucSketch *sk) {
+    free(sk->u);
+    for (int q = 0; q < 2; q++) {
+        for (int o = 0; o < 2; o++) {
+            free(sk->gram[q][o]);
+            free(sk->zs[q][o]);
+        }
+        free(sk->zx[q]);
+        free(sk->zr[q]);
+        free(sk->a[q]);
+        free(sk->s[q]);
+        free(sk->z[q]);
+    }
+    free(sk->v);
+    free(sk);
+    return true;
+}
+
+/** r_j, O(1) */
+static inline double _sk_r_get(const OpaucSketch *sk, int j) {
+    return sk->scale * (sk->v[j] + sk->coef[0] * sk->s[0][j] + sk->coef[1] * sk->s[1][j]);
+}
+
+/** <s_q, r>, O(1) */
+static inline double _sk_sr(const OpaucSketch *sk, int q) {
+    return sk->scale * (sk->vs[q] + sk->coef[0] * sk->ss[q][0] + sk->coef[1] * sk->ss[q][1]);
+}
+
+/** v_j = v_j + delta, O(1) */
+static inline void _sk_v_add(OpaucSketch *sk, int j, double delta) {
+    sk->v[j] += delta;
+    sk->vs[0] += delta * sk->s[0][j];
+    sk->vs[1] += delta * sk->s[1][j];
+}
+
+/** r = r_0 with scale = 1 and coef = 0, where r_0 is given by v, O(p). */
+static void _sk_r_reset(OpaucSketch *sk) {
+    sk->scale = 1.0;
+    for (int q = 0; q < 2; q++) {
+        sk->coef[q] = 0.0;
+        sk->vs[q] = cblas_ddot(sk->p, sk->s[q], 1, sk->v, 1);
+    }
+}
+
+/** r = c * r, the scale is folded back into v once it falls below 1e-4, O(1) amortized. */
+static void _sk_r_scale(OpaucSketch *sk, double c) {
+    if (fabs(sk->scale * c) >= 1e-4) {
+        sk->scale *= c;
+        return;
+    }
+    for (int j = 0; j < sk->p; j++) {
+        sk->v[j] = c * _sk_r_get(sk, j);
+    }
+    _sk_r_reset(sk);
+}
+
+/** s_cl[j] = s_cl[j] + val with r unchanged, O(1). */
+static inline void _sk_sum_add(OpaucSketch *sk, int cl, int j, double val) {
+    int o = 1 - cl;
+    sk->vs[cl] += val * sk->v[j];
+    sk->ss[cl][o] += val * sk->s[o][j];
+    sk->ss[o][cl] = sk->ss[cl][o];
+    sk->ss[cl][cl] += val * (2. * sk->s[cl][j] + val);
+    sk->s[cl][j] += val;
+    _sk_v_add(sk, j, -sk->coef[cl] * val); // v absorbs the change of coef_cl * s_cl.
+}
+
+/** wt = r + Z_0 a_0 + Z_1 a_1, which is then folded into r, O(p * tau). */
+static void _opauc_sketch_sync(OpaucSketch *sk, double *wt) {
+    for (int j = 0; j < sk->p; j++) {
+        wt[j] = _sk_r_get(sk, j);
+    }
+    for (int q = 0; q < 2; q++) {
+        cblas_dgemv(CblasRowMajor, CblasNoTrans, sk->p, sk->tau, 1.,
+                    sk->z[q], sk->tau, sk->a[q], 1, 1.0, wt, 1);
+    }
+    memcpy(sk->v, wt, sizeof(double) * sk->p);
+    _sk_r_reset(sk);
+    for (int q = 0; q < 2; q++) {
+        memset(sk->a[q], 0, sizeof(double) * sk->tau);
+        cblas_dgemv(CblasRowMajor, CblasTrans, sk->p, sk->tau, 1.,
+                    sk->z[q], sk->tau, sk->v, 1, 0.0, sk->zr[q], 1);
+    }
+}
+
+/**
+ * Add a sample x of class cl to its sum s_cl and Z_cl = Z_cl + x g^T.
+ * Afterwards, zx holds Z_q^T x of the updated sketches. O(nnz * tau + tau^2).
+ */
+static void _opauc_sketch_update(OpaucSketch *sk, int cl, const int *xt_inds, const double *xt_vals,
+                                 int xt_len, const double *gaussian) {
+    int tau = sk->tau, o = 1 - cl;
+    double xx = 0.0, xr = 0.0, xs_cl = 0.0, xs_o = 0.0;
+    for (int q = 0; q < 2; q++) { memset(sk->zx[q], 0, sizeof(double) * tau); }
+    for (int tt = 0; tt < xt_len; tt++) {
+        int j = xt_inds[tt];
+        _sk_sum_add(sk, cl, j, xt_vals[tt]);
+        xx += xt_vals[tt] * xt_vals[tt];
+        xr += xt_vals[tt] * _sk_r_get(sk, j);
+        xs_cl += xt_vals[tt] * sk->s[cl][j];
+        xs_o += xt_vals[tt] * sk->s[o][j];
+        for (int q = 0; q < 2; q++) {
+            cblas_daxpy(tau, xt_vals[tt], sk->z[q] + (size_t) j * tau, 1, sk->zx[q], 1);
+        }
+    }
+    // w is unchanged: r = r - beta * x with beta = <g, a_cl>.
+    double beta = cblas_ddot(tau, gaussian, 1, sk->a[cl], 1);
+    for (int tt = 0; tt < xt_len; tt++) {
+        cblas_daxpy(tau, xt_vals[tt], gaussian, 1, sk->z[cl] + (size_t) xt_inds[tt] * tau, 1);
+        _sk_v_add(sk, xt_inds[tt], -beta * xt_vals[tt] / sk->scale);
+    }
+    // Z_cl'^T r' = Z_cl^T r + <x, r> g - beta * Z_cl^T x - beta * ||x||^2 g
+    cblas_daxpy(tau, -beta, sk->zx[cl], 1, sk->zr[cl], 1);
+    cblas_daxpy(tau, xr - beta * xx, gaussian, 1, sk->zr[cl], 1);
+    cblas_daxpy(tau, -beta, sk->zx[o], 1, sk->zr[o], 1);
+    // Z_cl'^T s_cl' = Z_cl^T s_cl + Z_cl^T x + <x, s_cl'> g
+    for (int q = 0; q < 2; q++) {
+        cblas_daxpy(tau, 1., sk->zx[q], 1, sk->zs[q][cl], 1);
+    }
+    cblas_daxpy(tau, xs_cl, gaussian, 1, sk->zs[cl][cl], 1);
+    cblas_daxpy(tau, xs_o, gaussian, 1, sk->zs[cl][o], 1);
+    // Z_cl'^T Z_cl' = Z_cl^T Z_cl + (Z_cl^T x) g^T + g (Z_cl^T x)^T + ||x||^2 g g^T
+    cblas_dger(CblasRowMajor, tau, tau, 1., sk->zx[cl], 1, gaussian, 1, sk->gram[cl][cl], tau);
+    cblas_dger(CblasRowMajor, tau, tau, 1., gaussian, 1, sk->zx[cl], 1, sk->gram[cl][cl], tau);
+    cblas_dger(CblasRowMajor, tau, tau, xx, gaussian, 1, gaussian, 1, sk->gram[cl][cl], tau);
+    cblas_dger(CblasRowMajor, tau, tau, 1., gaussian, 1, sk->zx[o], 1, sk->gram[cl][o], tau);
+    cblas_dger(CblasRowMajor, tau, tau, 1., sk->zx[o], 1, gaussian, 1, sk->gram[o][cl], tau);
+    cblas_daxpy(tau, xx, gaussian, 1, sk->zx[cl], 1);
+}
+
+/**
+ * The gradient step of sketched OPAUC against the other class o, i.e.,
+ *      w = w - eta * (lambda * w + sgn * (x - c_o) + (x - c_o) <x - c_o, w>
+ *                     + Z_o Z_o^T w / num_o + <w, c_o> ||h_o||^2 c_o),
+ * where c_o = s_o / num_o and sgn is -1 for a positive x and 1 for a negative
+ * one. It is applied to r, a_0, a_1 and the cached products, O(nnz + tau^2).
+ */
+static void _opauc_sketch_step(OpaucSketch *sk, int o, const int *xt_inds, const double *xt_vals,
+                               int xt_len, double num_o, double sq_h_o,
+                               double sgn, double eta, double lambda) {
+    int tau = sk->tau;
+    double xw = 0.0, cw = _sk_sr(sk, o);
+    for (int tt = 0; tt < xt_len; tt++) { xw += xt_vals[tt] * _sk_r_get(sk, xt_inds[tt]); }
+    memcpy(sk->u, sk->zr[o], sizeof(double) * tau); // u = Z_o^T w
+    for (int q = 0; q < 2; q++) {
+        xw += cblas_ddot(tau, sk->zx[q], 1, sk->a[q], 1);
+        cw += cblas_ddot(tau, sk->zs[q][o], 1, sk->a[q], 1);
+        cblas_dgemv(CblasRowMajor, CblasNoTrans, tau, tau, 1.,
+                    sk->gram[o][q], tau, sk->a[q], 1, 1.0, sk->u, 1);
+    }
+    cw /= num_o;
+    double shrink = 1. - eta * lambda;
+    double wei_x = -eta * (sgn + xw - cw);
+    double wei_c = eta * (sgn + xw - cw - cw * sq_h_o);
+    _sk_r_scale(sk, shrink);
+    for (int tt = 0; tt < xt_len; tt++) { _sk_v_add(sk, xt_inds[tt], wei_x * xt_vals[tt] / sk->scale); }
+    sk->coef[o] += wei_c / num_o / sk->scale;
+    for (int q = 0; q < 2; q++) {
+        cblas_dscal(tau, shrink, sk->zr[q], 1);
+        cblas_daxpy(tau, wei_x, sk->zx[q], 1, sk->zr[q], 1);
+        cblas_daxpy(tau, wei_c / num_o, sk->zs[q][o], 1, sk->zr[q], 1);
+        cblas_dscal(tau, shrink, sk->a[q], 1);
+    }
+    cblas_daxpy(tau, -eta / num_o, sk->u, 1, sk->a[o], 1);
+}
+
+/**
+ * Dense OPAUC keeps, for each class, the sum s = sum_i x_i and the raw second
+ * moment S = sum_i x_i x_i^T in packed upper-triangular storage, so that the
+ * center is c = s / num, the covariance is S / num - c c^T and neither needs to
+ * be rescaled. This adds a new sample x of this class to s and S, O(p^2 / 2).
+ */
+static void _opauc_dense_update(double *sum_x, double *sq_sum, const double *x, int p) {
+    cblas_daxpy(p, 1., x, 1, sum_x, 1);
+    cblas_dspr(CblasRowMajor, CblasUpper, p, 1., x, 1, sq_sum);
+}
+
+/**
+ * The gradient of dense OPAUC against the other class (sum s, second moment S):
+ *      grad = lambda * w + sgn * (x - c) + (x - c) <x - c, w> + (S / num - c c^T) w,
+ * where c = s / num and sgn is -1 for a positive x and 1 for a negative one.
+ * diff is a buffer of p.
+ */
+static void _opauc_dense_grad(double *grad, double *diff, const double *wt, const double *x,
+                              const double *sum_x, const double *sq_sum, double num,
+                              double sgn, double lambda, int p) {
+    memcpy(diff, x, sizeof(double) * p); // x - c
+    cblas_daxpy(p, -1. / num, sum_x, 1, diff, 1);
+    cblas_dspmv(CblasRowMajor, CblasUpper, p, 1. / num, sq_sum, wt, 1, 0.0, grad, 1);
+    cblas_daxpy(p, -cblas_ddot(p, sum_x, 1, wt, 1) / (num * num), sum_x, 1, grad, 1);
+    cblas_daxpy(p, sgn + cblas_ddot(p, diff, 1, wt, 1), diff, 1, grad, 1);
+    cblas_daxpy(p, lambda, wt, 1, grad, 1);
+}
+
 void _algo_opauc(Data *data, GlobalParas *paras, AlgoResults *re,
                  int para_tau, double para_eta, double para_lambda) {
 
-    srand((int) lrand48());
+    unsigned short rng[3];
+    _rng_init(rng, paras);
     double start_time = clock();
     openblas_set_num_threads(1);
 
     double num_p = 0.0;
     double num_n = 0.0;
-    double *center_p = calloc((size_t) data->p, sizeof(double));
-    double *center_n = calloc((size_t) data->p, sizeof(double));
-    double *h_center_p;
-    double *h_center_n;
-    double *z_p;
-    double *z_n; // sparse
-    double *cov_p, *cov_n, *tmp_mat; //non-sparse
+    // the centers are c = sum / num, so that a sample only changes nnz entries.
+    double *sum_p = calloc((size_t) data->p, sizeof(double));
+    double *sum_n = calloc((size_t) data->p, sizeof(double));
+    double *h_sum_p = NULL;
+    double *h_sum_n = NULL;
+    double *z_p = NULL;
+    double *z_n = NULL; // sparse
+    double *sq_p = NULL, *sq_n = NULL; // non-sparse, sum of x x^T, packed upper triangle.
+    // the sparse sketch mode only touches the rows of the sketches in a sample.
+    bool is_sketch = data->is_sparse && paras->lazy_update == 1;
+    OpaucSketch *sk = NULL;
     if (data->is_sparse) {
         // for sparse high-dimensional dataset
-        h_center_p = calloc((size_t) para_tau, sizeof(double));
-        h_center_n = calloc((size_t) para_tau, sizeof(double));
-        z_p = calloc((data->p * para_tau), sizeof(double));
-        z_n = calloc((data->p * para_tau), sizeof(double));
+        h_sum_p = calloc((size_t) para_tau, sizeof(double));
+        h_sum_n = calloc((size_t) para_tau, sizeof(double));
+        if (is_sketch) {
+            sk = make_opauc_sketch(data->p, para_tau);
+            memcpy(sk->v, re->wt, sizeof(double) * data->p);
+        } else {
+            z_p = calloc((data->p * para_tau), sizeof(double));
+            z_n = calloc((data->p * para_tau), sizeof(double));
+        }
     } else {
         // for non-sparse low-dimensional dataset
-        cov_p = calloc((data->p * data->p), sizeof(double));
-        cov_n = calloc((data->p * data->p), sizeof(double));
-        tmp_mat = calloc((data->p * data->p), sizeof(double));
+        sq_p = calloc(((size_t) data->p * (data->p + 1)) / 2, sizeof(double));
+        sq_n = calloc(((size_t) data->p * (data->p + 1)) / 2, sizeof(double));
     }
     double *grad_wt = malloc(sizeof(double) * data->p);
     double *tmp_vec = malloc(sizeof(double) * data->p);
-    double *y_pred = malloc(sizeof(double) * data->n);
+    Evaluator *ev = make_evaluator(data, paras);
+    StopCriteria *sc = make_stop_criteria(paras, data->n);
     double *xt = malloc(sizeof(double) * data->p);
     double *gaussian = malloc(sizeof(double) * para_tau);
-    if (paras->verbose > 0) { printf("%d %d\n", data->n, data->p); }
+    if (paras->verbose > 0) { log_info("%d %d\n", data->n, data->p); }
     for (int t = 0; t < data->n * paras->num_passes; t++) {
-        int cur_ind = t % data->n;
-        const int *xt_inds;
-        const double *xt_vals, *cur_x;
+        int cur_ind = _row(data, t % data->n);
+        const int *xt_inds = NULL;
+        const double *xt_vals = NULL, *cur_x = NULL;
         if (data->is_sparse) {
             xt_inds = data->x_tr_inds + data->x_tr_poss[cur_ind];
             xt_vals = data->x_tr_vals + data->x_tr_poss[cur_ind];
-            memset(xt, 0, sizeof(double) * data->p);
-            for (int tt = 0; tt < data->x_tr_lens[cur_ind]; tt++) {
-                xt[xt_inds[tt]] = xt_vals[tt];
+            if (!is_sketch) {
+                memset(xt, 0, sizeof(double) * data->p);
+                for (int tt = 0; tt < data->x_tr_lens[cur_ind]; tt++) {
+                    xt[xt_inds[tt]] = xt_vals[tt];
+                }
             }
-            std_normal(para_tau, gaussian);
+            std_normal(para_tau, gaussian, rng);
             cblas_dscal(para_tau, 1. / sqrt(para_tau * 1.), gaussian, 1);
         } else {
-            cur_x = data->x_tr_vals + cur_ind * data->p;
+            cur_x = data->x_tr_vals + (size_t) cur_ind * data->p;
         }
-        if (data->y_tr[cur_ind] > 0) {
+        if (is_sketch) {
+            int cl = data->y_tr[cur_ind] > 0 ? 0 : 1;
+            if (cl == 0) { num_p++; } else { num_n++; }
+            double num_o = (cl == 0) ? num_n : num_p;
+            double *h_sum_o = (cl == 0) ? h_sum_n : h_sum_p;
+            cblas_daxpy(para_tau, 1., gaussian, 1, (cl == 0) ? h_sum_p : h_sum_n, 1);
+            // the class sums are kept by the sketch.
+            _opauc_sketch_update(sk, cl, xt_inds, xt_vals, data->x_tr_lens[cur_ind], gaussian);
+            if (num_o > 0.0) {
+                double sq_h_o = cblas_ddot(para_tau, h_sum_o, 1, h_sum_o, 1) / (num_o * num_o);
+                _opauc_sketch_step(sk, 1 - cl, xt_inds, xt_vals, data->x_tr_lens[cur_ind], num_o,
+                                   sq_h_o, (cl == 0) ? -1. : 1., para_eta, para_lambda);
+            }
+        } else if (data->y_tr[cur_ind] > 0) {
             num_p++;
             if (data->is_sparse) {
-                // update center_p
-                cblas_dscal(data->p, (num_p - 1.) / num_p, center_p, 1);
-                for (int tt = 0; tt < data->x_tr_lens[cur_ind]; tt++) {
-                    center_p[xt_inds[tt]] += xt_vals[tt] / num_p;
+                for (int tt = 0; tt < data->x_tr_lens[cur_ind]; tt++) { // update sum_p
+                    sum_p[xt_inds[tt]] += xt_vals[tt];
                 }
-                // update h_center_p
-                cblas_dscal(para_tau, (num_p - 1.) / num_p, h_center_p, 1);
-                cblas_daxpy(para_tau, 1. / num_p, gaussian, 1, h_center_p, 1);
+                cblas_daxpy(para_tau, 1., gaussian, 1, h_sum_p, 1); // update h_sum_p
                 cblas_dger(CblasRowMajor, data->p, para_tau, 1.,
                            xt, 1, gaussian, 1, z_p, para_tau);
             } else {
-                // copy previous center
-                cblas_dcopy(data->p, center_p, 1, tmp_vec, 1);
-                // update center_p
-                cblas_dscal(data->p, (num_p - 1.) / num_p, center_p, 1);
-                cblas_daxpy(data->p, 1. / num_p, cur_x, 1, center_p, 1);
-                // update covariance matrix
-                cblas_dscal(data->p * data->p, (num_p - 1.) / num_p, cov_p, 1);
-                cblas_dger(CblasRowMajor, data->p, data->p, 1. / num_p,
-                           cur_x, 1, cur_x, 1, cov_p, data->p);
-                cblas_dger(CblasRowMajor, data->p, data->p, (num_p - 1.) / num_p,
-                           tmp_vec, 1, tmp_vec, 1, cov_p, data->p);
-                cblas_dger(CblasRowMajor, data->p, data->p, -1.,
-                           center_p, 1, center_p, 1, cov_p, data->p);
+                _opauc_dense_update(sum_p, sq_p, cur_x, data->p);
             }
             if (num_n > 0.0) {
                 if (data->is_sparse) {
                     // calculate the gradient part 1: \para_lambda w + x_t - c_t^+
-                    cblas_dcopy(data->p, center_n, 1, grad_wt, 1);
+                    memset(grad_wt, 0, sizeof(double) * data->p);
+                    cblas_daxpy(data->p, 1. / num_n, sum_n, 1, grad_wt, 1);
                     for (int tt = 0; tt < data->x_tr_lens[cur_ind]; tt++)
                         grad_wt[xt_inds[tt]] += -xt_vals[tt];
                     cblas_daxpy(data->p, para_lambda, re->wt, 1, grad_wt, 1);
                     cblas_dcopy(data->p, xt, 1, tmp_vec, 1); // xt - c_t^-
-                    cblas_daxpy(data->p, -1., center_n, 1, tmp_vec, 1);
+                    cblas_daxpy(data->p, -1. / num_n, sum_n, 1, tmp_vec, 1);
                     cblas_dscal(data->p, cblas_ddot(data->p, tmp_vec, 1, re->wt, 1), tmp_vec, 1);
                     cblas_daxpy(data->p, 1., tmp_vec, 1, grad_wt, 1);
                     cblas_dgemv(CblasRowMajor, CblasTrans, data->p, para_tau, 1. / num_n,
                                 z_n, para_tau, re->wt, 1, 0.0, tmp_vec, 1);
                     cblas_dgemv(CblasRowMajor, CblasNoTrans, data->p, para_tau, 1.,
                                 z_n, para_tau, tmp_vec, 1, 1.0, grad_wt, 1);
-                    double wei = cblas_ddot(data->p, re->wt, 1, center_n, 1);
-                    wei = wei * cblas_ddot(para_tau, h_center_n, 1, h_center_n, 1);
-                    cblas_daxpy(data->p, wei, center_n, 1, grad_wt, 1);
+                    double wei = cblas_ddot(data->p, re->wt, 1, sum_n, 1) / num_n;
+                    wei = wei * cblas_ddot(para_tau, h_sum_n, 1, h_sum_n, 1) / (num_n * num_n);
+                    cblas_daxpy(data->p, wei / num_n, sum_n, 1, grad_wt, 1);
                 } else {
-                    // calculate the gradient part 1: \para_lambda w + x_t - c_t^+
-                    cblas_dcopy(data->p, center_n, 1, grad_wt, 1);
-                    cblas_daxpy(data->p, -1., cur_x, 1, grad_wt, 1);
-                    cblas_daxpy(data->p, para_lambda, re->wt, 1, grad_wt, 1);
-                    cblas_dcopy(data->p, cur_x, 1, tmp_vec, 1); // xt - c_t^-
-                    cblas_daxpy(data->p, -1., center_n, 1, tmp_vec, 1);
-                    cblas_dscal(data->p * data->p, 0.0, tmp_mat, 1); // (xt - c_t^+)(xt - c_t^+)^T
-                    cblas_dger(CblasRowMajor, data->p, data->p, 1.,
-                               tmp_vec, 1, tmp_vec, 1, tmp_mat, data->p);
-                    cblas_dgemv(CblasRowMajor, CblasNoTrans, data->p, data->p, 1.,
-                                tmp_mat, data->p, re->wt, 1, 1.0, grad_wt, 1);
-                    cblas_dgemv(CblasRowMajor, CblasNoTrans, data->p, data->p, 1.,
-                                cov_n, data->p, re->wt, 1, 1.0, grad_wt, 1);
+                    _opauc_dense_grad(grad_wt, tmp_vec, re->wt, cur_x, sum_n, sq_n, num_n,
+                                      -1., para_lambda, data->p);
                 }
             } else {
                 cblas_dscal(data->p, 0.0, grad_wt, 1);
@@ -1167,167 +2592,157 @@ void _algo_opauc(Data *data, GlobalParas *paras, AlgoResults *re,
         } else {
             num_n++;
             if (data->is_sparse) {
-                cblas_dscal(data->p, (num_n - 1.) / num_n, center_n, 1); // update center_n
-                for (int tt = 0; tt < data->x_tr_lens[cur_ind]; tt++)
-                    center_n[xt_inds[tt]] += xt_vals[tt] / num_n;
-                cblas_dscal(para_tau, (num_n - 1.) / num_n, h_center_n, 1); // update h_center_n
-                cblas_daxpy(para_tau, 1. / num_n, gaussian, 1, h_center_n, 1);
+                for (int tt = 0; tt < data->x_tr_lens[cur_ind]; tt++) // update sum_n
+                    sum_n[xt_inds[tt]] += xt_vals[tt];
+                cblas_daxpy(para_tau, 1., gaussian, 1, h_sum_n, 1); // update h_sum_n
                 cblas_dger(CblasRowMajor, data->p, para_tau, 1.,
                            xt, 1, gaussian, 1, z_n, para_tau);
             } else {
-                // copy previous center
-                cblas_dcopy(data->p, center_n, 1, tmp_vec, 1);
-                // update center_n
-                cblas_dscal(data->p, (num_n - 1.) / num_n, center_n, 1);
-                cblas_daxpy(data->p, 1. / num_n, cur_x, 1, center_n, 1);
-                // update covariance matrix
-                cblas_dscal(data->p * data->p, (num_n - 1.) / num_n, cov_n, 1);
-                cblas_dger(CblasRowMajor, data->p, data->p, 1. / num_n,
-                           cur_x, 1, cur_x, 1, cov_n, data->p);
-                cblas_dger(CblasRowMajor, data->p, data->p, (num_n - 1.) / num_n,
-                           tmp_vec, 1, tmp_vec, 1, cov_n, data->p);
-                cblas_dger(CblasRowMajor, data->p, data->p, -1.,
-                           center_n, 1, center_n, 1, cov_n, data->p);
+                _opauc_dense_update(sum_n, sq_n, cur_x, data->p);
             }
             if (num_p > 0.0) {
                 if (data->is_sparse) {
                     // calculate the gradient part 1: \para_lambda w + x_t - c_t^+
                     cblas_dcopy(data->p, xt, 1, grad_wt, 1);
-                    cblas_daxpy(data->p, -1., center_p, 1, grad_wt, 1);
+                    cblas_daxpy(data->p, -1. / num_p, sum_p, 1, grad_wt, 1);
                     cblas_daxpy(data->p, para_lambda, re->wt, 1, grad_wt, 1);
                     cblas_dcopy(data->p, xt, 1, tmp_vec, 1); // xt - c_t^+
-                    cblas_daxpy(data->p, -1., center_p, 1, tmp_vec, 1);
+                    cblas_daxpy(data->p, -1. / num_p, sum_p, 1, tmp_vec, 1);
                     cblas_dscal(data->p, cblas_ddot(data->p, tmp_vec, 1, re->wt, 1), tmp_vec, 1);
                     cblas_daxpy(data->p, 1., tmp_vec, 1, grad_wt, 1);
                     cblas_dgemv(CblasRowMajor, CblasTrans, data->p, para_tau, 1. / num_p,
                                 z_p, para_tau, re->wt, 1, 0.0, tmp_vec, 1);
                     cblas_dgemv(CblasRowMajor, CblasNoTrans, data->p, para_tau, 1.,
                                 z_p, para_tau, tmp_vec, 1, 1.0, grad_wt, 1);
-                    double wei = cblas_ddot(data->p, re->wt, 1, center_p, 1);
-                    wei = wei * cblas_ddot(para_tau, h_center_p, 1, h_center_p, 1);
-                    cblas_daxpy(data->p, wei, center_p, 1, grad_wt, 1);
+                    double wei = cblas_ddot(data->p, re->wt, 1, sum_p, 1) / num_p;
+                    wei = wei * cblas_ddot(para_tau, h_sum_p, 1, h_sum_p, 1) / (num_p * num_p);
+                    cblas_daxpy(data->p, wei / num_p, sum_p, 1, grad_wt, 1);
                 } else {
-                    // calculate the gradient part 1: \para_lambda w + x_t - c_t^+
-                    cblas_dcopy(data->p, cur_x, 1, grad_wt, 1);
-                    cblas_daxpy(data->p, -1., center_p, 1, grad_wt, 1);
-                    cblas_daxpy(data->p, para_lambda, re->wt, 1, grad_wt, 1);
-                    cblas_dcopy(data->p, cur_x, 1, tmp_vec, 1); // xt - c_t^+
-                    cblas_daxpy(data->p, -1., center_p, 1, tmp_vec, 1);
-                    // (xt - c_t^+)(xt - c_t^+)^T
-                    cblas_dscal(data->p * data->p, 0.0, tmp_mat, 1);
-                    cblas_dger(CblasRowMajor, data->p, data->p, 1.,
-                               tmp_vec, 1, tmp_vec, 1, tmp_mat, data->p);
-                    cblas_dgemv(CblasRowMajor, CblasNoTrans, data->p, data->p, 1.,
-                                tmp_mat, data->p, re->wt, 1, 1.0, grad_wt, 1);
-                    cblas_dgemv(CblasRowMajor, CblasNoTrans, data->p, data->p, 1.,
-                                cov_p, data->p, re->wt, 1, 1.0, grad_wt, 1);
+                    _opauc_dense_grad(grad_wt, tmp_vec, re->wt, cur_x, sum_p, sq_p, num_p,
+                                      1., para_lambda, data->p);
                 }
             } else {
                 cblas_dscal(data->p, 0.0, grad_wt, 1);
             }
         }
-        cblas_daxpy(data->p, -para_eta, grad_wt, 1, re->wt, 1); // update the solution
-        if ((fmod(t + 1, paras->step_len) == 1.) && paras->record_aucs) { // to calculate AUC score
-            _evaluate_aucs(data, y_pred, re, start_time);
+        if (!is_sketch) {
+            cblas_daxpy(data->p, -para_eta, grad_wt, 1, re->wt, 1); // update the solution
+        }
+        // to calculate AUC score
+        if (paras->record_aucs && _eval_due(ev, t + 1, paras->step_len, fmod(t + 1, paras->step_len) == 1.)) {
+            if (is_sketch) { _opauc_sketch_sync(sk, re->wt); }
+            _eval_aucs(ev, re->wt, NULL, 0, re, start_time);
         }
         // at the end of each epoch, we check the early stop condition.
         re->total_iterations++;
-        if ((t + 1) % (data->n) == 0) {
+        if (_stop_check_due(sc, t + 1)) {
             re->total_epochs++;
-            double norm_wt = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-            cblas_daxpy(data->p, -1., re->wt, 1, re->wt_prev, 1);
-            double norm_diff = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-            printf("diff: %.6f\n", norm_diff / norm_wt);
-            if (norm_wt > 0.0 && (norm_diff / norm_wt <= paras->stop_eps)) {
-                if (paras->verbose > 0) {
-                    printf("early stop at: %d-th epoch where maximal epoch is: %d\n",
-                           t / data->n, paras->num_passes);
-                }
-                break;
+            if (is_sketch) { _opauc_sketch_sync(sk, re->wt); }
+            if (_stop_check(sc, re->wt, re, data->p)) { break; }
+        }
+        if (_stop_snap_due(sc, t + 1)) { // wt_prev is only read at the end of an epoch.
+            if (is_sketch) {
+                _opauc_sketch_sync(sk, re->wt_prev);
+            } else {
+                memcpy(re->wt_prev, re->wt, sizeof(double) * (data->p));
             }
         }
-        memcpy(re->wt_prev, re->wt, sizeof(double) * (data->p));
     }
+    if (is_sketch) { _opauc_sketch_sync(sk, re->wt); }
     cblas_dscal(re->auc_len, 1. / CLOCKS_PER_SEC, re->rts, 1);
+    log_flush();
     free(gaussian);
     free(xt);
     if (data->is_sparse) {
-        free(h_center_n);
-        free(h_center_p);
-        free(z_p);
-        free(z_n);
+        free(h_sum_n);
+        free(h_sum_p);
+        if (is_sketch) {
+            free_opauc_sketch(sk);
+        } else {
+            free(z_p);
+            free(z_n);
+        }
     } else {
-        free(tmp_mat);
-        free(cov_n);
-        free(cov_p);
+        free(sq_n);
+        free(sq_p);
     }
-    free(y_pred);
+    free_stop_criteria(sc);
+    free_evaluator(ev);
     free(tmp_vec);
     free(grad_wt);
-    free(center_n);
-    free(center_p);
+    free(sum_n);
+    free(sum_p);
 }
 
 void _algo_sto_iht(Data *data, GlobalParas *paras, AlgoResults *re,
                    int para_s, int para_b, double para_xi, double para_l2_reg) {
 
-    srand((int) lrand48());
+    unsigned short rng[3];
+    _rng_init(rng, paras);
     double start_time = clock();
     openblas_set_num_threads(1);
 
-    double *y_pred = calloc((size_t) data->n, sizeof(double));
+    Evaluator *ev = make_evaluator(data, paras);
+    StopCriteria *sc = make_stop_criteria(paras, data->n / para_b);
     double *loss_grad_wt = calloc((data->p + 2), sizeof(double));
+    LossWorkspace *loss_ws = make_loss_workspace(para_b + data->n % para_b, paras->verbose > 1);
     int min_b_ind = 0;
     int max_b_ind = data->n / para_b;
     int total_blocks = paras->num_passes * (data->n / para_b);
+    // the support of wt after hard thresholding, NULL before the first one.
+    bool is_track = paras->track_support == 1;
+    HTWorkspace *ht_ws = make_ht_workspace(data->p, para_s);
+    const int *supp = NULL;
+    int supp_size = 0;
     // for each block of training samples.
     for (int t = 1; t <= total_blocks; t++) {
         // block bi must be in [min_b_ind,max_b_ind-1]
-        int bi = (int) (lrand48() % (max_b_ind - min_b_ind));
+        int bi = (int) (nrand48(rng) % (max_b_ind - min_b_ind));
         int cur_b_size = (bi == (max_b_ind - 1) ? para_b + (data->n % para_b) : para_b);
         // calculate the gradient
-        logistic_loss_grad(re->wt, data->x_tr_vals + bi * para_b * data->p,
-                           data->y_tr + bi * para_b, loss_grad_wt, para_l2_reg, cur_b_size, data->p);
-        printf("loss: %.4f\n", loss_grad_wt[0]);
+        _block_loss_grad(loss_ws, re->wt, data, bi * para_b, cur_b_size, is_track ? supp : NULL, supp_size,
+                         loss_grad_wt, para_l2_reg);
+        log_event(EVENT_LOSS, t, loss_grad_wt[0]);
+        log_debug("loss: %.4f\n", loss_grad_wt[0]);
         // wt = wt - eta * grad(wt)
         cblas_daxpy(data->p + 1, -para_xi / cur_b_size, loss_grad_wt + 1, 1, re->wt, 1);
-        _hard_thresholding(re->wt, data->p, para_s); // k-sparse step.
-        if (paras->record_aucs == 1) {  // to evaluate AUC score
-            _evaluate_aucs(data, y_pred, re, start_time);
+        supp_size = _hard_thresholding_ws(ht_ws, re->wt); // k-sparse step.
+        supp = ht_ws->supp;
+        if ((paras->record_aucs == 1) && _eval_due(ev, t, 1, true)) {  // to evaluate AUC score
+            _eval_aucs(ev, re->wt, is_track ? supp : NULL, supp_size, re, start_time);
         }
         // at the end of each epoch, we check the early stop condition.
         re->total_iterations++;
-        if (t % (data->n / para_b) == 0) {
+        if (_stop_check_due(sc, t)) {
             re->total_epochs++;
-            double norm_wt = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-            cblas_daxpy(data->p, -1., re->wt, 1, re->wt_prev, 1);
-            double norm_diff = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-            if (norm_wt > 0.0 && (norm_diff / norm_wt <= paras->stop_eps)) {
-                if (paras->verbose > 0) {
-                    printf("early stop at: %d-th epoch where maximal epoch is: %d\n",
-                           t / data->n, paras->num_passes);
-                }
-                break;
-            }
+            if (_stop_check(sc, re->wt, re, data->p)) { break; }
+        }
+        if (_stop_snap_due(sc, t)) { // wt_prev is only read at the end of an epoch.
+            memcpy(re->wt_prev, re->wt, sizeof(double) * (data->p));
         }
-        memcpy(re->wt_prev, re->wt, sizeof(double) * (data->p));
     }
     cblas_dscal(re->auc_len, 1. / CLOCKS_PER_SEC, re->rts, 1);
+    log_flush();
+    free_ht_workspace(ht_ws);
+    free_loss_workspace(loss_ws);
     free(loss_grad_wt);
-    free(y_pred);
+    free_stop_criteria(sc);
+    free_evaluator(ev);
 }
 
 
 void _algo_hsg_ht(Data *data, GlobalParas *paras, AlgoResults *re,
                   int para_s, double para_tau, double para_zeta, double para_step_init, double para_l2) {
 
-    srand((int) lrand48());
     double start_time = clock();
     openblas_set_num_threads(1);
 
     int total_blocks = 0;
-    double *y_pred = calloc((size_t) data->n, sizeof(double));
+    Evaluator *ev = make_evaluator(data, paras);
+    StopCriteria *sc = make_stop_criteria(paras, 1);
     double *loss_grad_wt = calloc((data->p + 2), sizeof(double));
+    LossWorkspace *loss_ws = make_loss_workspace(data->n, paras->verbose > 1); // batches grow up to n.
+    HTWorkspace *ht_ws = make_ht_workspace(data->p, para_s);
     for (int t = 1; t <= paras->num_passes; t++) { // for each block
         int num_of_batches = ceil(log((para_zeta - 1) * data->n / (para_tau) + 1) / log(para_zeta)) + 1;
         int start_index = 0;
@@ -1338,37 +2753,551 @@ void _algo_hsg_ht(Data *data, GlobalParas *paras, AlgoResults *re,
             int indices_j = start_index;
             start_index += batch_size_s; // update for next start_index
             // calculate the gradient
-
-            logistic_loss_grad(re->wt, data->x_tr_vals + indices_j * data->p, data->y_tr + indices_j,
-                               loss_grad_wt, para_l2, batch_size_s, data->p);
+            _block_loss_grad(loss_ws, re->wt, data, indices_j, batch_size_s, NULL, 0, loss_grad_wt, para_l2);
             // wt = wt - eta * grad(wt)
             cblas_daxpy(data->p + 1, -para_step_init / batch_size_s, loss_grad_wt + 1, 1, re->wt, 1);
-            _hard_thresholding(re->wt, data->p, para_s); // k-sparse step.
+            _hard_thresholding_ws(ht_ws, re->wt); // k-sparse step.
             total_blocks += 1;
-            if (paras->record_aucs == 1) {  // to evaluate AUC score
-                _evaluate_aucs(data, y_pred, re, start_time);
+            if ((paras->record_aucs == 1) && _eval_due(ev, total_blocks, 1, true)) {  // to evaluate AUC score
+                _eval_aucs(ev, re->wt, NULL, 0, re, start_time);
             }
             if (start_index >= (data->n - 1)) { break; }
             // at the end of each epoch, we check the early stop condition.
             re->total_iterations++;
-            if (tt == num_of_batches - 1) {
+            if (tt == num_of_batches - 1) { // the epochs of HSG-HT are the passes.
                 re->total_epochs++;
-                double norm_wt = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-                cblas_daxpy(data->p, -1., re->wt, 1, re->wt_prev, 1);
-                double norm_diff = sqrt(cblas_ddot(data->p, re->wt_prev, 1, re->wt_prev, 1));
-                if (norm_wt > 0.0 && (norm_diff / norm_wt <= paras->stop_eps)) {
-                    if (paras->verbose == 0) {
-                        printf("early stop at: %d-th epoch where maximal epoch is: %d\n",
-                               t / data->n, paras->num_passes);
-                    }
-                    break;
-                }
+                if (_stop_check(sc, re->wt, re, data->p)) { break; }
+            }
+            if (tt == num_of_batches - 2) { // wt_prev is only read at the end of an epoch.
+                memcpy(re->wt_prev, re->wt, sizeof(double) * (data->p));
             }
-            memcpy(re->wt_prev, re->wt, sizeof(double) * (data->p));
-            //printf("norm(wt): %.4f\n", sqrt(cblas_ddot(data->p, re->wt, 1, re->wt, 1)));
         }
     }
     cblas_dscal(re->auc_len, 1. / CLOCKS_PER_SEC, re->rts, 1);
+    log_flush();
+    free_ht_workspace(ht_ws);
+    free_loss_workspace(loss_ws);
     free(loss_grad_wt);
-    free(y_pred);
+    free_stop_criteria(sc);
+    free_evaluator(ev);
+}
+
+/** whether _grid_model_end reads the iterate of the model after iteration t. */
+static inline bool _grid_model_reads_w(const StopCriteria *sc, int t, bool eval_due) {
+    return eval_due || _stop_check_due(sc, t) || _stop_snap_due(sc, t);
+}
+
+/**
+ * The end of iteration t of one model of a grid solver. Its iterate is in
+ * re->wt if _grid_model_reads_w is true.
+ * @return true if the model stops.
+ */
+static bool _grid_model_end(Evaluator *ev, StopCriteria *sc, AlgoResults *re, int t, bool eval_due,
+                            double start_time, int p) {
+    if (eval_due) { _eval_aucs(ev, re->wt, NULL, 0, re, start_time); }
+    re->total_iterations++;
+    if (_stop_check_due(sc, t)) {
+        re->total_epochs++;
+        if (_stop_check(sc, re->wt, re, p)) { return true; }
+    }
+    if (_stop_snap_due(sc, t)) { // wt_prev is only read at the end of an epoch.
+        memcpy(re->wt_prev, re->wt, sizeof(double) * p);
+    }
+    return false;
+}
+
+/** m_k = m_k + coef[k] * x for the columns of the p x K row-major m and the training sample in row row. */
+static void _outer_add(double *m, int num_models, const Data *data, int row, const double *coef) {
+    if (data->is_sparse) {
+        const int *xt_inds = data->x_tr_inds + data->x_tr_poss[row];
+        const double *xt_vals = data->x_tr_vals + data->x_tr_poss[row];
+        for (int tt = 0; tt < data->x_tr_lens[row]; tt++) {
+            cblas_daxpy(num_models, xt_vals[tt], coef, 1, m + (size_t) xt_inds[tt] * num_models, 1);
+        }
+    } else {
+        cblas_dger(CblasRowMajor, data->p, num_models, 1., data->x_tr_vals + (size_t) row * data->p, 1,
+                   coef, 1, m, num_models);
+    }
+}
+
+void _algo_solam_grid(Data *data, GlobalParas *paras, AlgoResults **re,
+                      const double *para_xi, const double *para_r, int num_models) {
+
+    double start_time = clock();
+    openblas_set_num_threads(1);
+    double p_hat = 0.;
+    int num_active = num_models;
+    // v_k = [w_k, a_k, b_k], the w-parts are the columns of v_w and averaged lazily.
+    ScaledMatrix *v_w = make_scaled_matrix(data->p, num_models);
+    LazyAverages *w_bar = make_lazy_averages(data->p, num_models);
+    double *v_a = malloc(sizeof(double) * num_models);
+    double *v_b = malloc(sizeof(double) * num_models);
+    double *alpha = malloc(sizeof(double) * num_models);
+    double *dots = malloc(sizeof(double) * num_models);
+    double *coef = malloc(sizeof(double) * num_models);
+    bool *is_active = malloc(sizeof(bool) * num_models);
+    StopCriteria **sc = malloc(sizeof(StopCriteria *) * num_models);
+    for (int k = 0; k < num_models; k++) {
+        for (int j = 0; j < data->p; j++) {
+            v_w->u[(size_t) j * num_models + k] = sqrt((para_r[k] * para_r[k]) / data->p);
+        }
+        _sm_renorm(v_w, k);
+        v_a[k] = para_r[k], v_b[k] = para_r[k], alpha[k] = 2. * para_r[k];
+        is_active[k] = true;
+        sc[k] = make_stop_criteria(paras, data->n);
+    }
+    Evaluator *ev = make_evaluator(data, paras);
+
+    for (int t = 1; t <= (paras->num_passes * data->n) && num_active > 0; t++) {
+        int cur_ind = _row(data, (t - 1) % data->n);
+        double is_p_yt = is_posi(data->y_tr[cur_ind]);
+        double is_n_yt = is_nega(data->y_tr[cur_ind]);
+        p_hat = ((t - 1.) * p_hat + is_p_yt) / t; // update p_hat
+        _sm_dots(v_w, data, cur_ind, dots); // the scores of all the models in one pass.
+        for (int k = 0; k < num_models; k++) {
+            coef[k] = 0.0;
+            if (!is_active[k]) { continue; }
+            double gamma = para_xi[k] / sqrt(t * 1.), vt_dot = dots[k];
+            w_bar->cum_wei[k] += gamma * v_w->scale[k]; // the current v gets the weight gamma.
+            w_bar->cum_gamma[k] += gamma;
+            double wei_posi = 2. * (1. - p_hat) * (vt_dot - v_a[k] - (1. + alpha[k]));
+            double wei_nega = 2. * p_hat * ((vt_dot - v_b[k]) + (1. + alpha[k]));
+            double grad_a = -2. * (1. - p_hat) * (vt_dot - v_a[k]) * is_p_yt;
+            double grad_b = -2. * p_hat * (vt_dot - v_b[k]) * is_n_yt;
+            coef[k] = -gamma * (wei_posi * is_p_yt + wei_nega * is_n_yt);
+            double grad_alpha = -2. * (1. - p_hat) * vt_dot * is_p_yt + 2. * p_hat * vt_dot * is_n_yt;
+            grad_alpha += -2. * p_hat * (1. - p_hat) * alpha[k];
+            alpha[k] += gamma * grad_alpha;
+            alpha[k] = (fabs(alpha[k]) > 2. * para_r[k]) ? (2. * alpha[k] * para_r[k]) / fabs(alpha[k]) : alpha[k];
+            v_a[k] = min(v_a[k] - gamma * grad_a, para_r[k]);
+            v_b[k] = min(v_b[k] - gamma * grad_b, para_r[k]);
+        }
+        // the gradient steps of all the models in one pass.
+        _lazy_avgs_touch_row(w_bar, v_w, data, cur_ind);
+        _sm_add_outer(v_w, data, cur_ind, dots, coef);
+        bool eval_due = (paras->record_aucs == 1) && _eval_due(ev, t, paras->step_len, fmod(t, paras->step_len) == 1.);
+        for (int k = 0; k < num_models; k++) {
+            if (!is_active[k]) { continue; }
+            _lazy_avgs_scale(w_bar, v_w, k, _sm_l2_ball_factor(v_w, k, para_r[k])); // projection w
+            if (_grid_model_reads_w(sc[k], t, eval_due)) { _lazy_avgs_to_dense(w_bar, v_w, k, re[k]->wt); }
+            if (_grid_model_end(ev, sc[k], re[k], t, eval_due, start_time, data->p)) {
+                is_active[k] = false, num_active--;
+            }
+        }
+    }
+    for (int k = 0; k < num_models; k++) {
+        _lazy_avgs_to_dense(w_bar, v_w, k, re[k]->wt);
+        cblas_dscal(re[k]->auc_len, 1. / CLOCKS_PER_SEC, re[k]->rts, 1);
+        free_stop_criteria(sc[k]);
+    }
+    log_flush();
+    free_evaluator(ev);
+    free(sc);
+    free(is_active);
+    free(coef);
+    free(dots);
+    free(alpha);
+    free(v_b);
+    free(v_a);
+    free_lazy_averages(w_bar);
+    free_scaled_matrix(v_w);
+}
+
+void _algo_spam_grid(Data *data, GlobalParas *paras, AlgoResults **re, const double *para_xi,
+                     const double *para_l1_reg, const double *para_l2_reg, int num_models) {
+
+    double start_time = clock();
+    openblas_set_num_threads(1);
+    double *posi_x = calloc((size_t) data->p, sizeof(double)); // E[x|y=1]
+    double *nega_x = calloc((size_t) data->p, sizeof(double)); // E[x|y=-1]
+    double posi_t = 0.0, nega_t = 0.0, prob_p;
+    _get_posi_nega_x(posi_x, nega_x, &posi_t, &nega_t, &prob_p, data);
+    int num_active = num_models;
+    ScaledMatrix *wt = make_scaled_matrix(data->p, num_models);
+    // <u_k, posi_x> and <u_k, nega_x>, so that a(w_k) = scale[k] * u_posi[k].
+    double *u_posi = calloc((size_t) num_models, sizeof(double));
+    double *u_nega = calloc((size_t) num_models, sizeof(double));
+    double *dots = malloc(sizeof(double) * num_models);
+    double *coef = malloc(sizeof(double) * num_models);
+    bool *is_active = malloc(sizeof(bool) * num_models);
+    StopCriteria **sc = malloc(sizeof(StopCriteria *) * num_models);
+    for (int k = 0; k < num_models; k++) {
+        is_active[k] = true;
+        sc[k] = make_stop_criteria(paras, data->n);
+    }
+    Evaluator *ev = make_evaluator(data, paras);
+    // a(w_k) and b(w_k) are tracked through the updates, and recomputed every proj_resync steps.
+    bool is_incr = paras->proj_resync > 0;
+
+    for (int t = 1; t <= paras->num_passes * data->n && num_active > 0; t++) {
+        int row = _row(data, (t - 1) % data->n);
+        if (!is_incr || (t - 1) % paras->proj_resync == 0) {
+            cblas_dgemv(CblasRowMajor, CblasTrans, data->p, num_models, 1., wt->u, num_models,
+                        posi_x, 1, 0.0, u_posi, 1);
+            cblas_dgemv(CblasRowMajor, CblasTrans, data->p, num_models, 1., wt->u, num_models,
+                        nega_x, 1, 0.0, u_nega, 1);
+        }
+        // <x, posi_x> and <x, nega_x> are shared by all the models.
+        double xt_posi = 0.0, xt_nega = 0.0;
+        if (data->is_sparse) {
+            const int *xt_inds = data->x_tr_inds + data->x_tr_poss[row];
+            const double *xt_vals = data->x_tr_vals + data->x_tr_poss[row];
+            for (int tt = 0; tt < data->x_tr_lens[row]; tt++) {
+                xt_posi += xt_vals[tt] * posi_x[xt_inds[tt]];
+                xt_nega += xt_vals[tt] * nega_x[xt_inds[tt]];
+            }
+        } else {
+            const double *xt = data->x_tr_vals + (size_t) row * data->p;
+            xt_posi = cblas_ddot(data->p, xt, 1, posi_x, 1);
+            xt_nega = cblas_ddot(data->p, xt, 1, nega_x, 1);
+        }
+        _sm_dots(wt, data, row, dots);
+        for (int k = 0; k < num_models; k++) {
+            coef[k] = 0.0;
+            if (!is_active[k]) { continue; }
+            double eta_t = para_xi[k] / sqrt(t), xtw = dots[k];
+            double a_wt = wt->scale[k] * u_posi[k], b_wt = wt->scale[k] * u_nega[k];
+            double alpha_wt = b_wt - a_wt;
+            double weight = data->y_tr[row] > 0 ?
+                            2. * (1.0 - prob_p) * (xtw - a_wt) -
+                            2. * (1.0 + alpha_wt) * (1.0 - prob_p) :
+                            2.0 * prob_p * (xtw - b_wt) + 2.0 * (1.0 + alpha_wt) * prob_p;
+            coef[k] = -eta_t * weight;
+            u_posi[k] += coef[k] / wt->scale[k] * xt_posi;
+            u_nega[k] += coef[k] / wt->scale[k] * xt_nega;
+        }
+        _sm_add_outer(wt, data, row, dots, coef); // the gradient steps of all the models in one pass.
+        bool eval_due = (paras->record_aucs == 1) && _eval_due(ev, t, paras->step_len, fmod(t, paras->step_len) == 1.);
+        for (int k = 0; k < num_models; k++) {
+            if (!is_active[k]) { continue; }
+            double eta_t = para_xi[k] / sqrt(t);
+            if (para_l1_reg[k] <= 0.0 && para_l2_reg[k] > 0.0) {
+                _sm_scale(wt, k, 1. / (eta_t * para_l2_reg[k] + 1.)); // l2-regularization
+            } else {
+                // elastic-net, the scale is folded into u in the same pass.
+                double tmp_demon = (eta_t * para_l2_reg[k] + 1.), sq_norm = 0.0;
+                u_posi[k] = 0.0, u_nega[k] = 0.0;
+                for (int j = 0; j < data->p; j++) {
+                    double *u_jk = wt->u + (size_t) j * num_models + k, w_j = wt->scale[k] * *u_jk;
+                    *u_jk = (double) sign(w_j) / tmp_demon * fmax(0.0, fabs(w_j) - eta_t * para_l1_reg[k]);
+                    u_posi[k] += *u_jk * posi_x[j];
+                    u_nega[k] += *u_jk * nega_x[j];
+                    sq_norm += *u_jk * *u_jk;
+                }
+                wt->scale[k] = 1.0, wt->sq_norm[k] = sq_norm;
+            }
+            if (_grid_model_reads_w(sc[k], t, eval_due)) { _sm_get(wt, k, re[k]->wt); }
+            if (_grid_model_end(ev, sc[k], re[k], t, eval_due, start_time, data->p)) {
+                is_active[k] = false, num_active--;
+            }
+        }
+    }
+    for (int k = 0; k < num_models; k++) {
+        _sm_get(wt, k, re[k]->wt);
+        cblas_dscal(re[k]->auc_len, 1. / CLOCKS_PER_SEC, re[k]->rts, 1);
+        free_stop_criteria(sc[k]);
+    }
+    log_flush();
+    free_evaluator(ev);
+    free(sc);
+    free(is_active);
+    free(coef);
+    free(dots);
+    free(u_nega);
+    free(u_posi);
+    free_scaled_matrix(wt);
+    free(nega_x);
+    free(posi_x);
+}
+
+void _algo_sht_auc_grid(Data *data, GlobalParas *paras, AlgoResults **re, int version, const int *para_s,
+                        int para_b, const double *para_c, const double *para_l2_reg, int num_models) {
+
+    unsigned short rng[3];
+    _rng_init(rng, paras);
+    double start_time = clock();
+    openblas_set_num_threads(1);
+    double *posi_x = calloc((size_t) data->p, sizeof(double)); // E[x|y=1]
+    double *nega_x = calloc((size_t) data->p, sizeof(double)); // E[x|y=-1]
+    double *var = calloc((size_t) data->p, sizeof(double));
+    double posi_t = 0.0, nega_t = 0.0, prob_p;
+    int min_b_ind = 0;
+    int max_b_ind = data->n / para_b;
+    int total_blocks = paras->num_passes * (data->n / para_b);
+    _get_posi_nega_x(posi_x, nega_x, &posi_t, &nega_t, &prob_p, data);
+    memcpy(var, nega_x, sizeof(double) * data->p);
+    cblas_daxpy(data->p, -1.0, posi_x, 1, var, 1);
+    cblas_dscal(data->p, 2.0 * prob_p * (1.0 - prob_p), var, 1);
+    int num_active = num_models;
+    ScaledMatrix *wt = make_scaled_matrix(data->p, num_models); // the scales stay 1.
+    double *grad_wt = malloc(sizeof(double) * data->p * num_models); // the block gradients, p x K as wt->u.
+    double *w_k = malloc(sizeof(double) * data->p);
+    double *utw = malloc(sizeof(double) * num_models);
+    double *vtw = malloc(sizeof(double) * num_models);
+    // the scores and the gradient coefficients of the block, b x K.
+    double *scores = malloc(sizeof(double) * (para_b + data->n % para_b) * num_models);
+    double *coefs = malloc(sizeof(double) * (para_b + data->n % para_b) * num_models);
+    // the rows of a dense block are contiguous, so both are one matrix product.
+    bool is_gemm = !data->is_sparse && data->rows == NULL;
+    // the coefficients of var, posi_x and nega_x are summed over the block.
+    double *wei_var = malloc(sizeof(double) * num_models);
+    double *sum_wei_posi = malloc(sizeof(double) * num_models);
+    double *sum_wei_nega = malloc(sizeof(double) * num_models);
+    bool *is_active = malloc(sizeof(bool) * num_models);
+    HTWorkspace **ht_ws = malloc(sizeof(HTWorkspace *) * num_models);
+    StopCriteria **sc = malloc(sizeof(StopCriteria *) * num_models);
+    for (int k = 0; k < num_models; k++) {
+        is_active[k] = true;
+        ht_ws[k] = make_ht_workspace(data->p, para_s[k]);
+        sc[k] = make_stop_criteria(paras, data->n / para_b);
+    }
+    Evaluator *ev = make_evaluator(data, paras);
+
+    for (int t = 1; t <= total_blocks && num_active > 0; t++) { // for each block
+        // block bi is in [min_b_ind,max_b_ind-1], the same one for all the models.
+        int bi = (int) (nrand48(rng) % (max_b_ind - min_b_ind));
+        cblas_dgemv(CblasRowMajor, CblasTrans, data->p, num_models, 1., wt->u, num_models,
+                    posi_x, 1, 0.0, utw, 1);
+        cblas_dgemv(CblasRowMajor, CblasTrans, data->p, num_models, 1., wt->u, num_models,
+                    nega_x, 1, 0.0, vtw, 1);
+        memset(wei_var, 0, sizeof(double) * num_models);
+        memset(sum_wei_posi, 0, sizeof(double) * num_models);
+        memset(sum_wei_nega, 0, sizeof(double) * num_models);
+        // take care of the last block
+        int cur_b_size = (bi == (max_b_ind - 1) ? para_b + (data->n % para_b) : para_b);
+        const double *x_block = data->x_tr_vals + (size_t) bi * para_b * data->p;
+        if (is_gemm) {
+            cblas_dgemm(CblasRowMajor, CblasNoTrans, CblasNoTrans, cur_b_size, num_models, data->p, 1.,
+                        x_block, data->p, wt->u, num_models, 0.0, scores, num_models);
+        } else {
+            memset(grad_wt, 0, sizeof(double) * data->p * num_models);
+        }
+        for (int kk = 0; kk < cur_b_size; kk++) {
+            int ind = _row(data, bi * para_b + kk);
+            bool is_p = data->y_tr[ind] > 0;
+            double *dots = scores + (size_t) kk * num_models, *coef = coefs + (size_t) kk * num_models;
+            if (!is_gemm) { _sm_dots(wt, data, ind, dots); }
+            for (int k = 0; k < num_models; k++) {
+                double xtw = dots[k], u = utw[k], v = vtw[k];
+                coef[k] = 0.0;
+                if (!is_active[k]) { continue; }
+                switch (version) {
+                    case 0:
+                        wei_var[k] += 1 + v - u;
+                        coef[k] = is_p ? 2. * (1 - prob_p) * (xtw - u) : 2. * prob_p * (xtw - v);
+                        if (is_p) { sum_wei_posi[k] -= coef[k]; } else { sum_wei_nega[k] -= coef[k]; }
+                        break;
+                    case 1:
+                        coef[k] = is_p ? 2. * (1.0 - prob_p) * (xtw - u) - 2. * (1.0 + (v - u)) * (1.0 - prob_p) :
+                                  2.0 * prob_p * (xtw - v) + 2.0 * (1.0 + (v - u)) * prob_p;
+                        break;
+                    case 2:
+                        if (is_p) {
+                            coef[k] = 2. * (1. - prob_p) * (xtw - v - 1.0);
+                            sum_wei_posi[k] += 2. * (1. - prob_p) * u - 2. * prob_p * (1. - prob_p) * (u - v);
+                            sum_wei_nega[k] += -2. * (1. - prob_p) * xtw + 2. * prob_p * (1. - prob_p) * (u - v);
+                        } else {
+                            coef[k] = 2. * prob_p * (xtw - u + 1.0);
+                            sum_wei_posi[k] += -2. * prob_p * xtw + 2. * prob_p * (1. - prob_p) * (v - u);
+                            sum_wei_nega[k] += 2. * prob_p * v - 2. * prob_p * (1. - prob_p) * (v - u);
+                        }
+                        break;
+                    default:
+                        break;
+                }
+            }
+            if (!is_gemm) { _outer_add(grad_wt, num_models, data, ind, coef); }
+        }
+        if (is_gemm) { // the gradients of all the models, grad_wt = x_block^T * coefs.
+            cblas_dgemm(CblasRowMajor, CblasTrans, CblasNoTrans, data->p, num_models, cur_b_size, 1.,
+                        x_block, data->p, coefs, num_models, 0.0, grad_wt, num_models);
+        }
+        bool eval_due = (paras->record_aucs == 1) && _eval_due(ev, t, 1, true);
+        for (int k = 0; k < num_models; k++) {
+            if (!is_active[k]) { continue; }
+            // wt = (wt - eta * grad(wt)) / (eta * l2 + 1), followed by the k-sparse projection.
+            double step = -para_c[k] / cur_b_size, factor = 1. / (para_c[k] * para_l2_reg[k] + 1.);
+            for (int j = 0; j < data->p; j++) {
+                size_t pos = (size_t) j * num_models + k;
+                double grad_j = grad_wt[pos] + wei_var[k] * var[j] +
+                                sum_wei_posi[k] * posi_x[j] + sum_wei_nega[k] * nega_x[j];
+                w_k[j] = (wt->u[pos] + step * grad_j) * factor;
+            }
+            _hard_thresholding_ws(ht_ws[k], w_k);
+            for (int j = 0; j < data->p; j++) {
+                wt->u[(size_t) j * num_models + k] = w_k[j];
+            }
+            if (_grid_model_reads_w(sc[k], t, eval_due)) { memcpy(re[k]->wt, w_k, sizeof(double) * data->p); }
+            if (_grid_model_end(ev, sc[k], re[k], t, eval_due, start_time, data->p)) {
+                is_active[k] = false, num_active--;
+            }
+        }
+    }
+    for (int k = 0; k < num_models; k++) {
+        _sm_get(wt, k, re[k]->wt);
+        cblas_dscal(re[k]->auc_len, 1. / CLOCKS_PER_SEC, re[k]->rts, 1);
+        free_stop_criteria(sc[k]);
+        free_ht_workspace(ht_ws[k]);
+    }
+    log_flush();
+    free_evaluator(ev);
+    free(sc);
+    free(ht_ws);
+    free(is_active);
+    free(sum_wei_nega);
+    free(sum_wei_posi);
+    free(wei_var);
+    free(coefs);
+    free(scores);
+    free(vtw);
+    free(utw);
+    free(w_k);
+    free(grad_wt);
+    free_scaled_matrix(wt);
+    free(var);
+    free(nega_x);
+    free(posi_x);
+}
+
+const int algo_num_paras[] = {2, 3, 2, 3, 5, 4, 5};
+
+/** run algo with the parameters algo_paras, in the order given by AlgoId. */
+static AlgoResults *_run_algo(int algo, Data *data, GlobalParas *paras, const double *algo_paras) {
+    const double *a = algo_paras;
+    int num_evals = num_auc_evals(paras, data->n * paras->num_passes, paras->step_len);
+    AlgoResults *re = NULL;
+    switch (algo) {
+        case ALGO_SOLAM:
+            re = make_algo_results(data->p, num_evals);
+            _algo_solam(data, paras, re, a[0], a[1]);
+            break;
+        case ALGO_SPAM:
+            re = make_algo_results(data->p, num_evals);
+            _algo_spam(data, paras, re, a[0], a[1], a[2]);
+            break;
+        case ALGO_FSAUC:
+            re = make_algo_results(data->p, num_evals);
+            _algo_fsauc(data, paras, re, a[0], a[1]);
+            break;
+        case ALGO_OPAUC:
+            re = make_algo_results(data->p, num_evals);
+            _algo_opauc(data, paras, re, (int) a[2], a[0], a[1]);
+            break;
+        case ALGO_SHT_AUC:
+            re = make_algo_results(data->p, num_auc_evals(paras, (data->n / (int) a[2]) * paras->num_passes, 1));
+            _algo_sht_auc(data, paras, re, (int) a[0], 0, (int) a[1], (int) a[2], a[3], a[4]);
+            break;
+        case ALGO_STO_IHT:
+            re = make_algo_results(data->p + 1, num_auc_evals(paras, (data->n / (int) a[1]) * paras->num_passes, 1));
+            _algo_sto_iht(data, paras, re, (int) a[0], (int) a[1], a[2], a[3]);
+            break;
+        case ALGO_HSG_HT:
+            re = make_algo_results(data->p + 1, num_auc_evals(paras, data->n * paras->num_passes, 1));
+            _algo_hsg_ht(data, paras, re, (int) a[0], a[1], a[2], a[3], a[4]);
+            break;
+        default:
+            break;
+    }
+    return re;
+}
+
+/** the (grid point, fold) runs of cross_validate, which are taken by the threads one by one. */
+typedef struct {
+    const Data *data;
+    const GlobalParas *paras;
+    int algo;
+    const double *grid;
+    int num_grid;
+    int num_folds;
+    int **tr_rows;      // training rows of each fold, i.e., the rows of the other folds.
+    int **te_rows;      // held-out rows of each fold.
+    int *te_lens;
+    double *aucs;
+    double *num_nonzeros;
+    double *epochs;
+    int next_task;
+    pthread_mutex_t lock;
+} CvJob;
+
+static void _cv_task(CvJob *job, int task) {
+    int gi = task / job->num_folds, fi = task % job->num_folds;
+    Data tr = *job->data, te = *job->data;
+    // the runs read the rows of the folds in place, the recorded AUCs are on the training folds.
+    tr.rows = job->tr_rows[fi], tr.n = job->data->n - job->te_lens[fi], tr.y_te = NULL;
+    te.rows = job->te_rows[fi], te.n = job->te_lens[fi], te.y_te = NULL;
+    GlobalParas paras = *job->paras, te_paras = *job->paras;
+    te_paras.eval_size = 0, te_paras.eval_csc = 0;
+    AlgoResults *re = _run_algo(job->algo, &tr, &paras, job->grid + gi * algo_num_paras[job->algo]);
+    Evaluator *ev = make_evaluator(&te, &te_paras);
+    _eval_scores(ev, re->wt, NULL, 0);
+    job->aucs[task] = _auc_score_ranks(ev->y_true, ev->y_pred, ev->num_rows, ev->pairs);
+    int nnz = 0;
+    for (int j = 0; j < tr.p; j++) {
+        nnz += (re->wt[j] != 0.0);
+    }
+    job->num_nonzeros[task] = nnz;
+    job->epochs[task] = re->total_epochs;
+    free_evaluator(ev);
+    free_algo_results(re);
+}
+
+static void *_cv_worker(void *arg) {
+    CvJob *job = arg;
+    int num_tasks = job->num_grid * job->num_folds;
+    while (true) {
+        pthread_mutex_lock(&job->lock);
+        int task = job->next_task++;
+        pthread_mutex_unlock(&job->lock);
+        if (task >= num_tasks) { break; }
+        _cv_task(job, task);
+    }
+    log_flush(); // the ring of this thread is gone with it.
+    return NULL;
+}
+
+void cross_validate(const Data *data, const GlobalParas *paras, int algo, const double *grid, int num_grid,
+                    const int *folds, int num_folds, int num_threads,
+                    double *aucs, double *num_nonzeros, double *epochs) {
+    CvJob job = {.data = data, .paras = paras, .algo = algo, .grid = grid, .num_grid = num_grid,
+                 .num_folds = num_folds, .aucs = aucs, .num_nonzeros = num_nonzeros, .epochs = epochs,
+                 .next_task = 0};
+    job.tr_rows = malloc(sizeof(int *) * num_folds);
+    job.te_rows = malloc(sizeof(int *) * num_folds);
+    job.te_lens = calloc((size_t) num_folds, sizeof(int));
+    for (int i = 0; i < data->n; i++) {
+        job.te_lens[folds[i]]++;
+    }
+    for (int fi = 0; fi < num_folds; fi++) { // the rows of a fold stay in increasing order.
+        int num_tr = 0, num_te = 0;
+        job.tr_rows[fi] = malloc(sizeof(int) * (data->n - job.te_lens[fi]));
+        job.te_rows[fi] = malloc(sizeof(int) * job.te_lens[fi]);
+        for (int i = 0; i < data->n; i++) {
+            if (folds[i] == fi) {
+                job.te_rows[fi][num_te++] = i;
+            } else {
+                job.tr_rows[fi][num_tr++] = i;
+            }
+        }
+    }
+    int num_tasks = num_grid * num_folds;
+    num_threads = max(1, min(num_threads, num_tasks));
+    pthread_mutex_init(&job.lock, NULL);
+    pthread_t *threads = malloc(sizeof(pthread_t) * num_threads);
+    int num_started = 0;
+    for (int ti = 1; ti < num_threads; ti++) { // the calling thread is one of them.
+        if (pthread_create(&threads[num_started], NULL, _cv_worker, &job) == 0) { num_started++; }
+    }
+    _cv_worker(&job);
+    for (int ti = 0; ti < num_started; ti++) {
+        pthread_join(threads[ti], NULL);
+    }
+    pthread_mutex_destroy(&job.lock);
+    free(threads);
+    for (int fi = 0; fi < num_folds; fi++) {
+        free(job.te_rows[fi]);
+        free(job.tr_rows[fi]);
+    }
+    free(job.te_lens);
+    free(job.te_rows);
+    free(job.tr_rows);
 }
@@ -11,9 +11,10 @@
 #include <cblas.h>
 #include "fast_pcst.h"
 #include "loss.h"
+#include "auc_log.h"
 
 #define PI 3.14159265358979323846
-#define sign(x) (x > 0) - (x < 0)
+#define sign(x) (((x) > 0) - ((x) < 0))
 #define max(a, b) ((a) > (b) ? (a) : (b))
 #define min(a, b) ((a) < (b) ? (a) : (b))
 #define swap(a, b) { register double temp=(a);(a)=(b);(b)=temp; }
@@ -26,6 +27,7 @@ typedef struct {
     double *aucs;
     double *rts;
     int auc_len; // how many auc evaluated.
+    int auc_cap; // room of aucs and rts.
     int total_iterations; // total iterations
     int total_epochs; // total epochs executed.
 } AlgoResults;
@@ -33,14 +35,28 @@ typedef struct {
 
 typedef struct {
     int num_passes;
-    int verbose;
+    int verbose; // > 0: print the progress, > 1: also check the iterates for NaN.
     int step_len;
     int record_aucs;
     double stop_eps;
+    int lazy_update; // 1: lazy (just-in-time) updates for sparse data.
+    int proj_resync; // k > 0: SPAM updates <w, posi_x>, <w, nega_x> incrementally, recomputed every k steps.
+    int track_support; // 1: sparse-projected methods only visit the support of the iterate.
+    int eval_size; // k > 0: AUC is evaluated on a fixed random subsample of k rows.
+    double eval_growth; // g > 1: AUC is evaluated at iterations 1, then at least step_len apart, growing by g.
+    int eval_csc; // 1: only rescore the sparse rows touched by changed weights, found via a CSC index.
+    double time_budget; // t > 0: stop at the end of the epoch in which t seconds of wall-clock time passed.
+    int auc_patience; // k > 0: stop if the recorded AUC did not improve by auc_tol at k epoch ends in a row.
+    double auc_tol;
+    long seed; // s > 0: seed of the random generator of the run, otherwise it is drawn from lrand48().
+    int num_threads; // t > 1: SHT-AUC splits the gradient of each block across t threads, same bits as t = 1.
 } GlobalParas;
 
 AlgoResults *make_algo_results(int data_p, int total_num_eval);
 
+/** the room needed to record AUC within num_iters iterations, evaluated every step iterations. */
+int num_auc_evals(const GlobalParas *paras, int num_iters, int step);
+
 bool free_algo_results(AlgoResults *re);
 
 
@@ -54,14 +70,32 @@ typedef struct {
     int num_iter;
 } GraphStat;
 
+/**
+ * Statistics of a training set which do not depend on the solver. They are
+ * computed once, e.g., by a Dataset of the Python module, and shared read-only
+ * by all the runs on that set.
+ */
+typedef struct {
+    double *posi_x;     // E[x|y=1]
+    double *nega_x;     // E[x|y=-1]
+    double posi_t;      // number of positive samples.
+    double nega_t;      // number of negative samples.
+    double prob_p;      // fraction of positive samples.
+    int *csc_poss;      // CSC index of sparse data, start of each column, NULL if not built.
+    int *csc_rows;      // rows of the nonzeros of each column.
+    int csc_nnz;
+} DataStat;
+
 typedef struct {
     const double *x_tr_vals;
     const int *x_tr_inds;
     const int *x_tr_poss;
     const int *x_tr_lens;
     const double *y_tr;
+    // training sample i is row rows[i] of the arrays above, it is row i if rows is NULL.
+    const int *rows;
     bool is_sparse;
-    int n;
+    int n; // number of training samples, the length of rows if it is given.
     int p;
     // this is only for the graph operator.
     bool is_graph;
@@ -71,17 +105,216 @@ typedef struct {
     int g;
     double *proj_prizes;
     GraphStat *graph_stat;
+    // optional held-out set for AUC evaluation, the training set is used if y_te is NULL.
+    const double *x_te_vals;
+    const int *x_te_inds;
+    const int *x_te_poss;
+    const int *x_te_lens;
+    const double *y_te;
+    int n_te;
+    const DataStat *stat; // cached statistics of the training set, NULL if they are not given.
 } Data;
 
+/** @param build_csc for sparse data, also build the CSC index of the training set. */
+DataStat *make_data_stat(const Data *data, bool build_csc);
+
+bool free_data_stat(DataStat *stat);
+
 GraphStat *make_graph_stat(int p, int m);
 
 bool free_graph_stat(GraphStat *graph_stat);
 
+/**
+ * Lazy (just-in-time) elastic-net proximal operator. The proximal step
+ *      w <- sign(w) * max(0, |w| - eta_t * l1) / (1 + eta_t * l2)
+ * is applied to all coordinates implicitly: each coordinate is stored as
+ *      w_j = sgn_j * max(0, tau_j - prox_q) / prox_p,
+ * where prox_p is the cumulative product of (1 + eta_k * l2) and prox_q is the
+ * cumulative sum of eta_k * l1 * prox_p_{k-1}. A coordinate is only written
+ * when a sample touches it. Coordinates with tau_j > prox_q are alive and kept
+ * in a min-heap on tau_j, so that <w, posi_x> and <w, nega_x> can be read in
+ * O(1) from running sums over alive coordinates.
+ */
+typedef struct {
+    double *tau;        // tau_j = |w_j| * prox_p + prox_q at the last touch.
+    double *sgn;        // sign of w_j at the last touch.
+    double prox_p;
+    double prox_q;
+    int *heap;          // alive coordinates, min-heap on tau.
+    int *heap_pos;      // position of each coordinate in heap, -1 if dead.
+    int heap_size;
+    const double *posi_x;
+    const double *nega_x;
+    double posi_s1;     // sum_{alive} posi_x_j * sgn_j * tau_j
+    double posi_s0;     // sum_{alive} posi_x_j * sgn_j
+    double nega_s1;
+    double nega_s0;
+    int p;
+} LazyProx;
+
+LazyProx *make_lazy_prox(int p, const double *posi_x, const double *nega_x);
+
+bool free_lazy_prox(LazyProx *lazy);
+
+/**
+ * A weight vector stored as w = scale * u together with sq_norm = ||u||^2.
+ * Scaling w or projecting it onto an ell_2 ball only changes scale, i.e.,
+ * O(1), and updating a few coordinates costs O(nnz). The scale is folded back
+ * into u when it becomes too small or too large.
+ */
+typedef struct {
+    double *u;
+    double scale;
+    double sq_norm;
+    int p;
+    bool own_u;     // false if u is borrowed from the caller, e.g., re->wt.
+} ScaledVector;
+
+/**
+ * @param p the dimension of the vector.
+ * @param buffer use buffer as u if it is not NULL, otherwise allocate u.
+ */
+ScaledVector *make_scaled_vector(int p, double *buffer);
+
+bool free_scaled_vector(ScaledVector *sv);
+
+/**
+ * Lazy weighted average of the iterates w^(k) = c_k * u^(k) of a ScaledVector,
+ *      w_bar_t = sum_{k<=t} gamma_k * w^(k-1) / sum_{k<=t} gamma_k.
+ * cum_wei accumulates gamma_k * c_{k-1}, so that a coordinate j whose u_j did
+ * not change since it was last touched contributes u_j * (cum_wei - last_j).
+ * Only the coordinates that change need to be touched, i.e., O(nnz) per step.
+ */
+typedef struct {
+    double *acc;        // sum of gamma_k * w_j^(k-1) up to last_j.
+    double *last;       // cum_wei when coordinate j was last touched.
+    double cum_wei;
+    double cum_gamma;
+    int p;
+} LazyAverage;
+
+LazyAverage *make_lazy_average(int p);
+
+bool free_lazy_average(LazyAverage *avg);
+
+/**
+ * K weight vectors which are trained in lockstep on the same samples, e.g.,
+ * the points of a parameter grid. w_k = scale[k] * u_k is column k of the
+ * p x K row-major matrix u, so coordinate j of all of them is contiguous: the
+ * K scores of a sample are one pass over its nonzeros (one dgemv if it is
+ * dense) and its K updates are another one. The sample is read once for all.
+ */
+typedef struct {
+    double *u;
+    double *scale;
+    double *sq_norm;    // ||u_k||^2
+    double *wei;        // buffer of K entries.
+    int p;
+    int num_models;
+} ScaledMatrix;
+
+ScaledMatrix *make_scaled_matrix(int p, int num_models);
+
+bool free_scaled_matrix(ScaledMatrix *sm);
+
+/** a LazyAverage of each column of a ScaledMatrix, acc and last are p x K as its u. */
+typedef struct {
+    double *acc;
+    double *last;
+    double *cum_wei;
+    double *cum_gamma;
+    int p;
+    int num_models;
+} LazyAverages;
+
+LazyAverages *make_lazy_averages(int p, int num_models);
+
+bool free_lazy_averages(LazyAverages *avg);
+
+/**
+ * Sparse accumulator: a dense scratch vector together with the list of the
+ * coordinates touched since the last clear. Visiting and clearing it costs
+ * O(num_touched) instead of O(p).
+ */
+typedef struct {
+    double *vals;
+    int *touched;       // touched coordinates, in the order of their first touch.
+    bool *is_touched;
+    int num_touched;
+    int p;
+} SparseAccum;
+
+SparseAccum *make_sparse_accum(int p);
+
+bool free_sparse_accum(SparseAccum *sa);
+
 typedef struct {
     double val;
     int index;
 } data_pair;
 
+/**
+ * AUC evaluation during training. It scores the held-out set if there is one
+ * and the training set otherwise, optionally only a fixed random subsample of
+ * its rows. All buffers are allocated once. For sparse data, a column-major
+ * (CSC) index of the evaluated rows gives the rows which have a nonzero on a
+ * weight changed since the last evaluation. Only these rows are rescored when
+ * this is cheaper than scoring all of them; the scores are the same.
+ */
+typedef struct {
+    const double *x_vals;
+    const int *x_inds;
+    const int *x_poss;
+    const int *x_lens;
+    bool is_sparse;
+    int p;
+    int *rows;          // the evaluated rows, in increasing order.
+    int num_rows;
+    double *y_true;     // labels of the evaluated rows.
+    double *y_pred;     // scores of the evaluated rows.
+    data_pair *pairs;   // buffer to sort the scores.
+    double growth;      // geometric cadence if it is larger than 1.
+    double next_eval;
+    int *csc_poss;      // start of each column, p + 1 entries, NULL without CSC.
+    int *csc_rows;      // positions in rows of the nonzeros of each column.
+    int csc_nnz;
+    bool owns_csc;      // false if the CSC index is the one of data->stat.
+    double *w_last;     // the weights which y_pred is the score of.
+    bool has_pred;      // whether y_pred is current for w_last.
+    bool *is_stale;     // rows to be rescored.
+    int *stale_rows;
+} Evaluator;
+
+Evaluator *make_evaluator(const Data *data, const GlobalParas *paras);
+
+bool free_evaluator(Evaluator *ev);
+
+/**
+ * Stopping criteria, which are checked every epoch_len iterations (an epoch):
+ *   1. relative change ||w - w_prev|| / ||w_prev|| <= stop_eps, where w_prev
+ *      is the iterate one iteration earlier. It is written to re->wt_prev only
+ *      once per epoch, right before the last iteration of it.
+ *   2. plateau of the recorded AUC, see auc_patience and auc_tol.
+ *   3. wall-clock budget, see time_budget.
+ */
+typedef struct {
+    int epoch_len;
+    int num_passes;
+    int verbose;
+    double stop_eps;
+    double time_budget;
+    double start_wall;  // wall-clock time when the run started, in seconds.
+    int auc_patience;
+    double auc_tol;
+    double best_auc;
+    int num_stale;      // epoch ends in a row without an improvement of the AUC.
+    int last_auc_len;   // re->auc_len at the last check.
+} StopCriteria;
+
+StopCriteria *make_stop_criteria(const GlobalParas *paras, int epoch_len);
+
+bool free_stop_criteria(StopCriteria *sc);
+
 bool head_tail_binsearch(
         const EdgePair *edges, const double *costs, const double *prizes,
         int n, int m, int target_num_clusters, int root, int sparsity_low,
@@ -160,6 +393,39 @@ void _algo_sht_auc(Data *data,
                    double para_c,
                    double para_l2_reg);
 
+/**
+ * The grid modes of SOLAM, SPAM and SHT-AUC train num_models models in one pass
+ * over the data, model k with the k-th entry of each parameter array, and write
+ * its results to re[k]. They are the same as the single runs up to rounding,
+ * except that lazy_update and track_support are not used.
+ * A model which stops early is frozen, the others go on.
+ */
+void _algo_solam_grid(Data *data,
+                      GlobalParas *paras,
+                      AlgoResults **re,
+                      const double *para_xi,
+                      const double *para_r,
+                      int num_models);
+
+void _algo_spam_grid(Data *data,
+                     GlobalParas *paras,
+                     AlgoResults **re,
+                     const double *para_xi,
+                     const double *para_l1_reg,
+                     const double *para_l2_reg,
+                     int num_models);
+
+/** the models share version and para_b, so that they see the same blocks. */
+void _algo_sht_auc_grid(Data *data,
+                        GlobalParas *paras,
+                        AlgoResults **re,
+                        int version,
+                        const int *para_s,
+                        int para_b,
+                        const double *para_c,
+                        const double *para_l2_reg,
+                        int num_models);
+
 void _algo_sto_iht(Data *data,
                    GlobalParas *paras,
                    AlgoResults *re,
@@ -188,8 +454,69 @@ void _algo_hsg_ht(Data *data,
                   double para_step_init,
                   double para_l2);
 
+/**
+ * Workspace of the hard thresholding operator, which is reused across calls.
+ * The k-th largest magnitude of the last call is used as a pivot: only the
+ * entries at least as large as it are candidates of the selection. If there
+ * are fewer than k of them, all entries are candidates.
+ */
+typedef struct {
+    double *mags;   // magnitudes of the candidates, p at most.
+    int *supp;      // indices of the kept entries, in increasing order.
+    int supp_size;
+    double pivot;   // the k-th largest magnitude of the last call, 0 before.
+    int p;
+    int k;
+} HTWorkspace;
+
+HTWorkspace *make_ht_workspace(int p, int k);
+
+bool free_ht_workspace(HTWorkspace *ws);
+
+/**
+ * Keep the entries of arr whose magnitudes are larger than the k-th largest
+ * one, the indices of them are in ws->supp.
+ * @return the number of entries kept, which is at most k.
+ */
+int _hard_thresholding_ws(HTWorkspace *ws, double *arr);
+
 int _hard_thresholding(double *arr, int n, int k);
 
+/**
+ * Sparse sketch mode of OPAUC, where the iterate is kept as
+ *      w = r + Z_0 a_0 + Z_1 a_1
+ * with the sketches Z_0 (positive) and Z_1 (negative) of size p x tau. A
+ * sample x only changes the rows of Z it touches and r absorbs the change, so
+ * w stays the same. Z_q^T r, Z_q^T s_o and the Gram matrices Z_q^T Z_o are
+ * updated along, so that Z_o^T w and the gradient step cost
+ * O(nnz * tau + tau^2) instead of O(p * tau). w is only formed when needed.
+ * r itself is a scaled vector plus multiples of the class sums,
+ *      r = scale * (v + coef_0 s_0 + coef_1 s_1),
+ * so that the shrinkage and the center term of a step are O(1), and <s_q, r>
+ * is read in O(1) from <s_q, v> and <s_q, s_o>.
+ */
+typedef struct {
+    double *z[2];       // sketches, p x tau, row-major.
+    double *v;
+    double scale;
+    double coef[2];
+    double *s[2];       // s_o, the sum of the samples of class o.
+    double vs[2];       // vs[q] = <s_q, v>
+    double ss[2][2];    // ss[q][o] = <s_q, s_o>
+    double *a[2];
+    double *zr[2];      // zr[q] = Z_q^T r
+    double *zs[2][2];   // zs[q][o] = Z_q^T s_o, s_o is the sum of the samples of class o.
+    double *gram[2][2]; // gram[q][o] = Z_q^T Z_o, tau x tau.
+    double *zx[2];      // Z_q^T x of the current sample.
+    double *u;          // Z_o^T w of the current step.
+    int p;
+    int tau;
+} OpaucSketch;
+
+OpaucSketch *make_opauc_sketch(int p, int tau);
+
+bool free_opauc_sketch(OpaucSketch *sk);
+
 /**
  *
  * @param data
@@ -228,4 +555,34 @@ void _algo_fsauc(Data *data,
                  double para_r,
                  double para_g);
 
+/** the solvers of cross_validate, each one with its parameters in the order of a grid row. */
+typedef enum {
+    ALGO_SOLAM = 0,     // para_xi, para_r
+    ALGO_SPAM = 1,      // para_xi, para_l1_reg, para_l2_reg
+    ALGO_FSAUC = 2,     // para_r, para_g
+    ALGO_OPAUC = 3,     // para_eta, para_lambda, para_tau
+    ALGO_SHT_AUC = 4,   // version, para_s, para_b, para_c, para_l2_reg
+    ALGO_STO_IHT = 5,   // para_s, para_b, para_xi, para_l2_reg
+    ALGO_HSG_HT = 6     // para_s, para_tau, para_zeta, para_step_init, para_l2
+} AlgoId;
+
+extern const int algo_num_paras[]; // the number of parameters of each AlgoId.
+
+/**
+ * K-fold cross validation of algo over a grid of parameters. Each fold is
+ * held out once: the solver is trained on the rows of the other folds, which
+ * are read in place via Data.rows, and the exact AUC of the learned weights,
+ * the same as roc_auc_score, is computed on the held-out rows. All the runs use the seed of paras, so the
+ * results do not depend on num_threads.
+ * @param grid num_grid x algo_num_paras[algo] parameters, row-major.
+ * @param folds the fold of each training sample, in [0, num_folds), every fold is non-empty.
+ * @param num_threads the runs are spread over this many threads.
+ * @param aucs num_grid x num_folds, the AUC on the held-out fold.
+ * @param num_nonzeros num_grid x num_folds, the number of nonzero weights.
+ * @param epochs num_grid x num_folds, the epochs run.
+ */
+void cross_validate(const Data *data, const GlobalParas *paras, int algo, const double *grid, int num_grid,
+                    const int *folds, int num_folds, int num_threads,
+                    double *aucs, double *num_nonzeros, double *epochs);
+
 #endif //SPARSE_AUC_AUC_OPT_METHODS_H
@@ -1,7 +1,10 @@
 #include "fast_pcst.h"
+#include "auc_log.h"
 
 #define left(i)   ((unsigned int)(i) << 1u)
 #define parent(i) ((unsigned int)(i) >> 1u)
+#define PCST_LINE_1 "-------------------------------------------------------------------------------"
+#define PCST_LINE_2 "_______________________________________________________________________________"
 #define right(i) ((unsigned int)(i) >> 1u)
 
 // TODO Warning about the size of the buffer:
@@ -231,29 +234,16 @@ PCST *make_pcst(const EdgePair *edges,
     pcst->p2_re = malloc(sizeof(int) * n);
     pcst->verbose = verbose;
     if (pcst->verbose > 0) {
-        for (int ii = 0; ii < 79; ii++) { printf("%s", "-"); } // line
-        printf("\n");
-        int left = (79 - 20) / 2, right = (79 - 20) / 2;
-        for (int i = 0; i < left; i++) {
-            printf(" ");
-        }
-        printf("%s", " PCST configuration ");
-        for (int i = 0; i < right; i++) { printf(" "); }
-        printf("\n");
-        for (int ii = 0; ii < 79; ii++) { printf("%s", "-"); } // line
-        printf("\n");
-        printf("%-60s%-29s\n", "parameter", "val");
-        for (int ii = 0; ii < 79; ii++) { printf("%s", "_"); } // line
-        printf("\n");
-        printf("%-60s %-6d\n", "number of nodes in graph", n);
-        printf("%-60s %-6d\n", "number of edges in graph", m);
-        printf("%-60s %-6d\n", "root(-1 is non-root)", root);
-        printf("%-60s %-6.2e\n", "pcst epsilon", eps);
-        printf("%-60s %-6d\n", "number of connected components", g);
-        printf("%-60s %-6u\n", "selected pruning strategy", pcst->pruning);
-        for (int ii = 0; ii < 79; ii++) { printf("%s", "_"); } // line
-        printf("\n");
-        printf("\n\n\n");
+        log_info("%s\n%*s%s%*s\n%s\n", PCST_LINE_1, (79 - 20) / 2, "", " PCST configuration ",
+                 (79 - 20) / 2, "", PCST_LINE_1);
+        log_info("%-60s%-29s\n%s\n", "parameter", "val", PCST_LINE_2);
+        log_info("%-60s %-6d\n", "number of nodes in graph", n);
+        log_info("%-60s %-6d\n", "number of edges in graph", m);
+        log_info("%-60s %-6d\n", "root(-1 is non-root)", root);
+        log_info("%-60s %-6.2e\n", "pcst epsilon", eps);
+        log_info("%-60s %-6d\n", "number of connected components", g);
+        log_info("%-60s %-6u\n", "selected pruning strategy", pcst->pruning);
+        log_info("%s\n\n\n\n", PCST_LINE_2);
     }
     return pcst;
 }
@@ -291,7 +281,7 @@ bool run_pcst(PCST *pcst,
     pcst->clusters_size = pcst->n;
     for (int ii = 0; ii < pcst->n; ii++) {
         if (pcst->prizes[ii] < 0.0) {
-            printf("Error: prizes should always be non-negative.\n");
+            log_error("Error: prizes should always be non-negative.\n");
             exit(EXIT_FAILURE);
         }
         pcst->clusters[ii].active = (ii != pcst->root);
@@ -328,11 +318,10 @@ bool run_pcst(PCST *pcst,
         double cost = pcst->costs[ii];
         if (uu < 0 || vv < 0 || uu >= pcst->n
             || vv >= pcst->n || cost < 0.0) {
-            fprintf(stderr, "ii: %d uu: %d vv: %d cost: %.4f\n", ii, uu, vv, cost);
-            char *error_1 = "node index should be [0,n-1].\n";
-            char *error_2 = "edge endpoint is out of range: too large.\n";
-            char *error_3 = "edge endpoint is negative.\n";
-            fprintf(stderr, "%s%s%s", error_1, error_2, error_3);
+            log_error("ii: %d uu: %d vv: %d cost: %.4f\n", ii, uu, vv, cost);
+            log_error("node index should be [0,n-1].\n"
+                      "edge endpoint is out of range: too large.\n"
+                      "edge endpoint is negative.\n");
             exit(EXIT_FAILURE);
         }
         EdgePart *uu_part, *vv_part;
@@ -397,7 +386,7 @@ bool run_pcst(PCST *pcst,
         }
     }
     if (pcst->root >= 0 && pcst->g > 0) {
-        printf("Error: g must be 0 in the rooted case.\n");
+        log_error("Error: g must be 0 in the rooted case.\n");
         return false;
     }
     int num_active_clusters = pcst->n;
@@ -879,7 +868,7 @@ bool run_pcst(PCST *pcst,
         }
         return true;
     }
-    printf("Error: unknown pruning scheme.\n");
+    log_error("Error: unknown pruning scheme.\n");
     return false;
 }
 
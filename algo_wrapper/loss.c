@@ -2,6 +2,7 @@
 #include <stdlib.h>
 #include <string.h>
 #include "loss.h"
+#include "auc_log.h"
 
 void expit(const double *x, double *out, int x_len) {
     for (int i = 0; i < x_len; i++) {
@@ -47,115 +48,227 @@ double log_sum_exp(const double *x, int x_len) {
     return max_x + log(out);
 }
 
-void logistic_loss_grad(const double *w,
-                        const double *x_tr,
-                        const double *y_tr,
-                        double *loss_grad,
-                        double eta,
-                        int n_samples,
-                        int n_features) {
-    for (int i = 0; i < n_features + 1; i++) {
+LossWorkspace *make_loss_workspace(int max_n, bool check_nan) {
+    LossWorkspace *ws = malloc(sizeof(LossWorkspace));
+    max_n = max_n > 1 ? max_n : 1;
+    ws->yz = malloc(sizeof(double) * max_n);
+    ws->z0 = malloc(sizeof(double) * max_n);
+    ws->max_n = max_n;
+    ws->check_nan = check_nan;
+    return ws;
+}
+
+bool free_loss_workspace(LossWorkspace *ws) {
+    free(ws->z0);
+    free(ws->yz);
+    free(ws);
+    return true;
+}
+
+/** make sure the buffers of ws can hold n samples. */
+static void _loss_ws_reserve(LossWorkspace *ws, int n) {
+    if (n > ws->max_n) {
+        ws->yz = realloc(ws->yz, sizeof(double) * n);
+        ws->z0 = realloc(ws->z0, sizeof(double) * n);
+        ws->max_n = n;
+    }
+}
+
+static void _check_nan(const double *w, int len) {
+    for (int i = 0; i < len; i++) {
         if (isnan(w[i])) {
-            printf("%f\n", w[i]);
-            printf("warning: loss grad error!\n");
+            log_warn("warning: loss grad error, w[%d] is %f!\n", i, w[i]);
             break;
         }
     }
+}
+
+/**
+ * Given the margins yz[i] = xi^T*w+c, it computes yz[i] *= y[i] and, in one pass,
+ * z0[i] = (expit(yz[i]) - 1.) * y[i] and the loss -sum log_logistic(yz[i]).
+ * y[i] is y_tr[rows[i]], or y_tr[i] if rows is NULL.
+ * @return the loss of the data fitting part, sum of z0 is written to sum_z0.
+ */
+static double _logistic_fused(LossWorkspace *ws, const double *y_tr, const int *rows, int n, double *sum_z0) {
+    double loss = 0.0;
+    *sum_z0 = 0.0;
+    for (int i = 0; i < n; i++) {
+        double yi = y_tr[rows == NULL ? i : rows[i]];
+        double yz = ws->yz[i] * yi;
+        double exp_yz = exp(-fabs(yz)); // shared by expit and log_logistic
+        if (yz > 0.0) {
+            ws->z0[i] = (1. / (1. + exp_yz) - 1.) * yi;
+            loss -= -log(1.0 + exp_yz);
+        } else {
+            ws->z0[i] = (1. - 1. / (1. + exp_yz) - 1.) * yi;
+            loss -= yz - log(1.0 + exp_yz);
+        }
+        ws->yz[i] = yz;
+        *sum_z0 += ws->z0[i];
+    }
+    return loss;
+}
+
+/** grad = x^T*z0 + eta*grad over the given rows of dense x_tr, or over all of them if rows is NULL. */
+static void _grad_dense(const double *x_tr, const int *rows, const double *z0, double eta,
+                        double *grad, int n, int p) {
+    if (rows == NULL) {
+        cblas_dgemv(CblasRowMajor, CblasTrans, n, p, 1., x_tr, p, z0, 1, eta, grad, 1);
+        return;
+    }
+    cblas_dscal(p, eta, grad, 1);
+    for (int i = 0; i < n; i++) {
+        cblas_daxpy(p, z0[i], x_tr + (size_t) rows[i] * p, 1, grad, 1);
+    }
+}
+
+void logistic_loss_grad_ws(LossWorkspace *ws,
+                           const double *w,
+                           const double *x_tr,
+                           const double *y_tr,
+                           const int *rows,
+                           double *loss_grad,
+                           double eta,
+                           int n_samples,
+                           int n_features) {
+    if (ws->check_nan) { _check_nan(w, n_features + 1); }
+    _loss_ws_reserve(ws, n_samples);
     int i, n = n_samples, p = n_features;
-    double intercept = w[p], sum_z0 = 0.0;
-    loss_grad[0] = 0.0;
-    double *yz = malloc(sizeof(double) * n);
-    double *z0 = malloc(sizeof(double) * n);
-    double *logistic = malloc(sizeof(double) * n);
+    double intercept = w[p], sum_z0;
     for (i = 0; i < n; i++) { /** calculate yz */
-        yz[i] = intercept;
+        ws->yz[i] = intercept;
     }
     //x_tr^T*w+
-    cblas_dgemv(CblasRowMajor, CblasNoTrans, n, p, 1., x_tr, p, w, 1, 1., yz, 1);
-    for (i = 0; i < n; i++) {
-        yz[i] *= y_tr[i];
-    }
-    expit(yz, z0, n); // calculate z0 and final intercept
-    /** calculate logistic logistic[i] = 1/(1+exp(-y[i]*(xi^T*w+c)))*/
-    log_logistic(yz, logistic, n);
-    /** calculate loss of data fitting part*/
-    for (i = 0; i < n; i++) {
-        z0[i] = (z0[i] - 1.) * y_tr[i];
-        sum_z0 += z0[i];
-        loss_grad[0] -= logistic[i];
+    if (rows == NULL) {
+        cblas_dgemv(CblasRowMajor, CblasNoTrans, n, p, 1., x_tr, p, w, 1, 1., ws->yz, 1);
+    } else {
+        for (i = 0; i < n; i++) {
+            ws->yz[i] += cblas_ddot(p, x_tr + (size_t) rows[i] * p, 1, w, 1);
+        }
     }
+    loss_grad[0] = _logistic_fused(ws, y_tr, rows, n, &sum_z0);
     /**calculate loss of regularization part (it does not have intercept)*/
     loss_grad[0] += 0.5 * eta * cblas_ddot(p, w, 1, w, 1);
     /** calculate gradient of coefficients*/
     memcpy(loss_grad + 1, w, sizeof(double) * p);
     /** x^T*z0 + eta*w, where z0[i]=(logistic[i] - 1.)*yi*/
-    cblas_dgemv(CblasRowMajor, CblasTrans,
-                n, p, 1., x_tr, p, z0, 1, eta, loss_grad + 1, 1);
+    _grad_dense(x_tr, rows, ws->z0, eta, loss_grad + 1, n, p);
     /** calculate gradient of intercept part*/
     loss_grad[p + 1] = sum_z0; // intercept part
-    free(logistic);
-    free(z0);
-    free(yz);
 }
 
-void logistic_loss_grad_sparse(const double *w,
-                               const double *x_tr,
+void logistic_loss_grad(const double *w,
+                        const double *x_tr,
+                        const double *y_tr,
+                        double *loss_grad,
+                        double eta,
+                        int n_samples,
+                        int n_features) {
+    LossWorkspace *ws = make_loss_workspace(n_samples, true);
+    logistic_loss_grad_ws(ws, w, x_tr, y_tr, NULL, loss_grad, eta, n_samples, n_features);
+    free_loss_workspace(ws);
+}
+
+void logistic_loss_grad_csr_ws(LossWorkspace *ws,
+                               const double *w,
+                               const double *x_vals,
+                               const int *x_inds,
+                               const int *x_poss,
+                               const int *x_lens,
                                const double *y_tr,
+                               const int *rows,
                                double *loss_grad,
                                double eta,
                                int n_samples,
                                int n_features) {
-    //sub_p is number of nonzeros in w.
-    int i, n = n_samples, p = n_features, sub_p = 0;
-    double intercept = w[p], sum_z0 = 0.0;
-    loss_grad[0] = 0.0;
-    double *yz = malloc(sizeof(double) * n);
-    double *z0 = malloc(sizeof(double) * n);
-    double *logistic = malloc(sizeof(double) * n);
-    for (i = 0; i < n; i++) { /** calculate yz */
-        yz[i] = intercept;
-    }
-    double nonzero_w[p];
-    int nonzero_w_ind[p];
-    for (i = 0; i < p; i++) {
-        if (w[i] != 0.0) {
-            nonzero_w_ind[sub_p] = i;
-            nonzero_w[sub_p] = w[i];
-            sub_p++;
-        }
-    }
-    //x_tr^T*w+ to use the sparsity of w
+    if (ws->check_nan) { _check_nan(w, n_features + 1); }
+    _loss_ws_reserve(ws, n_samples);
+    int i, n = n_samples, p = n_features;
+    double intercept = w[p], sum_z0;
+    //x_tr^T*w+ only over the nonzeros of each row
     for (i = 0; i < n; i++) {
-        double tmp_val = 0.0;
-        for (int j = 0; j < sub_p; j++) {
-            tmp_val += x_tr[i * p + nonzero_w_ind[j]] * nonzero_w[j];
+        int row = rows == NULL ? i : rows[i];
+        const double *xi_vals = x_vals + x_poss[row];
+        const int *xi_inds = x_inds + x_poss[row];
+        double tmp_val = intercept;
+        for (int j = 0; j < x_lens[row]; j++) {
+            tmp_val += xi_vals[j] * w[xi_inds[j]];
         }
-        yz[i] = yz[i] + tmp_val;
+        ws->yz[i] = tmp_val;
     }
+    loss_grad[0] = _logistic_fused(ws, y_tr, rows, n, &sum_z0);
+    /**calculate loss of regularization part (it does not have intercept)*/
+    loss_grad[0] += 0.5 * eta * cblas_ddot(p, w, 1, w, 1);
+    /** calculate gradient of coefficients*/
+    memcpy(loss_grad + 1, w, sizeof(double) * p);
+    cblas_dscal(p, eta, loss_grad + 1, 1);
+    /** x^T*z0 + eta*w, where z0[i]=(logistic[i] - 1.)*yi, row by row*/
     for (i = 0; i < n; i++) {
-        yz[i] *= y_tr[i];
+        int row = rows == NULL ? i : rows[i];
+        const double *xi_vals = x_vals + x_poss[row];
+        const int *xi_inds = x_inds + x_poss[row];
+        for (int j = 0; j < x_lens[row]; j++) {
+            loss_grad[xi_inds[j] + 1] += ws->z0[i] * xi_vals[j];
+        }
     }
-    expit(yz, z0, n); // calculate z0 and final intercept
-    /** calculate logistic logistic[i] = 1/(1+exp(-y[i]*(xi^T*w+c)))*/
-    log_logistic(yz, logistic, n);
-    /** calculate loss of data fitting part*/
+    /** calculate gradient of intercept part*/
+    loss_grad[p + 1] = sum_z0; // intercept part
+}
+
+void logistic_loss_grad_support_ws(LossWorkspace *ws,
+                                   const double *w,
+                                   const int *supp,
+                                   int supp_size,
+                                   const double *x_tr,
+                                   const double *y_tr,
+                                   const int *rows,
+                                   double *loss_grad,
+                                   double eta,
+                                   int n_samples,
+                                   int n_features) {
+    if (ws->check_nan) { _check_nan(w, n_features + 1); }
+    _loss_ws_reserve(ws, n_samples);
+    int i, n = n_samples, p = n_features;
+    double intercept = w[p], sum_z0, sq_norm_w = 0.0;
+    //x_tr^T*w+ only over the support of w
     for (i = 0; i < n; i++) {
-        z0[i] = (z0[i] - 1.) * y_tr[i];
-        sum_z0 += z0[i];
-        loss_grad[0] -= logistic[i];
+        const double *xi = x_tr + (size_t) (rows == NULL ? i : rows[i]) * p;
+        double tmp_val = intercept;
+        for (int j = 0; j < supp_size; j++) {
+            tmp_val += xi[supp[j]] * w[supp[j]];
+        }
+        ws->yz[i] = tmp_val;
     }
+    loss_grad[0] = _logistic_fused(ws, y_tr, rows, n, &sum_z0);
     /**calculate loss of regularization part (it does not have intercept)*/
-    loss_grad[0] += 0.5 * eta * cblas_ddot(p, w, 1, w, 1);
+    for (int j = 0; j < supp_size; j++) {
+        sq_norm_w += w[supp[j]] * w[supp[j]];
+    }
+    loss_grad[0] += 0.5 * eta * sq_norm_w;
     /** calculate gradient of coefficients*/
     memcpy(loss_grad + 1, w, sizeof(double) * p);
     /** x^T*z0 + eta*w, where z0[i]=(logistic[i] - 1.)*yi*/
-    cblas_dgemv(CblasRowMajor, CblasTrans,
-                n, p, 1., x_tr, p, z0, 1, eta, loss_grad + 1, 1);
+    _grad_dense(x_tr, rows, ws->z0, eta, loss_grad + 1, n, p);
     /** calculate gradient of intercept part*/
     loss_grad[p + 1] = sum_z0; // intercept part
-    free(logistic);
-    free(z0);
-    free(yz);
+}
+
+void logistic_loss_grad_sparse(const double *w,
+                               const double *x_tr,
+                               const double *y_tr,
+                               double *loss_grad,
+                               double eta,
+                               int n_samples,
+                               int n_features) {
+    //supp are the nonzeros of w, to use the sparsity of w.
+    int *supp = malloc(sizeof(int) * n_features), supp_size = 0;
+    for (int i = 0; i < n_features; i++) {
+        if (w[i] != 0.0) { supp[supp_size++] = i; }
+    }
+    LossWorkspace *ws = make_loss_workspace(n_samples, false);
+    logistic_loss_grad_support_ws(ws, w, supp, supp_size, x_tr, y_tr, NULL, loss_grad, eta, n_samples, n_features);
+    free_loss_workspace(ws);
+    free(supp);
 }
 
 
@@ -190,13 +303,7 @@ void least_square_loss_grad(const double *w,
                             double eta,
                             int n_samples,
                             int n_features) {
-    for (int i = 0; i < n_features + 1; i++) {
-        if (isnan(w[i])) {
-            printf("%f\n", w[i]);
-            printf("warning: loss grad error!\n");
-            break;
-        }
-    }
+    _check_nan(w, n_features + 1);
     int i, n = n_samples, p = n_features;
     double *yz = malloc(sizeof(double) * n);
     double *w0 = malloc(sizeof(double) * n);
@@ -2,6 +2,7 @@
 #define SPARSE_AUC_LOSS_H
 
 #include <math.h>
+#include <stdbool.h>
 
 /**
  * Quote from Scipy:
@@ -34,6 +35,21 @@ void logistic(const double *x, double *out, int x_len);
 
 double log_sum_exp(const double *x, int x_len);
 
+/**
+ * Buffers of the logistic loss and gradient, which are allocated once per run
+ * instead of once per call. They grow if a call has more than max_n samples.
+ */
+typedef struct {
+    double *yz;         // y_i * (x_i^T w + c)
+    double *z0;         // (expit(yz_i) - 1) * y_i
+    int max_n;
+    bool check_nan;     // check w for NaN at each call, for debugging.
+} LossWorkspace;
+
+LossWorkspace *make_loss_workspace(int max_n, bool check_nan);
+
+bool free_loss_workspace(LossWorkspace *ws);
+
 /**
  * Computes the logistic loss and gradient.
  * Parameters
@@ -55,6 +71,24 @@ void logistic_loss_grad(const double *w,
                         int n_samples,
                         int n_features);
 
+/**
+ * The same as logistic_loss_grad, the buffers are taken from ws. Sample i is
+ * row rows[i] of x_tr and y_tr, rows can be NULL for the first n_samples rows.
+ */
+void logistic_loss_grad_ws(LossWorkspace *ws,
+                           const double *w,
+                           const double *x_tr,
+                           const double *y_tr,
+                           const int *rows,
+                           double *loss_grad,
+                           double eta,
+                           int n_samples,
+                           int n_features);
+
+/**
+ * The same as logistic_loss_grad, but it uses the sparsity of w, so that x_tr^T*w
+ * costs O(n_samples * nnz(w)) instead of O(n_samples * n_features).
+ */
 void logistic_loss_grad_sparse(const double *w,
                                const double *x_tr,
                                const double *y_tr,
@@ -63,6 +97,48 @@ void logistic_loss_grad_sparse(const double *w,
                                int n_samples,
                                int n_features);
 
+/**
+ * The same as logistic_loss_grad_ws, but x_tr is given in the CSR format: the
+ * i-th sample has x_lens[i] nonzeros starting at x_poss[i] in x_vals and
+ * x_inds. Passing x_poss + k, x_lens + k and y_tr + k selects the rows from k.
+ * The data part costs O(nnz) instead of O(n_samples * n_features).
+ * @param x_vals: values of the nonzeros.
+ * @param x_inds: feature indices of the nonzeros.
+ * @param x_poss: start of each sample in x_vals and x_inds.
+ * @param x_lens: number of nonzeros of each sample.
+ */
+void logistic_loss_grad_csr_ws(LossWorkspace *ws,
+                               const double *w,
+                               const double *x_vals,
+                               const int *x_inds,
+                               const int *x_poss,
+                               const int *x_lens,
+                               const double *y_tr,
+                               const int *rows,
+                               double *loss_grad,
+                               double eta,
+                               int n_samples,
+                               int n_features);
+
+/**
+ * The same as logistic_loss_grad_ws, but w[0:n_features] is only nonzero on supp,
+ * so that x_tr^T*w costs O(n_samples * supp_size) instead of O(n_samples * n_features).
+ * logistic_loss_grad_sparse finds supp itself.
+ * @param supp: indices of the nonzeros of w[0:n_features].
+ * @param supp_size: number of indices in supp.
+ */
+void logistic_loss_grad_support_ws(LossWorkspace *ws,
+                                   const double *w,
+                                   const int *supp,
+                                   int supp_size,
+                                   const double *x_tr,
+                                   const double *y_tr,
+                                   const int *rows,
+                                   double *loss_grad,
+                                   double eta,
+                                   int n_samples,
+                                   int n_features);
+
 void logistic_predict(const double *x_te,
                       const double *wt,
                       double *pred_prob,
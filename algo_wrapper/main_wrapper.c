@@ -1,4 +1,5 @@
 #include <Python.h>
+#include <structmember.h>
 #include <numpy/arrayobject.h>
 #include "auc_opt_methods.h"
 
@@ -27,241 +28,826 @@ static PyObject *test(PyObject *self, PyObject *args) {
     return results;
 }
 
+static void _free_capsule(PyObject *capsule) {
+    free(PyCapsule_GetPointer(capsule, NULL));
+}
+
+/** an array of shape dims on top of buf, which is freed when the array is collected. */
+static PyObject *_owned_ndarray(double *buf, int nd, npy_intp *dims) {
+    PyObject *arr = PyArray_SimpleNewFromData(nd, dims, NPY_DOUBLE, buf);
+    PyArray_SetBaseObject((PyArrayObject *) arr, PyCapsule_New(buf, NULL, _free_capsule));
+    return arr;
+}
+
+static PyObject *_owned_array(double *buf, npy_intp len) {
+    return _owned_ndarray(buf, 1, &len);
+}
+
+/** wt, aucs and rts are returned as arrays that take over the buffers of re, without any copy. */
 PyObject *get_results(int data_p, AlgoResults *re) {
     PyObject *results = PyTuple_New(4);
-    PyObject *wt = PyList_New(data_p);
-    PyObject *auc = PyList_New(re->auc_len);
-    PyObject *rts = PyList_New(re->auc_len);
     PyObject *epochs = PyList_New(1);
-    for (int i = 0; i < data_p; i++) {
-        PyList_SetItem(wt, i, PyFloat_FromDouble(re->wt[i]));
-    }
-    for (int i = 0; i < re->auc_len; i++) {
-        PyList_SetItem(auc, i, PyFloat_FromDouble(re->aucs[i]));
-        PyList_SetItem(rts, i, PyFloat_FromDouble(re->rts[i]));
-    }
     PyList_SetItem(epochs, 0, PyInt_FromLong(re->total_epochs));
-    PyTuple_SetItem(results, 0, wt);
-    PyTuple_SetItem(results, 1, auc);
-    PyTuple_SetItem(results, 2, rts);
+    PyTuple_SetItem(results, 0, _owned_array(re->wt, data_p));
+    PyTuple_SetItem(results, 1, _owned_array(re->aucs, re->auc_len));
+    PyTuple_SetItem(results, 2, _owned_array(re->rts, re->auc_len));
     PyTuple_SetItem(results, 3, epochs);
+    re->wt = NULL, re->aucs = NULL, re->rts = NULL; // they belong to the arrays now.
     return results;
 }
 
-void init_data(Data *data, PyArrayObject *x_tr_vals, PyArrayObject *x_tr_inds, PyArrayObject *x_tr_poss,
-               PyArrayObject *x_tr_lens, PyArrayObject *data_y_tr) {
-    data->x_tr_vals = (double *) PyArray_DATA(x_tr_vals);
-    data->x_tr_inds = (int *) PyArray_DATA(x_tr_inds);
-    data->x_tr_poss = (int *) PyArray_DATA(x_tr_poss);
-    data->x_tr_lens = (int *) PyArray_DATA(x_tr_lens);
-    data->y_tr = (double *) PyArray_DATA(data_y_tr);
-    data->n = (int) data_y_tr->dimensions[0];
+/** the inputs in the layout of the engine, they are kept alive until the run is finished. */
+typedef struct {
+    PyObject *objs[24];
+    int num_objs;
+} Inputs;
+
+static void _free_inputs(Inputs *in) {
+    for (int i = 0; i < in->num_objs; i++) {
+        Py_DECREF(in->objs[i]);
+    }
+    in->num_objs = 0;
+}
+
+/** integers wider than int are cast down, which is only allowed if all of them fit. */
+static bool _check_int_range(PyArrayObject *arr, const char *name) {
+    if (PyArray_ITEMSIZE(arr) <= (int) sizeof(int) || PyArray_SIZE(arr) == 0) { return true; }
+    PyObject *min_val = PyObject_CallMethod((PyObject *) arr, "min", NULL);
+    PyObject *max_val = PyObject_CallMethod((PyObject *) arr, "max", NULL);
+    bool in_range = min_val != NULL && max_val != NULL &&
+                    PyLong_AsLongLong(min_val) >= INT_MIN && PyLong_AsLongLong(max_val) <= INT_MAX;
+    Py_XDECREF(min_val), Py_XDECREF(max_val);
+    if (!in_range && !PyErr_Occurred()) {
+        PyErr_Format(PyExc_OverflowError, "%s has values out of the range of int32", name);
+    }
+    return in_range;
+}
+
+/**
+ * Any object with the buffer protocol or the array interface is accepted, e.g., memory maps.
+ * It is only copied if its dtype or its strides differ from what the engine reads: float64 or
+ * int32 (type_num), C-contiguous and aligned. Every copy is reported as a warning.
+ */
+static bool _input_array(Inputs *in, PyObject *obj, int type_num, const char *name, void **buf, npy_intp *size) {
+    PyArrayObject *arr_in = (PyArrayObject *) PyArray_FROM_O(obj);
+    if (arr_in == NULL) { return false; }
+    bool is_int = type_num == NPY_INT;
+    bool is_valid = is_int ? PyArray_ISINTEGER(arr_in) : PyArray_ISNUMBER(arr_in) && !PyArray_ISCOMPLEX(arr_in);
+    if (!is_valid) {
+        PyErr_Format(PyExc_TypeError, "%s must be %s array", name, is_int ? "an integer" : "a real-valued");
+        Py_DECREF(arr_in);
+        return false;
+    }
+    if (is_int && !_check_int_range(arr_in, name)) {
+        Py_DECREF(arr_in);
+        return false;
+    }
+    PyArrayObject *arr = (PyArrayObject *) PyArray_FromArray(
+            arr_in, PyArray_DescrFromType(type_num), NPY_ARRAY_IN_ARRAY | NPY_ARRAY_FORCECAST);
+    if (arr == NULL) {
+        Py_DECREF(arr_in);
+        return false;
+    }
+    if (arr != arr_in) {
+        log_warn("%s is copied into a contiguous %s array.\n", name, is_int ? "int32" : "float64");
+    }
+    Py_DECREF(arr_in);
+    in->objs[in->num_objs++] = (PyObject *) arr;
+    *buf = PyArray_DATA(arr);
+    if (size != NULL) { *size = PyArray_SIZE(arr); }
+    return true;
+}
+
+/** the index arrays are only read for sparse data. */
+static bool _init_train_data(Inputs *in, Data *data, PyObject *x_tr_vals, PyObject *x_tr_inds,
+                             PyObject *x_tr_poss, PyObject *x_tr_lens, PyObject *data_y_tr) {
+    void *buf;
+    npy_intp size;
+    if (!_input_array(in, data_y_tr, NPY_DOUBLE, "y_tr", &buf, &size)) { return false; }
+    data->y_tr = buf, data->n = (int) size;
+    if (!_input_array(in, x_tr_vals, NPY_DOUBLE, "x_tr_vals", &buf, NULL)) { return false; }
+    data->x_tr_vals = buf;
+    if (!data->is_sparse) { return true; }
+    if (!_input_array(in, x_tr_inds, NPY_INT, "x_tr_inds", &buf, NULL)) { return false; }
+    data->x_tr_inds = buf;
+    if (!_input_array(in, x_tr_poss, NPY_INT, "x_tr_poss", &buf, NULL)) { return false; }
+    data->x_tr_poss = buf;
+    if (!_input_array(in, x_tr_lens, NPY_INT, "x_tr_lens", &buf, NULL)) { return false; }
+    data->x_tr_lens = buf;
+    return true;
+}
+
+/** the held-out set is optional, it is left as it is if y_te is NULL or None. */
+bool init_eval_data(Inputs *in, Data *data, PyObject *x_te_vals, PyObject *x_te_inds, PyObject *x_te_poss,
+                    PyObject *x_te_lens, PyObject *data_y_te) {
+    if (data_y_te == NULL || data_y_te == Py_None) { return true; }
+    void *buf;
+    npy_intp size;
+    data->x_te_inds = NULL, data->x_te_poss = NULL, data->x_te_lens = NULL;
+    if (!_input_array(in, data_y_te, NPY_DOUBLE, "y_te", &buf, &size)) { return false; }
+    data->y_te = buf, data->n_te = (int) size;
+    if (!_input_array(in, x_te_vals, NPY_DOUBLE, "x_te_vals", &buf, NULL)) { return false; }
+    data->x_te_vals = buf;
+    if (!data->is_sparse) { return true; }
+    if (!_input_array(in, x_te_inds, NPY_INT, "x_te_inds", &buf, NULL)) { return false; }
+    data->x_te_inds = buf;
+    if (!_input_array(in, x_te_poss, NPY_INT, "x_te_poss", &buf, NULL)) { return false; }
+    data->x_te_poss = buf;
+    if (!_input_array(in, x_te_lens, NPY_INT, "x_te_lens", &buf, NULL)) { return false; }
+    data->x_te_lens = buf;
+    return true;
+}
+
+/**
+ * A training set, and optionally a held-out set, whose buffers are validated and
+ * pinned once, together with its cached statistics. It can be given to every
+ * c_algo_* in place of x_tr_vals, x_tr_inds, x_tr_poss, x_tr_lens, y_tr,
+ * is_sparse and p, so repeated runs on it skip the checks and the statistics.
+ */
+typedef struct {
+    PyObject_HEAD
+    Inputs in;
+    Data data;
+    DataStat *stat;
+} DatasetObject;
+
+static PyObject *_dataset_new(PyTypeObject *type, PyObject *args, PyObject *kwds) {
+    static char *kwlist[] = {"x_tr_vals", "x_tr_inds", "x_tr_poss", "x_tr_lens", "y_tr", "is_sparse", "p",
+                             "x_te_vals", "x_te_inds", "x_te_poss", "x_te_lens", "y_te", "build_csc", NULL};
+    PyObject *x_tr_vals, *x_tr_inds, *x_tr_poss, *x_tr_lens, *data_y_tr;
+    PyObject *x_te_vals = NULL, *x_te_inds = NULL, *x_te_poss = NULL, *x_te_lens = NULL, *data_y_te = NULL;
+    int is_sparse, p, build_csc = 0;
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "OOOOOii|OOOOOi", kwlist,
+                                     &x_tr_vals, &x_tr_inds, &x_tr_poss, &x_tr_lens, &data_y_tr, &is_sparse, &p,
+                                     &x_te_vals, &x_te_inds, &x_te_poss, &x_te_lens, &data_y_te, &build_csc)) {
+        return NULL;
+    }
+    DatasetObject *ds = (DatasetObject *) type->tp_alloc(type, 0);
+    if (ds == NULL) { return NULL; }
+    ds->in.num_objs = 0;
+    ds->stat = NULL;
+    memset(&ds->data, 0, sizeof(Data));
+    ds->data.is_sparse = is_sparse != 0, ds->data.p = p;
+    if (!_init_train_data(&ds->in, &ds->data, x_tr_vals, x_tr_inds, x_tr_poss, x_tr_lens, data_y_tr) ||
+        !init_eval_data(&ds->in, &ds->data, x_te_vals, x_te_inds, x_te_poss, x_te_lens, data_y_te)) {
+        Py_DECREF(ds);
+        return NULL;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    ds->stat = make_data_stat(&ds->data, build_csc != 0);
+    Py_END_ALLOW_THREADS
+    ds->data.stat = ds->stat;
+    return (PyObject *) ds;
+}
+
+static void _dataset_dealloc(DatasetObject *ds) {
+    if (ds->stat != NULL) { free_data_stat(ds->stat); }
+    _free_inputs(&ds->in);
+    Py_TYPE(ds)->tp_free((PyObject *) ds);
+}
+
+static PyObject *_dataset_get_num_posi(DatasetObject *ds, void *closure) {
+    return PyFloat_FromDouble(ds->stat->posi_t);
+}
+
+static PyObject *_dataset_get_num_nega(DatasetObject *ds, void *closure) {
+    return PyFloat_FromDouble(ds->stat->nega_t);
+}
+
+static PyMemberDef dataset_members[] = {
+        {"n",         T_INT,  offsetof(DatasetObject, data.n),         READONLY, "number of training samples"},
+        {"p",         T_INT,  offsetof(DatasetObject, data.p),         READONLY, "number of features"},
+        {"n_te",      T_INT,  offsetof(DatasetObject, data.n_te),      READONLY, "number of held-out samples"},
+        {"is_sparse", T_BOOL, offsetof(DatasetObject, data.is_sparse), READONLY, "whether it is in CSR format"},
+        {NULL, 0, 0, 0, NULL}};
+
+static PyGetSetDef dataset_getset[] = {
+        {"num_posi", (getter) _dataset_get_num_posi, NULL, "number of positive training samples", NULL},
+        {"num_nega", (getter) _dataset_get_num_nega, NULL, "number of negative training samples", NULL},
+        {NULL, NULL, NULL, NULL, NULL}};
+
+static PyTypeObject DatasetType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        .tp_name = "sparse_module.Dataset",
+        .tp_basicsize = sizeof(DatasetObject),
+        .tp_dealloc = (destructor) _dataset_dealloc,
+        .tp_flags = Py_TPFLAGS_DEFAULT,
+        .tp_doc = "Dataset(x_tr_vals, x_tr_inds, x_tr_poss, x_tr_lens, y_tr, is_sparse, p, "
+                  "x_te_vals=None, x_te_inds=None, x_te_poss=None, x_te_lens=None, y_te=None, build_csc=0)",
+        .tp_members = dataset_members,
+        .tp_getset = dataset_getset,
+        .tp_new = _dataset_new,
+};
+
+/**
+ * rows=idx trains on rows idx[0], ..., idx[k - 1] of the training set, e.g., the
+ * training folds of cross validation. They are read in place, nothing is copied.
+ */
+static bool _init_rows(Inputs *in, Data *data, PyObject *kwargs) {
+    static char *kwlist[] = {"rows", NULL};
+    PyObject *rows = NULL, *no_args = PyTuple_New(0);
+    bool is_parsed = no_args != NULL && PyArg_ParseTupleAndKeywords(no_args, kwargs, "|O", kwlist, &rows);
+    Py_XDECREF(no_args);
+    if (!is_parsed) { return false; }
+    if (rows == NULL || rows == Py_None) { return true; }
+    void *buf;
+    npy_intp size;
+    if (!_input_array(in, rows, NPY_INT, "rows", &buf, &size)) { return false; }
+    const int *idx = buf;
+    if (size == 0) {
+        PyErr_SetString(PyExc_ValueError, "rows must not be empty");
+        return false;
+    }
+    for (npy_intp i = 0; i < size; i++) {
+        if (idx[i] < 0 || idx[i] >= data->n) {
+            PyErr_Format(PyExc_IndexError, "rows has index %d out of the %d training samples", idx[i], data->n);
+            return false;
+        }
+    }
+    data->rows = idx, data->n = (int) size;
+    return true;
+}
+
+/**
+ * The training set is either a Dataset or the arrays x_tr_vals, x_tr_inds, x_tr_poss,
+ * x_tr_lens, y_tr and the ints is_sparse, p. algo_args are the remaining arguments.
+ */
+bool init_data(Inputs *in, Data *data, PyObject *args, PyObject *kwargs, PyObject **algo_args) {
+    Py_ssize_t num_args = PyTuple_GET_SIZE(args), offset = 7;
+    memset(data, 0, sizeof(Data));
+    if (num_args > 0 && PyObject_TypeCheck(PyTuple_GET_ITEM(args, 0), &DatasetType)) {
+        DatasetObject *ds = (DatasetObject *) PyTuple_GET_ITEM(args, 0);
+        *data = ds->data; // the buffers of ds stay alive until the run is finished.
+        Py_INCREF(ds);
+        in->objs[in->num_objs++] = (PyObject *) ds;
+        offset = 1;
+    } else {
+        PyObject *x_tr_vals, *x_tr_inds, *x_tr_poss, *x_tr_lens, *data_y_tr;
+        int is_sparse;
+        PyObject *head = PyTuple_GetSlice(args, 0, offset);
+        bool is_parsed = PyArg_ParseTuple(head, "OOOOOii", &x_tr_vals, &x_tr_inds, &x_tr_poss, &x_tr_lens,
+                                          &data_y_tr, &is_sparse, &data->p);
+        Py_DECREF(head);
+        if (!is_parsed) { return false; }
+        data->is_sparse = is_sparse != 0;
+        if (!_init_train_data(in, data, x_tr_vals, x_tr_inds, x_tr_poss, x_tr_lens, data_y_tr)) { return false; }
+    }
+    if (kwargs != NULL && !_init_rows(in, data, kwargs)) { return false; }
+    *algo_args = PyTuple_GetSlice(args, offset, num_args);
+    in->objs[in->num_objs++] = *algo_args;
+    return true;
 }
 
-void init_global_paras(GlobalParas *paras, PyArrayObject *global_paras) {
-    double *arr_paras = (double *) PyArray_DATA(global_paras);
-    //order should be: num_passes, step_len, verbose, record_aucs, stop_eps
+bool init_global_paras(Inputs *in, GlobalParas *paras, PyObject *global_paras) {
+    void *buf;
+    npy_intp size;
+    if (!_input_array(in, global_paras, NPY_DOUBLE, "global_paras", &buf, &size)) { return false; }
+    if (size < 5) {
+        PyErr_SetString(PyExc_ValueError, "global_paras needs at least 5 entries");
+        return false;
+    }
+    double *arr_paras = buf;
+    int num_paras = (int) size;
+    //order should be: num_passes, step_len, verbose, record_aucs, stop_eps, lazy_update, proj_resync,
+    //track_support, eval_size, eval_growth, eval_csc, time_budget, auc_patience, auc_tol, seed, num_threads
     paras->num_passes = (int) arr_paras[0];
     paras->step_len = (int) arr_paras[1];
     paras->verbose = (int) arr_paras[2];
     paras->record_aucs = (int) arr_paras[3];
     paras->stop_eps = arr_paras[4];
+    // the following ones are optional, they are off if not given.
+    paras->lazy_update = num_paras > 5 ? (int) arr_paras[5] : 0;
+    paras->proj_resync = num_paras > 6 ? (int) arr_paras[6] : 0;
+    paras->track_support = num_paras > 7 ? (int) arr_paras[7] : 0;
+    paras->eval_size = num_paras > 8 ? (int) arr_paras[8] : 0;
+    paras->eval_growth = num_paras > 9 ? arr_paras[9] : 0.0;
+    paras->eval_csc = num_paras > 10 ? (int) arr_paras[10] : 0;
+    paras->time_budget = num_paras > 11 ? arr_paras[11] : 0.0;
+    paras->auc_patience = num_paras > 12 ? (int) arr_paras[12] : 0;
+    paras->auc_tol = num_paras > 13 ? arr_paras[13] : 0.0;
+    // drawn here while the GIL is held, the solvers then never touch the global generator.
+    paras->seed = num_paras > 14 && arr_paras[14] > 0 ? (long) arr_paras[14] : 1 + lrand48();
+    paras->num_threads = num_paras > 15 && arr_paras[15] > 1 ? (int) arr_paras[15] : 1;
+    return true;
 }
 
-static PyObject *wrap_algo_solam(PyObject *self, PyObject *args) {
+static PyObject *wrap_algo_solam(PyObject *self, PyObject *args, PyObject *kwargs) {
     if (self != NULL) { printf("%zd", self->ob_refcnt); }
-    PyArrayObject *x_tr_vals, *x_tr_inds, *x_tr_poss, *x_tr_lens, *data_y_tr, *global_paras;
+    PyObject *algo_args, *global_paras;
+    PyObject *x_te_vals = NULL, *x_te_inds = NULL, *x_te_poss = NULL, *x_te_lens = NULL, *data_y_te = NULL;
     Data *data = malloc(sizeof(Data));
     GlobalParas *paras = malloc(sizeof(GlobalParas));
     double para_xi, para_r; //SOLAM has two parameters.
-    if (!PyArg_ParseTuple(args, "O!O!O!O!O!iiO!dd",
-                          &PyArray_Type, &x_tr_vals, &PyArray_Type, &x_tr_inds, &PyArray_Type, &x_tr_poss,
-                          &PyArray_Type, &x_tr_lens, &PyArray_Type, &data_y_tr, &data->is_sparse, &data->p,
-                          &PyArray_Type, &global_paras,
-                          &para_xi, &para_r)) { return NULL; }
-    init_global_paras(paras, global_paras);
-    init_data(data, x_tr_vals, x_tr_inds, x_tr_poss, x_tr_lens, data_y_tr);
-    AlgoResults *re = make_algo_results(data->p, (data->n * paras->num_passes) / paras->step_len + 1);
+    Inputs in = {.num_objs = 0};
+    if (!init_data(&in, data, args, kwargs, &algo_args) ||
+        !PyArg_ParseTuple(algo_args, "Odd|OOOOO",
+                          &global_paras,
+                          &para_xi, &para_r,
+                          &x_te_vals, &x_te_inds, &x_te_poss,
+                          &x_te_lens, &data_y_te) ||
+        !init_global_paras(&in, paras, global_paras) ||
+        !init_eval_data(&in, data, x_te_vals, x_te_inds, x_te_poss, x_te_lens, data_y_te)) {
+        _free_inputs(&in), free(paras), free(data);
+        return NULL;
+    }
+    AlgoResults *re = make_algo_results(data->p, num_auc_evals(paras, data->n * paras->num_passes, paras->step_len));
+    // the solvers do not touch Python objects, so other threads can run meanwhile.
+    Py_BEGIN_ALLOW_THREADS
     _algo_solam(data, paras, re, para_xi, para_r);
+    Py_END_ALLOW_THREADS
     PyObject *results = get_results(data->p, re);
-    free(paras), free_algo_results(re), free(data);
+    _free_inputs(&in), free(paras), free_algo_results(re), free(data);
     return results;
 }
 
 
-static PyObject *wrap_algo_spam(PyObject *self, PyObject *args) {
+static PyObject *wrap_algo_spam(PyObject *self, PyObject *args, PyObject *kwargs) {
     if (self != NULL) { printf("%zd", self->ob_refcnt); }
-    PyArrayObject *x_tr_vals, *x_tr_inds, *x_tr_poss, *x_tr_lens, *data_y_tr, *global_paras;
+    PyObject *algo_args, *global_paras;
+    PyObject *x_te_vals = NULL, *x_te_inds = NULL, *x_te_poss = NULL, *x_te_lens = NULL, *data_y_te = NULL;
     Data *data = malloc(sizeof(Data));
     GlobalParas *paras = malloc(sizeof(GlobalParas));
     double para_xi, para_l1_reg, para_l2_reg; //SPAM has three parameters.
-    if (!PyArg_ParseTuple(args, "O!O!O!O!O!iiO!ddd",
-                          &PyArray_Type, &x_tr_vals, &PyArray_Type, &x_tr_inds, &PyArray_Type, &x_tr_poss,
-                          &PyArray_Type, &x_tr_lens, &PyArray_Type, &data_y_tr, &data->is_sparse, &data->p,
-                          &PyArray_Type, &global_paras,
-                          &para_xi, &para_l1_reg, &para_l2_reg)) { return NULL; }
-    init_global_paras(paras, global_paras);
-    init_data(data, x_tr_vals, x_tr_inds, x_tr_poss, x_tr_lens, data_y_tr);
-    AlgoResults *re = make_algo_results(data->p, (data->n * paras->num_passes) / paras->step_len + 1);
+    Inputs in = {.num_objs = 0};
+    if (!init_data(&in, data, args, kwargs, &algo_args) ||
+        !PyArg_ParseTuple(algo_args, "Oddd|OOOOO",
+                          &global_paras,
+                          &para_xi, &para_l1_reg, &para_l2_reg,
+                          &x_te_vals, &x_te_inds, &x_te_poss,
+                          &x_te_lens, &data_y_te) ||
+        !init_global_paras(&in, paras, global_paras) ||
+        !init_eval_data(&in, data, x_te_vals, x_te_inds, x_te_poss, x_te_lens, data_y_te)) {
+        _free_inputs(&in), free(paras), free(data);
+        return NULL;
+    }
+    AlgoResults *re = make_algo_results(data->p, num_auc_evals(paras, data->n * paras->num_passes, paras->step_len));
+    Py_BEGIN_ALLOW_THREADS
     _algo_spam(data, paras, re, para_xi, para_l1_reg, para_l2_reg);
+    Py_END_ALLOW_THREADS
     PyObject *results = get_results(data->p, re);
-    free(paras), free_algo_results(re), free(data);
+    _free_inputs(&in), free(paras), free_algo_results(re), free(data);
     return results;
 }
 
-static PyObject *wrap_algo_fsauc(PyObject *self, PyObject *args) {
+static PyObject *wrap_algo_fsauc(PyObject *self, PyObject *args, PyObject *kwargs) {
     if (self != NULL) { printf("%zd", self->ob_refcnt); }
-    PyArrayObject *x_tr_vals, *x_tr_inds, *x_tr_poss, *x_tr_lens, *data_y_tr, *global_paras;
+    PyObject *algo_args, *global_paras;
+    PyObject *x_te_vals = NULL, *x_te_inds = NULL, *x_te_poss = NULL, *x_te_lens = NULL, *data_y_te = NULL;
     Data *data = malloc(sizeof(Data));
     GlobalParas *paras = malloc(sizeof(GlobalParas));
     double para_r, para_g;
-    if (!PyArg_ParseTuple(args, "O!O!O!O!O!iiO!dd",
-                          &PyArray_Type, &x_tr_vals, &PyArray_Type, &x_tr_inds, &PyArray_Type, &x_tr_poss,
-                          &PyArray_Type, &x_tr_lens, &PyArray_Type, &data_y_tr, &data->is_sparse, &data->p,
-                          &PyArray_Type, &global_paras,
-                          &para_r, &para_g)) { return NULL; }
-    init_global_paras(paras, global_paras);
-    init_data(data, x_tr_vals, x_tr_inds, x_tr_poss, x_tr_lens, data_y_tr);
-    AlgoResults *re = make_algo_results(data->p, (data->n * paras->num_passes) / paras->step_len + 1);
+    Inputs in = {.num_objs = 0};
+    if (!init_data(&in, data, args, kwargs, &algo_args) ||
+        !PyArg_ParseTuple(algo_args, "Odd|OOOOO",
+                          &global_paras,
+                          &para_r, &para_g,
+                          &x_te_vals, &x_te_inds, &x_te_poss,
+                          &x_te_lens, &data_y_te) ||
+        !init_global_paras(&in, paras, global_paras) ||
+        !init_eval_data(&in, data, x_te_vals, x_te_inds, x_te_poss, x_te_lens, data_y_te)) {
+        _free_inputs(&in), free(paras), free(data);
+        return NULL;
+    }
+    AlgoResults *re = make_algo_results(data->p, num_auc_evals(paras, data->n * paras->num_passes, paras->step_len));
+    Py_BEGIN_ALLOW_THREADS
     _algo_fsauc(data, paras, re, para_r, para_g);
+    Py_END_ALLOW_THREADS
     PyObject *results = get_results(data->p, re);
-    free(paras), free_algo_results(re), free(data);
+    _free_inputs(&in), free(paras), free_algo_results(re), free(data);
     return results;
 }
 
 
-static PyObject *wrap_algo_opauc(PyObject *self, PyObject *args) {
+static PyObject *wrap_algo_opauc(PyObject *self, PyObject *args, PyObject *kwargs) {
     if (self != NULL) { printf("%zd", self->ob_refcnt); }
-    PyArrayObject *x_tr_vals, *x_tr_inds, *x_tr_poss, *x_tr_lens, *data_y_tr, *global_paras;
+    PyObject *algo_args, *global_paras;
+    PyObject *x_te_vals = NULL, *x_te_inds = NULL, *x_te_poss = NULL, *x_te_lens = NULL, *data_y_te = NULL;
     Data *data = malloc(sizeof(Data));
     GlobalParas *paras = malloc(sizeof(GlobalParas));
     int para_tau;
     double para_eta, para_lambda;
-    if (!PyArg_ParseTuple(args, "O!O!O!O!O!iiO!ddi",
-                          &PyArray_Type, &x_tr_vals, &PyArray_Type, &x_tr_inds, &PyArray_Type, &x_tr_poss,
-                          &PyArray_Type, &x_tr_lens, &PyArray_Type, &data_y_tr, &data->is_sparse, &data->p,
-                          &PyArray_Type, &global_paras,
-                          &para_eta, &para_lambda, &para_tau)) { return NULL; }
-    init_global_paras(paras, global_paras);
-    init_data(data, x_tr_vals, x_tr_inds, x_tr_poss, x_tr_lens, data_y_tr);
-    AlgoResults *re = make_algo_results(data->p, (data->n * paras->num_passes) / paras->step_len + 1);
+    Inputs in = {.num_objs = 0};
+    if (!init_data(&in, data, args, kwargs, &algo_args) ||
+        !PyArg_ParseTuple(algo_args, "Oddi|OOOOO",
+                          &global_paras,
+                          &para_eta, &para_lambda, &para_tau,
+                          &x_te_vals, &x_te_inds, &x_te_poss,
+                          &x_te_lens, &data_y_te) ||
+        !init_global_paras(&in, paras, global_paras) ||
+        !init_eval_data(&in, data, x_te_vals, x_te_inds, x_te_poss, x_te_lens, data_y_te)) {
+        _free_inputs(&in), free(paras), free(data);
+        return NULL;
+    }
+    AlgoResults *re = make_algo_results(data->p, num_auc_evals(paras, data->n * paras->num_passes, paras->step_len));
+    Py_BEGIN_ALLOW_THREADS
     _algo_opauc(data, paras, re, para_tau, para_eta, para_lambda);
+    Py_END_ALLOW_THREADS
     PyObject *results = get_results(data->p, re);
-    free(paras), free_algo_results(re), free(data);
+    _free_inputs(&in), free(paras), free_algo_results(re), free(data);
     return results;
 }
 
-static PyObject *wrap_algo_sht_auc(PyObject *self, PyObject *args) {
+static PyObject *wrap_algo_sht_auc(PyObject *self, PyObject *args, PyObject *kwargs) {
     if (self != NULL) { printf("%zd", self->ob_refcnt); }
-    PyArrayObject *x_tr_vals, *x_tr_inds, *x_tr_poss, *x_tr_lens, *data_y_tr, *global_paras;
+    PyObject *algo_args, *global_paras;
+    PyObject *x_te_vals = NULL, *x_te_inds = NULL, *x_te_poss = NULL, *x_te_lens = NULL, *data_y_te = NULL;
     Data *data = malloc(sizeof(Data));
     GlobalParas *paras = malloc(sizeof(GlobalParas));
     double para_xi, para_l2_reg;
     int version, para_s, para_b;
-    if (!PyArg_ParseTuple(args, "O!O!O!O!O!iiO!iiidd",
-                          &PyArray_Type, &x_tr_vals, &PyArray_Type, &x_tr_inds, &PyArray_Type, &x_tr_poss,
-                          &PyArray_Type, &x_tr_lens, &PyArray_Type, &data_y_tr, &data->is_sparse, &data->p,
-                          &PyArray_Type, &global_paras,
-                          &version, &para_s, &para_b, &para_xi, &para_l2_reg)) { return NULL; }
-    init_global_paras(paras, global_paras);
-    init_data(data, x_tr_vals, x_tr_inds, x_tr_poss, x_tr_lens, data_y_tr);
-    AlgoResults *re = make_algo_results(data->p, (data->n / para_b) * paras->num_passes + 1);
+    Inputs in = {.num_objs = 0};
+    if (!init_data(&in, data, args, kwargs, &algo_args) ||
+        !PyArg_ParseTuple(algo_args, "Oiiidd|OOOOO",
+                          &global_paras,
+                          &version, &para_s, &para_b, &para_xi, &para_l2_reg,
+                          &x_te_vals, &x_te_inds, &x_te_poss,
+                          &x_te_lens, &data_y_te) ||
+        !init_global_paras(&in, paras, global_paras) ||
+        !init_eval_data(&in, data, x_te_vals, x_te_inds, x_te_poss, x_te_lens, data_y_te)) {
+        _free_inputs(&in), free(paras), free(data);
+        return NULL;
+    }
+    AlgoResults *re = make_algo_results(data->p, num_auc_evals(paras, (data->n / para_b) * paras->num_passes, 1));
+    Py_BEGIN_ALLOW_THREADS
     _algo_sht_auc(data, paras, re, version, 0, para_s, para_b, para_xi, para_l2_reg);
+    Py_END_ALLOW_THREADS
     PyObject *results = get_results(data->p, re);
-    free(paras), free_algo_results(re), free(data);
+    _free_inputs(&in), free(paras), free_algo_results(re), free(data);
     return results;
 }
 
-static PyObject *wrap_algo_graph_am(PyObject *self, PyObject *args) {
+static PyObject *wrap_algo_graph_am(PyObject *self, PyObject *args, PyObject *kwargs) {
     if (self != NULL) { printf("%zd", self->ob_refcnt); }
-    PyArrayObject *x_tr_vals, *x_tr_inds, *x_tr_poss, *x_tr_lens, *data_y_tr,
-            *graph_edges, *graph_weights, *global_paras;
+    PyObject *algo_args, *graph_edges, *graph_weights, *global_paras;
+    PyObject *x_te_vals = NULL, *x_te_inds = NULL, *x_te_poss = NULL, *x_te_lens = NULL, *data_y_te = NULL;
     Data *data = malloc(sizeof(Data));
     GlobalParas *paras = malloc(sizeof(GlobalParas));
     double para_xi, para_l2_reg;
     int version, para_s, para_b;
-    if (!PyArg_ParseTuple(args, "O!O!O!O!O!iiO!O!O!iiiidd",
-                          &PyArray_Type, &x_tr_vals, &PyArray_Type, &x_tr_inds, &PyArray_Type, &x_tr_poss,
-                          &PyArray_Type, &x_tr_lens, &PyArray_Type, &data_y_tr, &data->is_sparse, &data->p,
-                          &PyArray_Type, &global_paras, &PyArray_Type, &graph_edges, &PyArray_Type, &graph_weights,
-                          &data->g, &version, &para_s, &para_b, &para_xi, &para_l2_reg)) { return NULL; }
-    // graph info
+    void *edges_buf, *weights_buf;
+    npy_intp num_edge_inds, num_weights;
+    Inputs in = {.num_objs = 0};
+    if (!init_data(&in, data, args, kwargs, &algo_args) ||
+        !PyArg_ParseTuple(algo_args, "OOOiiiidd|OOOOO",
+                          &global_paras, &graph_edges, &graph_weights,
+                          &data->g, &version, &para_s, &para_b, &para_xi, &para_l2_reg,
+                          &x_te_vals, &x_te_inds, &x_te_poss,
+                          &x_te_lens, &data_y_te) ||
+        !init_global_paras(&in, paras, global_paras) ||
+        !init_eval_data(&in, data, x_te_vals, x_te_inds, x_te_poss, x_te_lens, data_y_te) ||
+        !_input_array(&in, graph_edges, NPY_INT, "graph_edges", &edges_buf, &num_edge_inds) ||
+        !_input_array(&in, graph_weights, NPY_DOUBLE, "graph_weights", &weights_buf, &num_weights)) {
+        _free_inputs(&in), free(paras), free(data);
+        return NULL;
+    }
+    if (num_edge_inds != 2 * num_weights) {
+        PyErr_SetString(PyExc_ValueError, "graph_edges should be an m x 2 array for m weights");
+        _free_inputs(&in), free(paras), free(data);
+        return NULL;
+    }
+    // graph info, the edges are read row by row from the contiguous m x 2 array.
+    const int *edge_inds = edges_buf;
     data->is_graph = true;
-    data->m = (int) graph_weights->dimensions[0];
+    data->m = (int) num_weights;
     data->edges = malloc(sizeof(EdgePair) * data->m);
-    for (int i = 0; i < (int) graph_weights->dimensions[0]; i++) {
-        data->edges[i].first = *(int *) PyArray_GETPTR2(graph_edges, i, 0);
-        data->edges[i].second = *(int *) PyArray_GETPTR2(graph_edges, i, 1);
+    for (int i = 0; i < data->m; i++) {
+        data->edges[i].first = edge_inds[2 * i];
+        data->edges[i].second = edge_inds[2 * i + 1];
     }
-    data->weights = (double *) PyArray_DATA(graph_weights);
+    data->weights = weights_buf;
     data->proj_prizes = malloc(sizeof(double) * data->p);   // projected prizes.
     data->graph_stat = make_graph_stat(data->p, data->m);   // head projection paras
-    // ---
-    init_global_paras(paras, global_paras);
-    init_data(data, x_tr_vals, x_tr_inds, x_tr_poss, x_tr_lens, data_y_tr);
-    AlgoResults *re = make_algo_results(data->p, (data->n / para_b) * paras->num_passes + 1);
+    AlgoResults *re = make_algo_results(data->p, num_auc_evals(paras, (data->n / para_b) * paras->num_passes, 1));
+    Py_BEGIN_ALLOW_THREADS
     _algo_sht_auc(data, paras, re, version, 1, para_s, para_b, para_xi, para_l2_reg);
+    Py_END_ALLOW_THREADS
     PyObject *results = get_results(data->p, re);
     free_graph_stat(data->graph_stat);
     free(data->proj_prizes);
     free(data->edges);
-    free(paras), free_algo_results(re), free(data);
+    _free_inputs(&in), free(paras), free_algo_results(re), free(data);
     return results;
 }
 
 
-static PyObject *wrap_algo_sto_iht(PyObject *self, PyObject *args) {
+static PyObject *wrap_algo_sto_iht(PyObject *self, PyObject *args, PyObject *kwargs) {
     if (self != NULL) { printf("%zd", self->ob_refcnt); }
-    PyArrayObject *x_tr_vals, *x_tr_inds, *x_tr_poss, *x_tr_lens, *data_y_tr, *global_paras;
+    PyObject *algo_args, *global_paras;
+    PyObject *x_te_vals = NULL, *x_te_inds = NULL, *x_te_poss = NULL, *x_te_lens = NULL, *data_y_te = NULL;
     Data *data = malloc(sizeof(Data));
     GlobalParas *paras = malloc(sizeof(GlobalParas));
     int para_s, para_b;
     double para_xi, para_l2_reg;
-    if (!PyArg_ParseTuple(args, "O!O!O!O!O!iiO!iidd",
-                          &PyArray_Type, &x_tr_vals, &PyArray_Type, &x_tr_inds, &PyArray_Type, &x_tr_poss,
-                          &PyArray_Type, &x_tr_lens, &PyArray_Type, &data_y_tr, &data->is_sparse, &data->p,
-                          &PyArray_Type, &global_paras, &para_s, &para_b, &para_xi, &para_l2_reg)) { return NULL; }
-    init_global_paras(paras, global_paras);
-    init_data(data, x_tr_vals, x_tr_inds, x_tr_poss, x_tr_lens, data_y_tr);
-    AlgoResults *re = make_algo_results(data->p + 1, (data->n / para_b) * paras->num_passes + 1);
+    Inputs in = {.num_objs = 0};
+    if (!init_data(&in, data, args, kwargs, &algo_args) ||
+        !PyArg_ParseTuple(algo_args, "Oiidd|OOOOO",
+                          &global_paras, &para_s, &para_b, &para_xi, &para_l2_reg,
+                          &x_te_vals, &x_te_inds, &x_te_poss,
+                          &x_te_lens, &data_y_te) ||
+        !init_global_paras(&in, paras, global_paras) ||
+        !init_eval_data(&in, data, x_te_vals, x_te_inds, x_te_poss, x_te_lens, data_y_te)) {
+        _free_inputs(&in), free(paras), free(data);
+        return NULL;
+    }
+    AlgoResults *re = make_algo_results(data->p + 1, num_auc_evals(paras, (data->n / para_b) * paras->num_passes, 1));
+    Py_BEGIN_ALLOW_THREADS
     _algo_sto_iht(data, paras, re, para_s, para_b, para_xi, para_l2_reg);
+    Py_END_ALLOW_THREADS
     PyObject *results = get_results(data->p, re);
-    free(paras), free_algo_results(re), free(data);
+    _free_inputs(&in), free(paras), free_algo_results(re), free(data);
     return results;
 }
 
-static PyObject *wrap_algo_hsg_ht(PyObject *self, PyObject *args) {
+static PyObject *wrap_algo_hsg_ht(PyObject *self, PyObject *args, PyObject *kwargs) {
     if (self != NULL) { printf("%zd", self->ob_refcnt); }
-    PyArrayObject *x_tr_vals, *x_tr_inds, *x_tr_poss, *x_tr_lens, *data_y_tr, *global_paras;
+    PyObject *algo_args, *global_paras;
+    PyObject *x_te_vals = NULL, *x_te_inds = NULL, *x_te_poss = NULL, *x_te_lens = NULL, *data_y_te = NULL;
     Data *data = malloc(sizeof(Data));
     GlobalParas *paras = malloc(sizeof(GlobalParas));
     int para_s;
     double para_tau, para_zeta, para_c, para_l2;
-    if (!PyArg_ParseTuple(args, "O!O!O!O!O!iiO!idddd",
-                          &PyArray_Type, &x_tr_vals, &PyArray_Type, &x_tr_inds, &PyArray_Type, &x_tr_poss,
-                          &PyArray_Type, &x_tr_lens, &PyArray_Type, &data_y_tr, &data->is_sparse, &data->p,
-                          &PyArray_Type, &global_paras,
-                          &para_s, &para_tau, &para_zeta, &para_c, &para_l2)) { return NULL; }
-    init_global_paras(paras, global_paras);
-    init_data(data, x_tr_vals, x_tr_inds, x_tr_poss, x_tr_lens, data_y_tr);
-    AlgoResults *re = make_algo_results(data->p + 1, (data->n * paras->num_passes) + 1);
+    Inputs in = {.num_objs = 0};
+    if (!init_data(&in, data, args, kwargs, &algo_args) ||
+        !PyArg_ParseTuple(algo_args, "Oidddd|OOOOO",
+                          &global_paras,
+                          &para_s, &para_tau, &para_zeta, &para_c, &para_l2,
+                          &x_te_vals, &x_te_inds, &x_te_poss,
+                          &x_te_lens, &data_y_te) ||
+        !init_global_paras(&in, paras, global_paras) ||
+        !init_eval_data(&in, data, x_te_vals, x_te_inds, x_te_poss, x_te_lens, data_y_te)) {
+        _free_inputs(&in), free(paras), free(data);
+        return NULL;
+    }
+    AlgoResults *re = make_algo_results(data->p + 1, num_auc_evals(paras, data->n * paras->num_passes, 1));
+    Py_BEGIN_ALLOW_THREADS
     _algo_hsg_ht(data, paras, re, para_s, para_tau, para_zeta, para_c, para_l2);
+    Py_END_ALLOW_THREADS
     PyObject *results = get_results(data->p, re);
-    free(paras), free_algo_results(re), free(data);
+    _free_inputs(&in), free(paras), free_algo_results(re), free(data);
+    return results;
+}
+
+
+/** the parameters of the models of a grid, the first one gives num_models and the others must match it. */
+static bool _grid_array(Inputs *in, PyObject *obj, int type_num, const char *name, void **buf, int *num_models) {
+    npy_intp size;
+    if (!_input_array(in, obj, type_num, name, buf, &size)) { return false; }
+    if (size == 0 || (*num_models > 0 && size != *num_models)) {
+        PyErr_Format(PyExc_ValueError, "%s should have one entry for each model", name);
+        return false;
+    }
+    *num_models = (int) size;
+    return true;
+}
+
+static AlgoResults **_make_grid_results(int data_p, int num_aucs, int num_models) {
+    AlgoResults **re = malloc(sizeof(AlgoResults *) * num_models);
+    for (int k = 0; k < num_models; k++) {
+        re[k] = make_algo_results(data_p, num_aucs);
+    }
+    return re;
+}
+
+/** a list with the results of get_results for each model, re is freed. */
+static PyObject *_get_grid_results(int data_p, AlgoResults **re, int num_models) {
+    PyObject *results = PyList_New(num_models);
+    for (int k = 0; k < num_models; k++) {
+        PyList_SetItem(results, k, get_results(data_p, re[k]));
+        free_algo_results(re[k]);
+    }
+    free(re);
+    return results;
+}
+
+/**
+ * c_algo_solam_grid(..., global_paras, para_xi, para_r, ...) trains the models
+ * (para_xi[k], para_r[k]) together in one pass over the data, see _algo_solam_grid.
+ */
+static PyObject *wrap_algo_solam_grid(PyObject *self, PyObject *args, PyObject *kwargs) {
+    PyObject *algo_args, *global_paras, *xi_obj, *r_obj;
+    PyObject *x_te_vals = NULL, *x_te_inds = NULL, *x_te_poss = NULL, *x_te_lens = NULL, *data_y_te = NULL;
+    Data *data = malloc(sizeof(Data));
+    GlobalParas *paras = malloc(sizeof(GlobalParas));
+    void *para_xi, *para_r;
+    int num_models = 0;
+    Inputs in = {.num_objs = 0};
+    if (!init_data(&in, data, args, kwargs, &algo_args) ||
+        !PyArg_ParseTuple(algo_args, "OOO|OOOOO",
+                          &global_paras,
+                          &xi_obj, &r_obj,
+                          &x_te_vals, &x_te_inds, &x_te_poss,
+                          &x_te_lens, &data_y_te) ||
+        !init_global_paras(&in, paras, global_paras) ||
+        !_grid_array(&in, xi_obj, NPY_DOUBLE, "para_xi", &para_xi, &num_models) ||
+        !_grid_array(&in, r_obj, NPY_DOUBLE, "para_r", &para_r, &num_models) ||
+        !init_eval_data(&in, data, x_te_vals, x_te_inds, x_te_poss, x_te_lens, data_y_te)) {
+        _free_inputs(&in), free(paras), free(data);
+        return NULL;
+    }
+    AlgoResults **re = _make_grid_results(data->p, num_auc_evals(paras, data->n * paras->num_passes, paras->step_len),
+                                          num_models);
+    Py_BEGIN_ALLOW_THREADS
+    _algo_solam_grid(data, paras, re, para_xi, para_r, num_models);
+    Py_END_ALLOW_THREADS
+    PyObject *results = _get_grid_results(data->p, re, num_models);
+    _free_inputs(&in), free(paras), free(data);
+    return results;
+}
+
+/** c_algo_spam_grid(..., global_paras, para_xi, para_l1_reg, para_l2_reg, ...) */
+static PyObject *wrap_algo_spam_grid(PyObject *self, PyObject *args, PyObject *kwargs) {
+    PyObject *algo_args, *global_paras, *xi_obj, *l1_obj, *l2_obj;
+    PyObject *x_te_vals = NULL, *x_te_inds = NULL, *x_te_poss = NULL, *x_te_lens = NULL, *data_y_te = NULL;
+    Data *data = malloc(sizeof(Data));
+    GlobalParas *paras = malloc(sizeof(GlobalParas));
+    void *para_xi, *para_l1_reg, *para_l2_reg;
+    int num_models = 0;
+    Inputs in = {.num_objs = 0};
+    if (!init_data(&in, data, args, kwargs, &algo_args) ||
+        !PyArg_ParseTuple(algo_args, "OOOO|OOOOO",
+                          &global_paras,
+                          &xi_obj, &l1_obj, &l2_obj,
+                          &x_te_vals, &x_te_inds, &x_te_poss,
+                          &x_te_lens, &data_y_te) ||
+        !init_global_paras(&in, paras, global_paras) ||
+        !_grid_array(&in, xi_obj, NPY_DOUBLE, "para_xi", &para_xi, &num_models) ||
+        !_grid_array(&in, l1_obj, NPY_DOUBLE, "para_l1_reg", &para_l1_reg, &num_models) ||
+        !_grid_array(&in, l2_obj, NPY_DOUBLE, "para_l2_reg", &para_l2_reg, &num_models) ||
+        !init_eval_data(&in, data, x_te_vals, x_te_inds, x_te_poss, x_te_lens, data_y_te)) {
+        _free_inputs(&in), free(paras), free(data);
+        return NULL;
+    }
+    AlgoResults **re = _make_grid_results(data->p, num_auc_evals(paras, data->n * paras->num_passes, paras->step_len),
+                                          num_models);
+    Py_BEGIN_ALLOW_THREADS
+    _algo_spam_grid(data, paras, re, para_xi, para_l1_reg, para_l2_reg, num_models);
+    Py_END_ALLOW_THREADS
+    PyObject *results = _get_grid_results(data->p, re, num_models);
+    _free_inputs(&in), free(paras), free(data);
     return results;
 }
 
+/** c_algo_sht_auc_grid(..., global_paras, version, para_s, para_b, para_xi, para_l2_reg, ...), para_s is an integer array. */
+static PyObject *wrap_algo_sht_auc_grid(PyObject *self, PyObject *args, PyObject *kwargs) {
+    PyObject *algo_args, *global_paras, *s_obj, *xi_obj, *l2_obj;
+    PyObject *x_te_vals = NULL, *x_te_inds = NULL, *x_te_poss = NULL, *x_te_lens = NULL, *data_y_te = NULL;
+    Data *data = malloc(sizeof(Data));
+    GlobalParas *paras = malloc(sizeof(GlobalParas));
+    void *para_s, *para_xi, *para_l2_reg;
+    int version, para_b, num_models = 0;
+    Inputs in = {.num_objs = 0};
+    if (!init_data(&in, data, args, kwargs, &algo_args) ||
+        !PyArg_ParseTuple(algo_args, "OiOiOO|OOOOO",
+                          &global_paras,
+                          &version, &s_obj, &para_b, &xi_obj, &l2_obj,
+                          &x_te_vals, &x_te_inds, &x_te_poss,
+                          &x_te_lens, &data_y_te) ||
+        !init_global_paras(&in, paras, global_paras) ||
+        !_grid_array(&in, s_obj, NPY_INT, "para_s", &para_s, &num_models) ||
+        !_grid_array(&in, xi_obj, NPY_DOUBLE, "para_xi", &para_xi, &num_models) ||
+        !_grid_array(&in, l2_obj, NPY_DOUBLE, "para_l2_reg", &para_l2_reg, &num_models) ||
+        !init_eval_data(&in, data, x_te_vals, x_te_inds, x_te_poss, x_te_lens, data_y_te)) {
+        _free_inputs(&in), free(paras), free(data);
+        return NULL;
+    }
+    AlgoResults **re = _make_grid_results(data->p, num_auc_evals(paras, (data->n / para_b) * paras->num_passes, 1),
+                                          num_models);
+    Py_BEGIN_ALLOW_THREADS
+    _algo_sht_auc_grid(data, paras, re, version, para_s, para_b, para_xi, para_l2_reg, num_models);
+    Py_END_ALLOW_THREADS
+    PyObject *results = _get_grid_results(data->p, re, num_models);
+    _free_inputs(&in), free(paras), free(data);
+    return results;
+}
+
+static const char *algo_names[] = {"solam", "spam", "fsauc", "opauc", "sht_auc", "sto_iht", "hsg_ht"};
+
+/**
+ * c_cross_validate(dataset, algorithm, global_paras, param_grid, folds, num_threads=1)
+ * algorithm is the name of one of c_algo_*, e.g., "solam", and each row of param_grid
+ * has its parameters in the order of c_algo_*. folds[i] is the fold of training sample i.
+ * It returns the arrays aucs, num_nonzeros and epochs of shape (len(param_grid), num_folds).
+ */
+static PyObject *wrap_cross_validate(PyObject *self, PyObject *args) {
+    PyObject *dataset, *global_paras, *param_grid, *folds_obj;
+    const char *algo_name;
+    int num_threads = 1, algo = -1;
+    if (!PyArg_ParseTuple(args, "O!sOOO|i", &DatasetType, &dataset, &algo_name, &global_paras,
+                          &param_grid, &folds_obj, &num_threads)) { return NULL; }
+    for (int i = 0; i < (int) (sizeof(algo_names) / sizeof(algo_names[0])); i++) {
+        if (strcmp(algo_name, algo_names[i]) == 0) { algo = i; }
+    }
+    if (algo < 0) {
+        PyErr_Format(PyExc_ValueError, "unknown algorithm %s", algo_name);
+        return NULL;
+    }
+    Data *data = &((DatasetObject *) dataset)->data;
+    GlobalParas paras;
+    void *grid_buf, *folds_buf;
+    npy_intp grid_size, num_folds_inds;
+    Inputs in = {.num_objs = 0};
+    if (!init_global_paras(&in, &paras, global_paras) ||
+        !_input_array(&in, param_grid, NPY_DOUBLE, "param_grid", &grid_buf, &grid_size) ||
+        !_input_array(&in, folds_obj, NPY_INT, "folds", &folds_buf, &num_folds_inds)) {
+        _free_inputs(&in);
+        return NULL;
+    }
+    int num_paras = algo_num_paras[algo], num_grid = (int) (grid_size / num_paras), num_folds = 0;
+    const int *folds = folds_buf;
+    if (grid_size == 0 || grid_size % num_paras != 0) {
+        PyErr_Format(PyExc_ValueError, "param_grid should have %d parameters in each row", num_paras);
+        _free_inputs(&in);
+        return NULL;
+    }
+    if (num_folds_inds != data->n) {
+        PyErr_SetString(PyExc_ValueError, "folds should have one entry for each training sample");
+        _free_inputs(&in);
+        return NULL;
+    }
+    for (int i = 0; i < data->n; i++) {
+        num_folds = max(num_folds, folds[i] + 1);
+    }
+    int *fold_lens = calloc((size_t) num_folds, sizeof(int));
+    bool is_valid = num_folds >= 2;
+    for (int i = 0; i < data->n && is_valid; i++) {
+        is_valid = folds[i] >= 0;
+        if (is_valid) { fold_lens[folds[i]]++; }
+    }
+    for (int fi = 0; fi < num_folds && is_valid; fi++) {
+        is_valid = fold_lens[fi] > 0;
+    }
+    free(fold_lens);
+    if (!is_valid) {
+        PyErr_SetString(PyExc_ValueError, "folds should be 0, ..., k - 1 for k >= 2 non-empty folds");
+        _free_inputs(&in);
+        return NULL;
+    }
+    npy_intp dims[2] = {num_grid, num_folds};
+    double *aucs = malloc(sizeof(double) * num_grid * num_folds);
+    double *num_nonzeros = malloc(sizeof(double) * num_grid * num_folds);
+    double *epochs = malloc(sizeof(double) * num_grid * num_folds);
+    Py_BEGIN_ALLOW_THREADS
+    cross_validate(data, &paras, algo, grid_buf, num_grid, folds, num_folds, num_threads,
+                   aucs, num_nonzeros, epochs);
+    Py_END_ALLOW_THREADS
+    PyObject *results = PyTuple_New(3);
+    PyTuple_SetItem(results, 0, _owned_ndarray(aucs, 2, dims));
+    PyTuple_SetItem(results, 1, _owned_ndarray(num_nonzeros, 2, dims));
+    PyTuple_SetItem(results, 2, _owned_ndarray(epochs, 2, dims));
+    _free_inputs(&in);
+    return results;
+}
+
+/** hands the events to the Python callback as a list of (kind, iter, value) tuples. */
+static void _py_progress(void *ctx, const LogEvent *events, int num_events) {
+    PyGILState_STATE gil_state = PyGILState_Ensure();
+    PyObject *list = PyList_New(num_events);
+    for (int i = 0; i < num_events; i++) {
+        PyList_SetItem(list, i, Py_BuildValue("(iid)", events[i].kind, events[i].iter, events[i].value));
+    }
+    PyObject *re = PyObject_CallFunctionObjArgs((PyObject *) ctx, list, NULL);
+    if (re == NULL) { PyErr_Print(); } else { Py_DECREF(re); }
+    Py_DECREF(list);
+    PyGILState_Release(gil_state);
+}
+
+/** c_set_logger(level, callback=None, cadence=0): callback is None to remove it. */
+static PyObject *wrap_set_logger(PyObject *self, PyObject *args) {
+    int level, cadence = 0;
+    PyObject *callback = Py_None;
+    if (!PyArg_ParseTuple(args, "i|Oi", &level, &callback, &cadence)) { return NULL; }
+    if (callback != Py_None && !PyCallable_Check(callback)) {
+        PyErr_SetString(PyExc_TypeError, "callback must be callable or None");
+        return NULL;
+    }
+    log_set_level(level);
+    PyObject *prev_callback;
+    if (callback != Py_None) { Py_INCREF(callback); } // the logger owns a reference.
+    // the running callbacks take the GIL, which log_set_callback waits for.
+    Py_BEGIN_ALLOW_THREADS
+    prev_callback = callback == Py_None ? log_set_callback(NULL, NULL, cadence) :
+                    log_set_callback(_py_progress, callback, cadence);
+    Py_END_ALLOW_THREADS
+    Py_XDECREF(prev_callback); // no run uses it anymore.
+    Py_RETURN_NONE;
+}
+
 // wrap_algo_solam_sparse
 static PyMethodDef sparse_methods[] = { // hello_name
+        {"c_set_logger",    wrap_set_logger,    METH_VARARGS, "docs"},
         {"c_test",          test,               METH_VARARGS, "docs"},
-        {"c_algo_solam",    wrap_algo_solam,    METH_VARARGS, "docs"},
-        {"c_algo_spam",     wrap_algo_spam,     METH_VARARGS, "docs"},
-        {"c_algo_sht_auc",  wrap_algo_sht_auc,  METH_VARARGS, "docs"},
-        {"c_algo_graph_am", wrap_algo_graph_am, METH_VARARGS, "docs"},
-        {"c_algo_opauc",    wrap_algo_opauc,    METH_VARARGS, "docs"},
-        {"c_algo_fsauc",    wrap_algo_fsauc,    METH_VARARGS, "docs"},
-        {"c_algo_sto_iht",  wrap_algo_sto_iht,  METH_VARARGS, "docs"},
-        {"c_algo_hsg_ht",   wrap_algo_hsg_ht,   METH_VARARGS, "docs"},
+        {"c_algo_solam",    (PyCFunction) wrap_algo_solam,    METH_VARARGS | METH_KEYWORDS, "docs"},
+        {"c_algo_spam",     (PyCFunction) wrap_algo_spam,     METH_VARARGS | METH_KEYWORDS, "docs"},
+        {"c_algo_sht_auc",  (PyCFunction) wrap_algo_sht_auc,  METH_VARARGS | METH_KEYWORDS, "docs"},
+        {"c_algo_graph_am", (PyCFunction) wrap_algo_graph_am, METH_VARARGS | METH_KEYWORDS, "docs"},
+        {"c_algo_opauc",    (PyCFunction) wrap_algo_opauc,    METH_VARARGS | METH_KEYWORDS, "docs"},
+        {"c_algo_fsauc",    (PyCFunction) wrap_algo_fsauc,    METH_VARARGS | METH_KEYWORDS, "docs"},
+        {"c_algo_sto_iht",  (PyCFunction) wrap_algo_sto_iht,  METH_VARARGS | METH_KEYWORDS, "docs"},
+        {"c_algo_hsg_ht",   (PyCFunction) wrap_algo_hsg_ht,   METH_VARARGS | METH_KEYWORDS, "docs"},
+        {"c_algo_solam_grid",   (PyCFunction) wrap_algo_solam_grid,   METH_VARARGS | METH_KEYWORDS, "docs"},
+        {"c_algo_spam_grid",    (PyCFunction) wrap_algo_spam_grid,    METH_VARARGS | METH_KEYWORDS, "docs"},
+        {"c_algo_sht_auc_grid", (PyCFunction) wrap_algo_sht_auc_grid, METH_VARARGS | METH_KEYWORDS, "docs"},
+        {"c_cross_validate", wrap_cross_validate, METH_VARARGS, "docs"},
         {NULL, NULL, 0, NULL}};
 
 
@@ -286,12 +872,20 @@ PyMODINIT_FUNC
 PyInit_sparse_module(void){
      Py_Initialize();
      import_array(); // In order to use numpy, you must include this!
-    return PyModule_Create(&moduledef);
+    if (PyType_Ready(&DatasetType) < 0) { return NULL; }
+    PyObject *module = PyModule_Create(&moduledef);
+    Py_INCREF(&DatasetType);
+    PyModule_AddObject(module, "Dataset", (PyObject *) &DatasetType);
+    return module;
 }
 #else
 initsparse_module(void) {
-    Py_InitModule3("sparse_module", sparse_methods, "some docs for solam algorithm.");
+    PyEval_InitThreads(); // the solvers release the GIL and the progress callback takes it back.
+    if (PyType_Ready(&DatasetType) < 0) { return; }
+    PyObject *module = Py_InitModule3("sparse_module", sparse_methods, "some docs for solam algorithm.");
     import_array(); // In order to use numpy, you must include this!
+    Py_INCREF(&DatasetType);
+    PyModule_AddObject(module, "Dataset", (PyObject *) &DatasetType);
 }
 
 #endif
@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""
+Consistency checks of sparse_module, run them by
+    python -m pytest -q test_engine.py
+or directly by python test_engine.py, sparse_module.so is expected in the
+current directory (see build.sh).
+"""
+import os
+import sys
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+sys.path.append(os.getcwd())
+import sparse_module
+
+
+def _simu_data(n=300, p=200, density=0.08, seed=0):
+    """ a small sparse problem, the first 10 features are shifted for the positives. """
+    rand = np.random.RandomState(seed)
+    x = rand.randn(n, p) * (rand.rand(n, p) < density)
+    y = np.where(rand.rand(n) < 0.3, 1., -1.)
+    x[y > 0, :10] += 0.8
+    return x, y
+
+
+def _to_csr(x):
+    """ the (vals, inds, poss, lens) layout of sparse_module. """
+    vals, inds, poss, lens = [], [], [], []
+    for i in range(x.shape[0]):
+        nz = np.nonzero(x[i])[0]
+        poss.append(len(inds))
+        lens.append(len(nz))
+        inds.extend(nz)
+        vals.extend(x[i, nz])
+    return (np.asarray(vals, dtype=float), np.asarray(inds, dtype=np.int32),
+            np.asarray(poss, dtype=np.int32), np.asarray(lens, dtype=np.int32))
+
+
+def _data_args(x, y, is_sparse):
+    """ the leading data arguments of c_algo_*. """
+    empty = np.empty(1)
+    if is_sparse:
+        return _to_csr(x) + (y, 1, x.shape[1])
+    return x, empty, empty, empty, y, 0, x.shape[1]
+
+
+def _global_paras(num_passes=3, step_len=50, lazy_update=0, proj_resync=0, seed=5, num_threads=1,
+                  track_support=0, eval_size=0, eval_growth=0., eval_csc=0, stop_eps=1e-9, time_budget=0.,
+                  auc_patience=0, auc_tol=0.):
+    """ num_passes, step_len, verbose, record_aucs, stop_eps, lazy_update, proj_resync, track_support,
+    eval_size, eval_growth, eval_csc, time_budget, auc_patience, auc_tol, seed, num_threads """
+    return np.asarray([num_passes, step_len, 0, 1, stop_eps, lazy_update, proj_resync, track_support,
+                       eval_size, eval_growth, eval_csc, time_budget, auc_patience, auc_tol, seed, num_threads],
+                      dtype=float)
+
+
+def _roc_auc(y, scores):
+    """ the fraction of (positive, negative) pairs ranked correctly, a tie counts as half. """
+    posi, nega = scores[y > 0], scores[y <= 0]
+    num_correct = np.sum(posi[:, None] > nega[None, :]) + 0.5 * np.sum(posi[:, None] == nega[None, :])
+    return num_correct / float(len(posi) * len(nega))
+
+
+def _eval_iters(num_iters, step, growth):
+    """ the iterations at which AUC is evaluated if eval_growth is growth, as in _eval_due. """
+    iters, next_eval = [], 1.
+    for t in range(1, num_iters + 1):
+        if t >= next_eval:
+            iters.append(t)
+            next_eval = max(next_eval * growth, next_eval + step)
+    return np.asarray(iters)
+
+
+def _eval_rows(n, k):
+    """ the rows evaluated if eval_size is k, drawn by erand48 from the fixed seed of make_evaluator. """
+    state, rows = 0x1234ABCD330E, list(range(n))
+    for i in range(k):
+        state = (0x5DEECE66D * state + 0xB) % (1 << 48)
+        j = i + int(state / float(1 << 48) * (n - i))
+        rows[i], rows[j] = rows[j], rows[i]
+    return np.sort(rows[:k])
+
+
+def _algo_calls(global_paras):
+    """ each solver of sparse_module with its parameters after global_paras. """
+    return [('c_algo_solam', (global_paras, 5., 10.)),
+            ('c_algo_spam', (global_paras, .5, 1e-3, 1e-2)),
+            ('c_algo_sht_auc', (global_paras, 1, 20, 20, .5, 1e-2)),
+            ('c_algo_opauc', (global_paras, .01, 1e-3, 8)),
+            ('c_algo_fsauc', (global_paras, 1., .5)),
+            ('c_algo_sto_iht', (global_paras, 20, 20, .5, 0.)),
+            ('c_algo_hsg_ht', (global_paras, 20, 4., 1.5, .5, 0.))]
+
+
+def test_spam_lazy():
+    x, y = _simu_data()
+    data = _data_args(x, y, is_sparse=True)
+    for proj_resync in [0, 10]:
+        for paras in [(.5, 1e-3, 1e-2), (.1, 1e-2, 0.)]:
+            wt_eager = sparse_module.c_algo_spam(*data, _global_paras(lazy_update=0, proj_resync=proj_resync),
+                                                 *paras)[0]
+            wt_lazy = sparse_module.c_algo_spam(*data, _global_paras(lazy_update=1, proj_resync=proj_resync),
+                                                *paras)[0]
+            assert np.allclose(wt_lazy, wt_eager, rtol=0., atol=1e-8)
+
+
+def test_solam_lazy():
+    x, y = _simu_data()
+    data = _data_args(x, y, is_sparse=True)
+    for paras in [(5., 10.), (1., 100.)]:
+        wt_eager = sparse_module.c_algo_solam(*data, _global_paras(lazy_update=0), *paras)[0]
+        wt_lazy = sparse_module.c_algo_solam(*data, _global_paras(lazy_update=1), *paras)[0]
+        assert np.allclose(wt_lazy, wt_eager, rtol=0., atol=1e-8)
+
+
+def test_opauc_sketch():
+    x, y = _simu_data()
+    data = _data_args(x, y, is_sparse=True)
+    wt_eager = sparse_module.c_algo_opauc(*data, _global_paras(lazy_update=0), 0.05, 1e-3, 8)[0]
+    wt_sketch = sparse_module.c_algo_opauc(*data, _global_paras(lazy_update=1), 0.05, 1e-3, 8)[0]
+    assert np.all(np.isfinite(wt_sketch))
+    assert np.allclose(wt_sketch, wt_eager, rtol=1e-8, atol=1e-8)
+    # a strong shrinkage folds the scale of the sketch back into its vector.
+    wt_eager = sparse_module.c_algo_opauc(*data, _global_paras(lazy_update=0), 0.05, 0.1, 8)[0]
+    wt_sketch = sparse_module.c_algo_opauc(*data, _global_paras(lazy_update=1), 0.05, 0.1, 8)[0]
+    assert np.allclose(wt_sketch, wt_eager, rtol=1e-8, atol=1e-8)
+
+
+def test_dataset_reuse():
+    x, y = _simu_data()
+    for is_sparse in [False, True]:
+        data = _data_args(x, y, is_sparse)
+        dataset = sparse_module.Dataset(*data, build_csc=1)
+        for name, args in _algo_calls(_global_paras()):
+            func = getattr(sparse_module, name)
+            re_arrays = func(*(data + args))
+            for _ in range(2):  # the same Dataset serves several runs.
+                re_dataset = func(dataset, *args)
+                assert np.array_equal(re_dataset[0], re_arrays[0]), name
+                assert np.array_equal(re_dataset[1], re_arrays[1]), name
+
+
+def test_cross_validate():
+    x, y = _simu_data()
+    n, p = x.shape
+    folds = ((np.arange(n) * 5) // n).astype(np.int32)
+    global_paras = _global_paras()
+    for is_sparse in [False, True]:
+        dataset = sparse_module.Dataset(*_data_args(x, y, is_sparse))
+        for name, grid in [('solam', [[5., 10.], [1., 100.]]),
+                           ('spam', [[.5, 1e-3, 1e-2]]),
+                           ('sht_auc', [[1, 20, 20, .5, 1e-2]])]:
+            func = getattr(sparse_module, 'c_algo_' + name)
+            aucs = sparse_module.c_cross_validate(dataset, name, global_paras, np.asarray(grid), folds)[0]
+            for gi, paras in enumerate(grid):
+                paras = [int(v) for v in paras[:3]] + paras[3:] if name == 'sht_auc' else paras
+                for fi in range(5):
+                    rows = np.nonzero(folds != fi)[0].astype(np.int32)
+                    wt = func(dataset, global_paras, *paras, rows=rows)[0]
+                    auc = _roc_auc(y[folds == fi], np.dot(x[folds == fi], wt[:p]))
+                    assert np.isclose(aucs[gi, fi], auc), name
+            aucs_threads = sparse_module.c_cross_validate(dataset, name, global_paras, np.asarray(grid), folds, 3)[0]
+            assert np.array_equal(aucs_threads, aucs), name
+
+
+def test_grid_models():
+    x, y = _simu_data()
+    global_paras = _global_paras()
+    for is_sparse in [False, True]:
+        data = _data_args(x, y, is_sparse)
+        xi, r = np.asarray([1., 5., 20.]), np.asarray([1., 10., 3.])
+        models = sparse_module.c_algo_solam_grid(*(data + (global_paras, xi, r)))
+        for k in range(len(xi)):
+            re = sparse_module.c_algo_solam(*(data + (global_paras, xi[k], r[k])))
+            assert np.allclose(models[k][0], re[0], rtol=1e-8, atol=1e-9)
+        xi, l1, l2 = np.asarray([.5, .1, 1.]), np.asarray([0., 1e-3, 1e-2]), np.asarray([1e-2, 1e-2, 0.])
+        models = sparse_module.c_algo_spam_grid(*(data + (global_paras, xi, l1, l2)))
+        for k in range(len(xi)):
+            re = sparse_module.c_algo_spam(*(data + (global_paras, xi[k], l1[k], l2[k])))
+            assert np.allclose(models[k][0], re[0], rtol=1e-8, atol=1e-9)
+        para_s, c = np.asarray([20, 50, 5], dtype=np.int32), np.asarray([.5, .1, 1.])
+        l2 = np.asarray([1e-2, 0., 1e-3])
+        for version in [0, 1, 2]:
+            models = sparse_module.c_algo_sht_auc_grid(*(data + (global_paras, version, para_s, 20, c, l2)))
+            for k in range(len(c)):
+                re = sparse_module.c_algo_sht_auc(*(data + (global_paras, version, int(para_s[k]), 20, c[k], l2[k])))
+                assert np.allclose(models[k][0], re[0], rtol=1e-8, atol=1e-9)
+
+
+def test_rows_subset():
+    x, y = _simu_data()
+    rows = np.random.RandomState(1).permutation(len(y))[:200].astype(np.int32)
+    x_sub, y_sub = np.ascontiguousarray(x[rows]), y[rows]
+    for is_sparse in [False, True]:
+        for name, args in _algo_calls(_global_paras()):
+            func = getattr(sparse_module, name)
+            re_rows = func(*(_data_args(x, y, is_sparse) + args), rows=rows)
+            re_sub = func(*(_data_args(x_sub, y_sub, is_sparse) + args))
+            assert np.allclose(re_rows[0], re_sub[0], rtol=1e-10, atol=1e-10), name
+            assert np.allclose(re_rows[1], re_sub[1]), name
+
+
+def test_sht_auc_threads():
+    x, y = _simu_data()
+    for is_sparse in [False, True]:
+        data = _data_args(x, y, is_sparse)
+        for version in [0, 1, 2]:
+            re_one = sparse_module.c_algo_sht_auc(*data, _global_paras(), version, 20, 40, .5, 1e-3)
+            for num_threads in [2, 3, 8]:
+                re_multi = sparse_module.c_algo_sht_auc(*data, _global_paras(num_threads=num_threads),
+                                                        version, 20, 40, .5, 1e-3)
+                assert np.array_equal(re_multi[0], re_one[0])
+                assert np.array_equal(re_multi[1], re_one[1])
+
+
+def _memmap(arr, path):
+    """ a read-only memory map of a copy of arr in path. """
+    out = np.memmap(path, dtype=arr.dtype, mode='w+', shape=arr.shape)
+    out[...] = arr
+    out.flush()
+    return np.memmap(path, dtype=arr.dtype, mode='r', shape=arr.shape)
+
+
+def _strided(arr):
+    """ a non-contiguous view equal to arr, every other element of its last axis. """
+    return np.repeat(arr, 2, axis=-1)[..., ::2]
+
+
+def test_input_layouts():
+    x, y = _simu_data()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for is_sparse in [False, True]:
+            data = _data_args(x, y, is_sparse)
+            read = range(5) if is_sparse else [0, 4]  # the dense layout does not read the index arrays.
+            layouts = [data[:5] + (None,) * 5,  # None held-out arrays are no held-out set.
+                       tuple(_strided(arr) if k in read else arr for k, arr in enumerate(data[:5])),
+                       tuple(_memmap(arr, os.path.join(tmp_dir, '%d_%d' % (is_sparse, k))) if k in read else arr
+                             for k, arr in enumerate(data[:5]))]
+            if is_sparse:
+                layouts.append(data[:1] + tuple(arr.astype(np.int64) for arr in data[1:4]) + data[4:5])
+            else:
+                layouts.append((np.asfortranarray(x),) + data[1:5])
+            for name, args in _algo_calls(_global_paras()):
+                func = getattr(sparse_module, name)
+                re = func(*(data + args))
+                for layout in layouts:
+                    re_layout = func(*(layout[:5] + data[5:] + args + layout[5:]))
+                    assert np.array_equal(re_layout[0], re[0]), name
+                    assert np.array_equal(re_layout[1], re[1]), name
+        vals, inds, poss, lens = _to_csr(x)
+        inds = inds.astype(np.int64)
+        inds[3] = 1 << 40
+        try:
+            sparse_module.c_algo_spam(vals, inds, poss, lens, y, 1, x.shape[1], _global_paras(), .5, 1e-3, 1e-2)
+            assert False, 'x_tr_inds out of the range of int32 is accepted'
+        except OverflowError:
+            pass
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_track_support():
+    x, y = _simu_data()
+    for is_sparse in [False, True]:
+        data = _data_args(x, y, is_sparse)
+        for name, args in [('c_algo_sht_auc', (0, 20, 20, .5, 1e-2)), ('c_algo_sht_auc', (1, 20, 20, .5, 1e-2)),
+                           ('c_algo_sht_auc', (2, 5, 40, .5, 0.)), ('c_algo_sto_iht', (20, 20, .5, 0.)),
+                           ('c_algo_sto_iht', (5, 40, .5, 1e-2))]:
+            func = getattr(sparse_module, name)
+            re = func(*data, _global_paras(track_support=0), *args)
+            re_track = func(*data, _global_paras(track_support=1), *args)
+            if is_sparse:
+                assert np.array_equal(re_track[0], re[0]), name
+            else:  # the dense products over the support are summed in another order.
+                assert np.allclose(re_track[0], re[0], rtol=1e-12, atol=1e-14), name
+            assert np.array_equal(np.nonzero(re_track[0])[0], np.nonzero(re[0])[0]), name
+            assert np.array_equal(re_track[1], re[1]), name
+
+
+def test_eval_growth():
+    x, y = _simu_data()
+    n = len(y)
+    for is_sparse in [False, True]:
+        data = _data_args(x, y, is_sparse)
+        # SPAM evaluates per sample, the geometric schedule keeps step_len apart at first.
+        iters = _eval_iters(3 * n, 50, 1.5)
+        aucs = sparse_module.c_algo_spam(*data, _global_paras(eval_growth=1.5), .5, 1e-3, 1e-2)[1]
+        assert len(aucs) == len(iters)
+        for k, t in enumerate(iters[1:]):  # t - 1 is the step_len whose second evaluation is at t.
+            aucs_fixed = sparse_module.c_algo_spam(*data, _global_paras(step_len=t - 1), .5, 1e-3, 1e-2)[1]
+            assert aucs[k + 1] == aucs_fixed[1]
+        # a growth close to one falls back to step_len, it must fit the results.
+        aucs = sparse_module.c_algo_solam(*data, _global_paras(eval_growth=1.01), 5., 10.)[1]
+        assert len(aucs) == len(_eval_iters(3 * n, 50, 1.01))
+        # SHT-AUC evaluates per block, by default after every block.
+        iters = _eval_iters(3 * (n // 20), 1, 1.5)
+        aucs = sparse_module.c_algo_sht_auc(*data, _global_paras(eval_growth=1.5), 1, 20, 20, .5, 1e-2)[1]
+        aucs_fixed = sparse_module.c_algo_sht_auc(*data, _global_paras(), 1, 20, 20, .5, 1e-2)[1]
+        assert np.array_equal(aucs, aucs_fixed[iters - 1])
+
+
+def test_eval_held_out():
+    x, y = _simu_data()
+    p = x.shape[1]
+    rand = np.random.RandomState(2)
+    x_te, y_te = rand.randn(150, p), np.where(rand.rand(150) < 0.4, 1., -1.)
+    rows = _eval_rows(len(y_te), 60)
+    for is_sparse in [False, True]:
+        data = _data_args(x, y, is_sparse)
+        args = (_global_paras(), 1, 20, 20, .5, 1e-2)
+        wt = sparse_module.c_algo_sht_auc(*(data + args))[0]
+        # the recorded AUC drops the pairs of the lowest scored row if it is a negative one, so it is a positive.
+        x_te[[-1, rows[0]]], y_te[[-1, rows[0]]] = -10. * wt, 1.
+        te = _data_args(x_te, y_te, is_sparse)[:5]
+        re = sparse_module.c_algo_sht_auc(*(data + args + te))
+        assert np.array_equal(re[0], wt)  # the held-out set is only read.
+        assert np.isclose(re[1][-1], _roc_auc(y_te, np.dot(x_te, wt)))
+        # eval_size scores the same rows as a held-out set of just these rows.
+        re_size = sparse_module.c_algo_sht_auc(*(data + (_global_paras(eval_size=60),) + args[1:] + te))
+        assert np.isclose(re_size[1][-1], _roc_auc(y_te[rows], np.dot(x_te[rows], wt)))
+        te_rows = _data_args(np.ascontiguousarray(x_te[rows]), y_te[rows], is_sparse)[:5]
+        re_rows = sparse_module.c_algo_sht_auc(*(data + args + te_rows))
+        assert np.array_equal(re_size[1], re_rows[1])
+
+
+def test_eval_csc():
+    x, y = _simu_data()
+    x_te, y_te = _simu_data(n=150, seed=3)
+    data = _data_args(x, y, is_sparse=True)
+    te = _data_args(x_te, y_te, is_sparse=True)[:5]
+    for held_out in [(), te]:
+        dataset = sparse_module.Dataset(*(data + held_out), build_csc=1)
+        for name, args in [('c_algo_spam', (.5, 1e-3, 1e-2)), ('c_algo_sht_auc', (1, 20, 20, .5, 1e-2))]:
+            func = getattr(sparse_module, name)
+            aucs = func(*(data + (_global_paras(eval_csc=0),) + args + held_out))[1]
+            aucs_csc = func(*(data + (_global_paras(eval_csc=1),) + args + held_out))[1]
+            assert np.array_equal(aucs_csc, aucs), name
+            aucs_dataset = func(dataset, _global_paras(eval_csc=1), *args)[1]  # the CSC index of the Dataset.
+            assert np.array_equal(aucs_dataset, aucs), name
+
+
+def test_stop_criteria():
+    x, y = _simu_data()
+    for is_sparse in [False, True]:
+        data = _data_args(x, y, is_sparse)
+        # the epochs at which the engine stopped before StopCriteria, for stop_eps 1e-2, 3e-3, 1e-3 and 3e-4.
+        for name, args, epochs in [('c_algo_spam', (.5, 1e-3, 1e-2), [4, 7, 10, 12]),
+                                   ('c_algo_solam', (5., 10.), [2, 4, 14, 22])]:
+            func = getattr(sparse_module, name)
+            for stop_eps, num_epochs in zip([1e-2, 3e-3, 1e-3, 3e-4], epochs):
+                assert func(*data, _global_paras(num_passes=30, stop_eps=stop_eps), *args)[3] == [num_epochs], name
+        plateau = _global_paras(num_passes=30, auc_patience=2, auc_tol=1e-2)
+        budget = _global_paras(num_passes=30, time_budget=1e-9)
+        for name, args in _algo_calls(plateau):
+            if name in ['c_algo_fsauc', 'c_algo_hsg_ht']:  # a stop only ends a stage of FSAUC, HSG-HT counts no epochs.
+                continue
+            func = getattr(sparse_module, name)
+            assert func(*(data + args))[3][0] < 30, name
+            assert func(*data, budget, *args[1:])[3] == [1], name
+
+
+def _logged_run(level, cadence, func, *args, **kwargs):
+    """ the results of func and the events of its run, in the batches handed to the progress callback. """
+    batches = []
+    sparse_module.c_set_logger(level, batches.append, cadence)
+    try:
+        re = func(*args, **kwargs)
+    finally:
+        sparse_module.c_set_logger(2)
+    return re, batches
+
+
+def test_logger_events():
+    x, y = _simu_data()
+    data = _data_args(x, y, is_sparse=True)
+    spam = (.5, 1e-3, 1e-2)
+    global_paras = _global_paras(num_passes=30, stop_eps=1e-2)
+    re, batches = _logged_run(2, 7, sparse_module.c_algo_spam, *data, global_paras, *spam)
+    assert [len(batch) for batch in batches] == [7, 7, 7, 7, 1]  # every cadence events, the rest at the end.
+    events = [e for batch in batches for e in batch]
+    assert [e[1] for e in events if e[0] == 2] == list(range(0, 4 * 300, 50))  # iterations before each AUC.
+    assert np.array_equal([e[2] for e in events if e[0] == 2], re[1])
+    assert [e[1] for e in events if e[0] == 1] == [1, 2, 3, 4]  # relative changes at the epoch ends.
+    assert events[-1] == (3, 4, 0.) and re[3] == [4]  # STOP_EPS at the 4th epoch.
+    # the level only filters the messages, a verbose run gives the same events.
+    global_paras[2] = 1
+    for level in [0, 3]:
+        batches_verbose = _logged_run(level, 0, sparse_module.c_algo_spam, *data, global_paras, *spam)[1]
+        assert batches_verbose == [events]
+    # the workers of SHT-AUC record nothing, the run gives the events of one thread.
+    sht = (1, 20, 20, .5, 1e-2)
+    plateau = _global_paras(num_passes=30, auc_patience=2, auc_tol=1e-2)
+    re, batches = _logged_run(2, 0, sparse_module.c_algo_sht_auc, *data, plateau, *sht)
+    events = [e for batch in batches for e in batch]
+    assert [sum(e[0] == kind for e in events) for kind in range(4)] == [0, 3, 45, 1]
+    assert np.array_equal([e[2] for e in events if e[0] == 2], re[1])
+    assert events[-1] == (3, 3, 1.) and re[3] == [3]  # STOP_AUC_PLATEAU at the 3rd epoch.
+    plateau[15] = 3
+    assert _logged_run(2, 0, sparse_module.c_algo_sht_auc, *data, plateau, *sht)[1] == batches
+    # the rings of the cross-validation workers are flushed before they exit.
+    folds = ((np.arange(len(y)) * 3) // len(y)).astype(np.int32)
+    dataset = sparse_module.Dataset(*data)
+    grid = np.asarray([sht, sht])
+    batches = _logged_run(2, 0, sparse_module.c_cross_validate, dataset, 'sht_auc', plateau, grid, folds)[1]
+    batches_threads = _logged_run(2, 5, sparse_module.c_cross_validate, dataset, 'sht_auc', plateau, grid, folds, 3)[1]
+    assert len(batches) == 2 * 3  # a flush at the end of every run.
+    assert sorted(e for batch in batches_threads for e in batch) == sorted(e for batch in batches for e in batch)
+
+
+def test_concurrent_runs():
+    x, y = _simu_data()
+    calls = [(getattr(sparse_module, name), args) for name, args in _algo_calls(_global_paras(seed=7))
+             if name in ['c_algo_sht_auc', 'c_algo_sto_iht', 'c_algo_spam']]
+    for is_sparse in [False, True]:
+        data = _data_args(x, y, is_sparse)
+        serial = [_logged_run(2, 0, func, *(data + args)) for func, args in calls]
+        batches = []
+        sparse_module.c_set_logger(2, batches.append, 16)  # the callback runs in the threads of the runs.
+        try:
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                futures = [pool.submit(func, *(data + args)) for _ in range(3) for func, args in calls]
+                results = [future.result() for future in futures]
+        finally:
+            sparse_module.c_set_logger(2)
+        for k, re in enumerate(results):
+            assert np.array_equal(re[0], serial[k % len(calls)][0][0])
+            assert np.array_equal(re[1], serial[k % len(calls)][0][1])
+        events = [e for _, batches_serial in serial for batch in batches_serial for e in batch] * 3
+        assert sorted(e for batch in batches for e in batch) == sorted(events)
+
+
+if __name__ == '__main__':
+    for name, func in sorted(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print('%s passed' % name)